@@ -0,0 +1,85 @@
+#!/usr/bin/env python3
+"""
+Compares updating feeds with one PHP process per feed against updating them
+in long lived PHP workers. Uses fake_php.py as stand-in for PHP and
+Nextcloud, see its docstring for how to configure the simulated costs.
+
+    python3 benchmarks/bench_batch.py --feeds 200 --threads 4
+"""
+import argparse
+import json
+import os
+import resource
+import sys
+import tempfile
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(
+    __file__))))
+
+from nextcloud_news_updater.api.api import Feed  # noqa: E402
+from nextcloud_news_updater.api.cli import (  # noqa: E402
+    Cli, CliApiV15, CliUpdateThreadV15)
+from nextcloud_news_updater.api.batch import create_worker_pool  # noqa: E402
+from nextcloud_news_updater.api.feedqueue import FeedQueue  # noqa: E402
+from nextcloud_news_updater.common.logger import Logger  # noqa: E402
+from nextcloud_news_updater.config import Config  # noqa: E402
+
+FAKE_PHP = os.path.join(os.path.dirname(os.path.abspath(__file__)),
+                        'fake_php.py')
+
+
+def children_cpu() -> float:
+    usage = resource.getrusage(resource.RUSAGE_CHILDREN)
+    return usage.ru_utime + usage.ru_stime
+
+
+def bench(config: Config, feeds: int) -> dict:
+    api = CliApiV15(config)
+    logger = Logger(config)
+    workers = create_worker_pool(config, api.batch_worker_command)
+    queue = FeedQueue()
+    queue.extend(Feed(feed_id, 'user') for feed_id in range(feeds))
+    queue.close()
+    cpu = children_cpu()
+    start = time.perf_counter()
+    threads = [CliUpdateThreadV15(queue, logger, api, Cli(config), workers)
+               for _ in range(config.threads)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    if workers is not None:
+        workers.close()
+    duration = time.perf_counter() - start
+    return {
+        'batchsize': config.batchsize,
+        'feeds': feeds,
+        'threads': config.threads,
+        'seconds': round(duration, 3),
+        'feeds_per_second': round(feeds / duration, 1),
+        'child_cpu_seconds': round(children_cpu() - cpu, 3),
+    }
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--feeds', type=int, default=200)
+    parser.add_argument('--threads', type=int, default=4)
+    parser.add_argument('--batchsize', type=int, default=500)
+    args = parser.parse_args()
+
+    results = []
+    with tempfile.TemporaryDirectory() as directory:
+        for batchsize in (0, args.batchsize):
+            config = Config()
+            config.url = directory
+            config.php = FAKE_PHP
+            config.threads = args.threads
+            config.batchsize = batchsize
+            results.append(bench(config, args.feeds))
+    print(json.dumps(results, indent=2))
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,82 @@
+#!/usr/bin/env python3
+"""
+Measures the memory needed per queued feed when keeping a list of Feed
+objects like the updater used to and when storing the feeds in a FeedTable.
+
+    python3 benchmarks/bench_feedtable.py --feeds 1000000
+"""
+import argparse
+import json
+import os
+import sys
+import tracemalloc
+from typing import Any, Callable, Iterator
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(
+    __file__))))
+
+from nextcloud_news_updater.api.api import Feed  # noqa: E402
+from nextcloud_news_updater.api.feedqueue import (  # noqa: E402
+    FeedQueue, FairFeedQueue)
+from nextcloud_news_updater.api.feedtable import FeedTable  # noqa: E402
+
+
+class DictFeed:
+    """
+    Feed object with an instance dict as it was used before
+    """
+
+    def __init__(self, feed_id: int, user_id: str,
+                 last_modified: Any = None) -> None:
+        self.feed_id = feed_id
+        self.user_id = user_id
+        self.last_modified = last_modified
+
+
+def parsed_feeds(feeds: int, users: int, cls: Any = Feed) -> Iterator[Any]:
+    for feed_id in range(feeds):
+        # user ids are new strings for every feed when they come from the
+        # JSON parser
+        yield cls(feed_id, ''.join(['user', str(feed_id % users)]),
+                  1600000000 + feed_id)
+
+
+def measure(name: str, build: Callable[[], Any], feeds: int) -> dict:
+    tracemalloc.start()
+    result = build()
+    size = tracemalloc.get_traced_memory()[0]
+    tracemalloc.stop()
+    del result
+    return {
+        'storage': name,
+        'feeds': feeds,
+        'total_mb': round(size / 1024 / 1024, 1),
+        'bytes_per_feed': round(size / feeds, 1),
+    }
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--feeds', type=int, default=1000000)
+    parser.add_argument('--users', type=int, default=1000)
+    args = parser.parse_args()
+    feeds, users = args.feeds, args.users
+
+    def fill(queue: FeedQueue) -> FeedQueue:
+        queue.extend(parsed_feeds(feeds, users))
+        return queue
+
+    results = [
+        measure('list of Feed objects with __dict__',
+                lambda: list(parsed_feeds(feeds, users, DictFeed)), feeds),
+        measure('list of slotted Feed objects',
+                lambda: list(parsed_feeds(feeds, users)), feeds),
+        measure('FeedTable', lambda: fill(FeedTable()), feeds),
+        measure('FeedQueue', lambda: fill(FeedQueue()), feeds),
+        measure('FairFeedQueue', lambda: fill(FairFeedQueue()), feeds),
+    ]
+    print(json.dumps(results, indent=2))
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,97 @@
+#!/usr/bin/env python3
+"""
+Compares parsing the feed list in one piece against parsing it while it is
+being received. Each variant runs in its own process so that the peak memory
+usage (max RSS) of the processes can be compared.
+
+    python3 benchmarks/bench_parse.py --feeds 1000000
+"""
+import argparse
+import json
+import os
+import resource
+import subprocess
+import sys
+import tempfile
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(
+    __file__))))
+
+from nextcloud_news_updater.api.cli import CliApiV15  # noqa: E402
+from nextcloud_news_updater.api.web import WebApi  # noqa: E402
+from nextcloud_news_updater.common.jsonstream import (  # noqa: E402
+    iter_chunks)
+from nextcloud_news_updater.config import Config  # noqa: E402
+
+
+def write_feeds(path: str, feeds: int, apilevel: str) -> None:
+    with open(path, 'w') as outfile:
+        outfile.write('[' if apilevel == 'v15' else '{"feeds": [')
+        for feed_id in range(feeds):
+            if feed_id > 0:
+                outfile.write(',')
+            info = {'id': feed_id, 'userId': 'user%d' % (feed_id % 1000),
+                    'lastModified': 1600000000 + feed_id}
+            outfile.write(json.dumps(info))
+        outfile.write(']' if apilevel == 'v15' else ']}')
+
+
+def parse(path: str, method: str, apilevel: str) -> dict:
+    config = Config()
+    config.url = '/'
+    api = CliApiV15(config) if apilevel == 'v15' else WebApi(config)
+    baseline = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    start = time.perf_counter()
+    with open(path, 'rb') as infile:
+        if method == 'buffered':
+            # what the updater did before: read the complete output, decode
+            # it to str and parse it with json.loads
+            feeds_json = json.loads(str(infile.read().strip(), 'utf-8'))
+            if api.feeds_key is not None:
+                feeds_json = feeds_json[api.feeds_key]
+            feeds = [api._create_feed(info, 'user') for info in feeds_json]
+        else:
+            feeds = list(api.iter_feeds(iter_chunks(infile.read), 'user'))
+    duration = time.perf_counter() - start
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    return {
+        'method': method,
+        'feeds': len(feeds),
+        'seconds': round(duration, 3),
+        'max_rss_mb': round(peak / 1024, 1),
+        'max_rss_growth_mb': round((peak - baseline) / 1024, 1),
+    }
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--feeds', type=int, default=200000)
+    parser.add_argument('--apilevel', choices=['v1-2', 'v15'],
+                        default='v1-2')
+    parser.add_argument('--file', help=argparse.SUPPRESS)
+    parser.add_argument('--method', choices=['buffered', 'streaming'],
+                        help=argparse.SUPPRESS)
+    args = parser.parse_args()
+
+    if args.method:
+        print(json.dumps(parse(args.file, args.method, args.apilevel)))
+        return
+
+    results = []
+    with tempfile.TemporaryDirectory() as directory:
+        path = os.path.join(directory, 'feeds.json')
+        write_feeds(path, args.feeds, args.apilevel)
+        size = os.path.getsize(path)
+        for method in ('buffered', 'streaming'):
+            output = subprocess.check_output([
+                sys.executable, __file__, '--file', path, '--method', method,
+                '--apilevel', args.apilevel])
+            result = json.loads(output.decode('utf-8'))
+            result['document_mb'] = round(size / 1024 / 1024, 1)
+            results.append(result)
+    print(json.dumps(results, indent=2))
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,105 @@
+#!/usr/bin/env python3
+"""
+Measures how long the updater takes to start, which matters when it is run
+from cron in singlerun mode: the import time of the updater as reported by
+python -X importtime, and the time from starting the process until the
+first request reaches fake_nextcloud.py. Both are the median of several
+fresh processes.
+
+    python3 benchmarks/bench_startup.py --runs 10
+"""
+import argparse
+import json
+import os
+import statistics
+import subprocess
+import sys
+import time
+from typing import List
+
+BENCHMARKS = os.path.dirname(os.path.abspath(__file__))
+ROOT = os.path.dirname(BENCHMARKS)
+sys.path.insert(0, ROOT)
+
+from fake_nextcloud import FakeNextcloud  # noqa: E402
+
+MODULE = 'nextcloud_news_updater.__main__'
+
+
+def import_time() -> dict:
+    """
+    Returns the cumulative import time of the updater and of every module it
+    imports in milliseconds
+    """
+    result = subprocess.run(
+        [sys.executable, '-X', 'importtime', '-c', 'import %s' % MODULE],
+        cwd=ROOT, stderr=subprocess.PIPE, universal_newlines=True, check=True)
+    imports = {}
+    for line in result.stderr.splitlines():
+        if not line.startswith('import time:') or '|' not in line:
+            continue
+        _, cumulative, name = line.split('|')
+        if cumulative.strip().isdigit():
+            imports[name.strip()] = int(cumulative) / 1000
+    return imports
+
+
+def first_request(server: FakeNextcloud) -> float:
+    """
+    Returns the seconds from starting the updater until the fake Nextcloud
+    received its first request
+    """
+    command = [sys.executable, '-m', 'nextcloud_news_updater',
+               '--mode', 'singlerun', '--threads', '1', '--user', 'admin',
+               '--password', 'admin', '--apilevel', 'v2', server.url]
+    with server._lock:
+        for name in server.counts:
+            server.counts[name] = 0
+    start = time.perf_counter()
+    process = subprocess.Popen(command, cwd=ROOT, stdout=subprocess.DEVNULL,
+                               stderr=subprocess.DEVNULL)
+    try:
+        while sum(server.counts.values()) == 0:
+            if process.poll() is not None:
+                raise RuntimeError('The updater exited before sending a '
+                                   'request')
+            time.sleep(0.0005)
+        return time.perf_counter() - start
+    finally:
+        process.wait()
+
+
+def median(values: List[float]) -> float:
+    return round(statistics.median(values), 1)
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--runs', type=int, default=10)
+    parser.add_argument('--feeds', type=int, default=10)
+    parser.add_argument('--top', type=int, default=10,
+                        help='Number of slowest imports to list')
+    args = parser.parse_args()
+
+    imports = [import_time() for _ in range(args.runs)]
+    totals = [run[MODULE] for run in imports]
+    slowest = sorted(imports[-1].items(), key=lambda item: -item[1])
+
+    server = FakeNextcloud(0, args.feeds, latency='0')
+    server.start()
+    try:
+        requests = [first_request(server) * 1000 for _ in range(args.runs)]
+    finally:
+        server.stop()
+
+    print(json.dumps({
+        'runs': args.runs,
+        'import_ms': median(totals),
+        'first_request_ms': median(requests),
+        'slowest_imports_ms': [[name, value] for name, value
+                               in slowest[1:args.top + 1]],
+    }, indent=2))
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,137 @@
+#!/usr/bin/env python3
+"""
+Stand-in for a Nextcloud server which implements the updater REST API of
+the News app (v1-2 and v2) without a Nextcloud installation. Feed updates
+take a configurable time and fail with a configurable probability.
+
+    python3 benchmarks/fake_nextcloud.py --port 8080 --feeds 10000 \\
+        --latency lognormal:50:0.8 --error-rate 0.01
+
+See latency.py for the available latency distributions.
+"""
+import argparse
+import json
+import random
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, HTTPServer
+from socketserver import ThreadingMixIn
+from typing import Any, Dict
+
+from latency import parse_latency
+
+
+class FakeNextcloud(ThreadingMixIn, HTTPServer):
+    daemon_threads = True
+    request_queue_size = 1024
+
+    def __init__(self, port: int = 0, feeds: int = 1000, users: int = 10,
+                 latency: str = '20', error_rate: float = 0.0,
+                 seed: int = 0) -> None:
+        self.rng = random.Random(seed)
+        self.latency = parse_latency(latency, self.rng)
+        self.error_rate = error_rate
+        self.feeds = feeds
+        self.users = users
+        self.counts = {'before': 0, 'feeds': 0, 'updates': 0, 'errors': 0,
+                       'after': 0}  # type: Dict[str, int]
+        self._lock = threading.Lock()
+        self._feeds_json = {}  # type: Dict[str, bytes]
+        super().__init__(('127.0.0.1', port), FakeNextcloudHandler)
+
+    @property
+    def url(self) -> str:
+        return 'http://127.0.0.1:%d' % self.server_address[1]
+
+    def start(self) -> None:
+        thread = threading.Thread(target=self.serve_forever, daemon=True)
+        thread.start()
+
+    def stop(self) -> None:
+        self.shutdown()
+        self.server_close()
+
+    def count(self, name: str) -> None:
+        with self._lock:
+            self.counts[name] += 1
+
+    def update(self) -> bool:
+        """
+        Simulates a feed update and returns whether it was successful
+        """
+        with self._lock:
+            latency = self.latency()
+            failed = self.rng.random() < self.error_rate
+        time.sleep(latency)
+        self.count('errors' if failed else 'updates')
+        return not failed
+
+    def feeds_json(self, key: str, id_key: str) -> bytes:
+        with self._lock:
+            if key not in self._feeds_json:
+                feeds = [{id_key: feed_id, 'userId': 'user%d' %
+                          (feed_id % self.users)}
+                         for feed_id in range(self.feeds)]
+                self._feeds_json[key] = json.dumps({key: feeds}).encode()
+            return self._feeds_json[key]
+
+
+class FakeNextcloudHandler(BaseHTTPRequestHandler):
+    protocol_version = 'HTTP/1.1'
+    server = None  # type: Any
+
+    def do_GET(self) -> None:
+        path = self.path.split('?')[0]
+        if path.endswith('/before-update'):
+            self.server.count('before')
+            self.respond(200, b'')
+        elif path.endswith('/after-update'):
+            self.server.count('after')
+            self.respond(200, b'')
+        elif path.endswith('/feeds/all'):
+            self.server.count('feeds')
+            self.respond(200, self.server.feeds_json('feeds', 'id'))
+        elif path.endswith('/updater/all-feeds'):
+            self.server.count('feeds')
+            self.respond(200, self.server.feeds_json('updater', 'feedId'))
+        elif path.endswith('/feeds/update') or \
+                path.endswith('/updater/update-feed'):
+            if self.server.update():
+                self.respond(200, b'')
+            else:
+                self.respond(500, b'{"message": "Simulated error"}')
+        else:
+            self.respond(404, b'')
+
+    def respond(self, status: int, body: bytes) -> None:
+        self.send_response(status)
+        self.send_header('Content-Type', 'application/json')
+        self.send_header('Content-Length', str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def log_message(self, *args: Any) -> None:
+        pass
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--port', type=int, default=8080)
+    parser.add_argument('--feeds', type=int, default=1000)
+    parser.add_argument('--users', type=int, default=10)
+    parser.add_argument('--latency', default='20',
+                        help='Feed update latency in ms, see latency.py')
+    parser.add_argument('--error-rate', type=float, default=0.0)
+    parser.add_argument('--seed', type=int, default=0)
+    args = parser.parse_args()
+    server = FakeNextcloud(args.port, args.feeds, args.users, args.latency,
+                           args.error_rate, args.seed)
+    print('Serving the News updater API on %s' % server.url)
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        pass
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,94 @@
+#!/usr/bin/env python3
+"""
+Stand-in for the PHP binary which emulates the occ commands and the batch
+worker used by the console based updater without a Nextcloud installation.
+
+    fake_php.py -f /path/to/nextcloud/occ [-c php.ini] COMMAND [ARGS]
+    fake_php.py [-c php.ini] batch_worker.php /path/to/nextcloud
+
+The simulated installation and its costs can be configured with the
+following environment variables:
+
+* FAKE_PHP_BOOT_MS: CPU time burnt once per process, defaults to 300
+* FAKE_PHP_UPDATE_MS: time spent waiting per feed update, either a number
+  or a distribution as described in latency.py, defaults to 20
+* FAKE_PHP_ERROR_RATE: probability that a feed update fails, defaults to 0
+* FAKE_PHP_FEEDS: number of feeds listed by the feed list commands,
+  defaults to 100
+* FAKE_PHP_USERS: number of users the feeds belong to, defaults to 10
+"""
+import json
+import os
+import random
+import sys
+import time
+
+from latency import parse_latency
+
+BOOT_MS = int(os.environ.get('FAKE_PHP_BOOT_MS', '300'))
+UPDATE_LATENCY = parse_latency(os.environ.get('FAKE_PHP_UPDATE_MS', '20'))
+ERROR_RATE = float(os.environ.get('FAKE_PHP_ERROR_RATE', '0'))
+FEEDS = int(os.environ.get('FAKE_PHP_FEEDS', '100'))
+USERS = int(os.environ.get('FAKE_PHP_USERS', '10'))
+
+
+def burn_cpu(milliseconds: int) -> None:
+    end = time.process_time() + milliseconds / 1000
+    while time.process_time() < end:
+        pass
+
+
+def run_command(arguments: list) -> int:
+    command = arguments[0] if arguments else ''
+    if command == 'news:updater:update-feed':
+        time.sleep(UPDATE_LATENCY())
+        if random.random() < ERROR_RATE:
+            print('Simulated error')
+            return 1
+        return 0
+    if command == 'user:list':
+        print(json.dumps({'user%d' % user: 'User %d' % user
+                          for user in range(USERS)}))
+        return 0
+    if command == 'news:feed:list' and len(arguments) > 1:
+        user = int(arguments[1][len('user'):])
+        print(json.dumps([{'id': feed_id, 'lastModified': 1600000000}
+                          for feed_id in range(user, FEEDS, USERS)]))
+        return 0
+    if command == 'news:updater:all-feeds':
+        print(json.dumps({'feeds': [
+            {'id': feed_id, 'userId': 'user%d' % (feed_id % USERS)}
+            for feed_id in range(FEEDS)]}))
+        return 0
+    if command in ('news:updater:before-update',
+                   'news:updater:after-update'):
+        return 0
+    print('Command "%s" is not defined.' % command)
+    return 1
+
+
+def run_worker() -> None:
+    print(json.dumps({'ready': True, 'memory': 0}), flush=True)
+    for line in sys.stdin:
+        arguments = json.loads(line)['arguments']
+        status = run_command(arguments)
+        print(json.dumps({'status': status, 'output': '', 'memory': 0}),
+              flush=True)
+
+
+def main() -> None:
+    arguments = sys.argv[1:]
+    occ = False
+    while arguments and arguments[0] in ('-f', '-c'):
+        occ = occ or arguments[0] == '-f'
+        arguments = arguments[2:]
+    if not occ and arguments and arguments[0].endswith('.php'):
+        burn_cpu(BOOT_MS)
+        run_worker()
+        return
+    burn_cpu(BOOT_MS)
+    sys.exit(run_command(arguments))
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,36 @@
+"""
+Latency distributions for the Nextcloud stand-ins. A distribution is given
+as NAME:PARAMETERS in milliseconds:
+
+* const:20 or just 20: always 20 ms
+* uniform:10:50: uniformly distributed between 10 and 50 ms
+* exp:20: exponentially distributed with a mean of 20 ms
+* lognormal:20:0.5: log-normally distributed with a median of 20 ms and a
+  shape (sigma) of 0.5, which gives the long tail of real feed servers
+"""
+import math
+import random
+from typing import Callable, Optional
+
+
+def parse_latency(spec: str,
+                  rng: Optional[random.Random] = None) -> Callable[[], float]:
+    """
+    Returns a function which returns a latency in seconds
+    """
+    rng = rng or random.Random()
+    name, _, parameters = spec.partition(':')
+    if not parameters:
+        name, parameters = 'const', spec
+    values = [float(value) for value in parameters.split(':')]
+    if name == 'const':
+        return lambda: values[0] / 1000
+    if name == 'uniform':
+        return lambda: rng.uniform(values[0], values[1]) / 1000
+    if name == 'exp':
+        return lambda: rng.expovariate(1 / values[0]) / 1000 \
+            if values[0] else 0.0
+    if name == 'lognormal':
+        median, sigma = values
+        return lambda: rng.lognormvariate(math.log(median), sigma) / 1000
+    raise ValueError('Unknown latency distribution: %s' % spec)
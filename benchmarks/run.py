@@ -0,0 +1,168 @@
+#!/usr/bin/env python3
+"""
+Throughput benchmark which runs the real WebUpdater and CliUpdaterV15 end to
+end against local stand-ins for Nextcloud: fake_nextcloud.py for the REST
+API and fake_php.py for the console API. Every combination of updater, feed
+count and thread count is run once in singlerun mode and the results are
+written to a JSON file so that runs before and after a change can be
+compared.
+
+    python3 benchmarks/run.py --output results.json
+    python3 benchmarks/run.py --updaters web --feeds 100000 --threads 10 100 \\
+        --engine asyncio --latency lognormal:50:0.8 --error-rate 0.01
+
+Updating 100k feeds with the console API starts one PHP process per feed,
+pass --batchsize to use long lived PHP workers instead.
+"""
+import argparse
+import contextlib
+import io
+import json
+import logging
+import os
+import platform
+import resource
+import sys
+import tempfile
+import time
+from typing import List
+
+BENCHMARKS = os.path.dirname(os.path.abspath(__file__))
+sys.path.insert(0, os.path.dirname(BENCHMARKS))
+
+from fake_nextcloud import FakeNextcloud  # noqa: E402
+from nextcloud_news_updater.api.metrics import UpdaterMetrics  # noqa: E402
+from nextcloud_news_updater.api.updater import Updater  # noqa: E402
+from nextcloud_news_updater.config import Config  # noqa: E402
+from nextcloud_news_updater.container import Container  # noqa: E402
+
+FAKE_PHP = os.path.join(BENCHMARKS, 'fake_php.py')
+
+
+def cpu_seconds() -> float:
+    total = 0.0
+    for who in (resource.RUSAGE_SELF, resource.RUSAGE_CHILDREN):
+        usage = resource.getrusage(who)
+        total += usage.ru_utime + usage.ru_stime
+    return total
+
+
+def run_updater(config: Config) -> dict:
+    container = Container()
+    container.register(Config, lambda c: config)
+    updater = container.resolve(Updater)
+    updater.metrics = UpdaterMetrics()
+    # failed updates are expected when simulating errors
+    logging.getLogger('Nextcloud News Updater').setLevel(logging.CRITICAL)
+    cpu = cpu_seconds()
+    start = time.perf_counter()
+    with contextlib.redirect_stderr(io.StringIO()):
+        updater.run()
+    duration = time.perf_counter() - start
+    metrics = updater.metrics
+    updated = metrics.updates.value('success')
+    failed = metrics.updates.value('failure') + \
+        metrics.updates.value('timeout')
+    return {
+        'seconds': round(duration, 3),
+        'cpu_seconds': round(cpu_seconds() - cpu, 3),
+        'updated': int(updated),
+        'failed': int(failed),
+        'feeds_per_second': round((updated + failed) / duration, 1),
+        'phases': {labels[0]: round(value, 3) for _, labels, value
+                   in metrics.phase_duration.samples()},
+    }
+
+
+def bench_web(args: argparse.Namespace, feeds: int, threads: int) -> dict:
+    server = FakeNextcloud(0, feeds, args.users, args.latency,
+                           args.error_rate, args.seed)
+    server.start()
+    try:
+        config = create_config(args, threads)
+        config.url = server.url
+        config.user = 'admin'
+        config.password = 'admin'
+        return run_updater(config)
+    finally:
+        server.stop()
+
+
+def bench_cli(args: argparse.Namespace, feeds: int, threads: int) -> dict:
+    os.environ.update({
+        'FAKE_PHP_BOOT_MS': str(args.boot_ms),
+        'FAKE_PHP_UPDATE_MS': args.latency,
+        'FAKE_PHP_ERROR_RATE': str(args.error_rate),
+        'FAKE_PHP_FEEDS': str(feeds),
+        'FAKE_PHP_USERS': str(args.users),
+    })
+    with tempfile.TemporaryDirectory() as directory:
+        config = create_config(args, threads)
+        config.url = directory
+        config.php = FAKE_PHP
+        config.batchsize = args.batchsize
+        return run_updater(config)
+
+
+def create_config(args: argparse.Namespace, threads: int) -> Config:
+    config = Config()
+    config.mode = 'singlerun'
+    config.apilevel = 'v15'
+    config.threads = threads
+    config.engine = args.engine
+    config.dispatch = args.dispatch
+    return config
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(
+        description='Runs the updaters against local Nextcloud stand-ins')
+    parser.add_argument('--updaters', nargs='+', choices=['web', 'cli'],
+                        default=['web', 'cli'])
+    parser.add_argument('--feeds', nargs='+', type=int,
+                        default=[1000, 10000, 100000])
+    parser.add_argument('--threads', nargs='+', type=int,
+                        default=[10, 50])
+    parser.add_argument('--users', type=int, default=100)
+    parser.add_argument('--latency', default='lognormal:20:0.5',
+                        help='Feed update latency in ms, see latency.py')
+    parser.add_argument('--error-rate', type=float, default=0.0)
+    parser.add_argument('--boot-ms', type=int, default=50,
+                        help='CPU time needed to boot the fake Nextcloud '
+                             'per PHP process')
+    parser.add_argument('--batchsize', type=int, default=0)
+    parser.add_argument('--engine', choices=['threads', 'asyncio'],
+                        default='threads')
+    parser.add_argument('--dispatch', choices=['fifo', 'fair'],
+                        default='fair')
+    parser.add_argument('--seed', type=int, default=0)
+    parser.add_argument('--output', default='benchmark-results.json')
+    args = parser.parse_args()
+
+    benches = {'web': bench_web, 'cli': bench_cli}
+    results = []  # type: List[dict]
+    for updater in args.updaters:
+        for feeds in args.feeds:
+            for threads in args.threads:
+                result = {'updater': updater, 'feeds': feeds,
+                          'threads': threads}
+                result.update(benches[updater](args, feeds, threads))
+                print(json.dumps(result), flush=True)
+                results.append(result)
+
+    settings = {key: value for key, value in vars(args).items()
+                if key not in ('updaters', 'feeds', 'threads', 'output')}
+    with open(args.output, 'w') as outfile:
+        json.dump({
+            'created': time.strftime('%Y-%m-%dT%H:%M:%S%z'),
+            'python': platform.python_version(),
+            'platform': platform.platform(),
+            'cpus': os.cpu_count(),
+            'settings': settings,
+            'results': results,
+        }, outfile, indent=2)
+    print('Wrote results to %s' % args.output)
+
+
+if __name__ == '__main__':
+    main()
@@ -5,9 +5,8 @@ once to speed up the update process. Built in cron has to be disabled in the
 news config, see the README.rst file in the top directory for more information.
 """
 import sys
-from platform import python_version
 
-from nextcloud_news_updater.container import Container
+from nextcloud_news_updater.container import Container, SUPERVISOR
 from nextcloud_news_updater.api.updater import Updater
 
 __author__ = 'Bernhard Posselt'
@@ -17,13 +16,28 @@ __maintainer__ = 'Bernhard Posselt'
 __email__ = 'dev@bernhard-posselt.com'
 
 if sys.version_info < (3, 4):
-    print('Error: Python 3.4 required but found %s' % python_version())
+    print('Error: Python 3.4 required but found %s' % sys.version.split()[0])
     exit(1)
 
 
 def main() -> None:
+    if len(sys.argv) > 1 and sys.argv[1] == 'analyze':
+        from nextcloud_news_updater import analyze
+        analyze.main(sys.argv[2:])
+        return
+    if len(sys.argv) > 1 and sys.argv[1] == 'control':
+        from nextcloud_news_updater import control
+        control.main(sys.argv[2:])
+        return
+    if len(sys.argv) > 1 and sys.argv[1] == 'simulate':
+        from nextcloud_news_updater import simulate
+        simulate.main(sys.argv[2:])
+        return
     container = Container()
-    container.resolve(Updater).run()
+    if container.has_instances():
+        container.resolve(SUPERVISOR).run()
+    else:
+        container.resolve(Updater).run()
 
 
 if __name__ == '__main__':
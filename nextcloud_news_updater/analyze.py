@@ -0,0 +1,200 @@
+"""
+Reports on the run history which the updater writes if the history option
+is set: update durations, the feeds and users which keep the update threads
+busy or fail most often, and the throughput of the last runs.
+
+    nextcloud-news-updater analyze /path/to/history.sqlite
+"""
+import argparse
+import sqlite3
+import sys
+import time
+from typing import Any, Dict, Iterator, List, Optional, Sequence, \
+    TextIO
+from urllib.request import pathname2url
+
+PERCENTILES = (50, 90, 99)
+
+
+def format_time(timestamp: Optional[float]) -> str:
+    if timestamp is None:
+        return '-'
+    return time.strftime('%Y-%m-%d %H:%M:%S', time.localtime(timestamp))
+
+
+class HistoryAnalyzer:
+    """
+    Queries the run history. All reports cover the last runs only, which
+    are the ones with an id of at least first_run
+    """
+
+    def __init__(self, connection: sqlite3.Connection, runs: int) -> None:
+        self.connection = connection
+        row = connection.execute(
+            'SELECT id FROM runs ORDER BY id DESC LIMIT 1 OFFSET ?',
+            (max(0, runs - 1),)).fetchone()
+        self.first_run = 0 if row is None else row[0]
+
+    def runs(self) -> List[Any]:
+        return self.connection.execute(
+            'SELECT id, mode, started, finished, updates, failures, success '
+            'FROM runs WHERE id >= ? ORDER BY id',
+            (self.first_run,)).fetchall()
+
+    def percentiles(self) -> Dict[str, float]:
+        """
+        Returns the percentiles and the maximum of the update durations
+        without loading all durations into memory
+        """
+        count = self._scalar('SELECT COUNT(*) FROM updates WHERE run >= ?')
+        result = {}  # type: Dict[str, float]
+        if count == 0:
+            return result
+        for percentile in PERCENTILES:
+            offset = min(count - 1, count * percentile // 100)
+            result['p%d' % percentile] = self._scalar(
+                'SELECT duration FROM updates WHERE run >= ? '
+                'ORDER BY duration LIMIT 1 OFFSET %d' % offset)
+        result['max'] = self._scalar(
+            'SELECT MAX(duration) FROM updates WHERE run >= ?')
+        return result
+
+    def busiest_feeds(self, limit: int) -> List[Any]:
+        return self.connection.execute(
+            'SELECT feed_id, user_id, COUNT(*), SUM(duration), '
+            'AVG(duration), MAX(duration) FROM updates WHERE run >= ? '
+            'GROUP BY feed_id, user_id ORDER BY SUM(duration) DESC LIMIT ?',
+            (self.first_run, limit)).fetchall()
+
+    def failing_feeds(self, limit: int) -> List[Any]:
+        return self.connection.execute(
+            'SELECT feed_id, user_id, COUNT(*), SUM(NOT success), '
+            'MAX(error) FROM updates WHERE run >= ? '
+            'GROUP BY feed_id, user_id HAVING SUM(NOT success) > 0 '
+            'ORDER BY SUM(NOT success) DESC, COUNT(*) LIMIT ?',
+            (self.first_run, limit)).fetchall()
+
+    def users(self, limit: int) -> List[Any]:
+        return self.connection.execute(
+            'SELECT user_id, COUNT(DISTINCT feed_id), COUNT(*), '
+            'SUM(duration), AVG(duration), SUM(NOT success) FROM updates '
+            'WHERE run >= ? GROUP BY user_id ORDER BY SUM(duration) DESC '
+            'LIMIT ?', (self.first_run, limit)).fetchall()
+
+    def errors(self) -> List[Any]:
+        return self.connection.execute(
+            'SELECT error, COUNT(*) FROM updates WHERE run >= ? '
+            'AND NOT success GROUP BY error ORDER BY COUNT(*) DESC',
+            (self.first_run,)).fetchall()
+
+    def feed_durations(self) -> Iterator[Any]:
+        """
+        Yields the feed id, user id and duration of every update
+        """
+        return self.connection.execute(
+            'SELECT feed_id, user_id, duration FROM updates WHERE run >= ? '
+            'ORDER BY run', (self.first_run,))
+
+    def _scalar(self, query: str) -> Any:
+        return self.connection.execute(query, (self.first_run,)).fetchone()[0]
+
+
+def throughput(run: Sequence[Any]) -> Optional[float]:
+    """
+    Returns the updates per second of a finished run
+    """
+    _, _, started, finished, updates, _, _ = run
+    if finished is None or finished <= started:
+        return None
+    return updates / (finished - started)
+
+
+def report(analyzer: HistoryAnalyzer, limit: int, out: TextIO) -> None:
+    runs = analyzer.runs()
+    if not runs:
+        print('The history does not contain any runs yet', file=out)
+        return
+    updates = sum(run[4] for run in runs)
+    failures = sum(run[5] for run in runs)
+    print('%d runs from %s to %s, %d updates of which %d failed' % (
+        len(runs), format_time(runs[0][2]), format_time(runs[-1][2]),
+        updates, failures), file=out)
+
+    durations = analyzer.percentiles()
+    if durations:
+        print('Update durations: %s' % '  '.join(
+            '%s %.3f s' % item for item in durations.items()), file=out)
+
+    print('\nRuns:', file=out)
+    print('  %-19s  %-10s  %10s  %8s  %8s  %8s' % (
+        'started', 'mode', 'duration s', 'updates', 'failures', 'feeds/s'),
+        file=out)
+    rates = []  # type: List[float]
+    for run in runs:
+        _, mode, started, finished, run_updates, run_failures, success = run
+        rate = throughput(run)
+        if rate is not None:
+            rates.append(rate)
+        duration = '-' if finished is None else '%.1f' % (finished - started)
+        if success == 0:
+            duration += ' failed'
+        print('  %-19s  %-10s  %10s  %8d  %8d  %8s' % (
+            format_time(started), mode, duration, run_updates, run_failures,
+            '-' if rate is None else '%.1f' % rate), file=out)
+    if len(rates) >= 2:
+        half = len(rates) // 2
+        print('Throughput went from %.1f to %.1f feeds per second (mean of '
+              'the older and the newer half of the runs)' % (
+                  sum(rates[:half]) / half,
+                  sum(rates[half:]) / (len(rates) - half)), file=out)
+
+    print('\nFeeds which kept the update threads busy the longest:',
+          file=out)
+    print('  %10s  %-20s  %8s  %10s  %8s  %8s' % (
+        'feed', 'user', 'updates', 'total s', 'mean s', 'max s'), file=out)
+    for row in analyzer.busiest_feeds(limit):
+        print('  %10d  %-20s  %8d  %10.1f  %8.3f  %8.3f' % tuple(row),
+              file=out)
+
+    print('\nFeeds which failed most often:', file=out)
+    print('  %10s  %-20s  %8s  %8s  %s' % (
+        'feed', 'user', 'updates', 'failures', 'error'), file=out)
+    for row in analyzer.failing_feeds(limit):
+        print('  %10d  %-20s  %8d  %8d  %s' % tuple(row), file=out)
+
+    print('\nUsers:', file=out)
+    print('  %-20s  %8s  %8s  %10s  %8s  %8s' % (
+        'user', 'feeds', 'updates', 'total s', 'mean s', 'failures'),
+        file=out)
+    for row in analyzer.users(limit):
+        print('  %-20s  %8d  %8d  %10.1f  %8.3f  %8d' % tuple(row), file=out)
+
+    errors = analyzer.errors()
+    if errors:
+        print('\nErrors:', file=out)
+        for error, count in errors:
+            print('  %8d  %s' % (count, error), file=out)
+
+
+def main(argv: List[str]) -> None:
+    parser = argparse.ArgumentParser(
+        prog='nextcloud-news-updater analyze',
+        description='Reports on the run history written by the updater')
+    parser.add_argument('history',
+                        help='Path to the history database, the history '
+                             'option of the updater')
+    parser.add_argument('--runs', type=int, default=20,
+                        help='Number of most recent runs to analyze, '
+                             'defaults to 20')
+    parser.add_argument('--top', type=int, default=10,
+                        help='Number of feeds and users to list, defaults to '
+                             '10')
+    args = parser.parse_args(argv)
+    try:
+        connection = sqlite3.connect(
+            'file:%s?mode=ro' % pathname2url(args.history), uri=True)
+        report(HistoryAnalyzer(connection, args.runs), args.top, sys.stdout)
+    except sqlite3.Error as e:
+        print('Error: could not read history %s: %s' % (args.history, e),
+              file=sys.stderr)
+        exit(1)
@@ -1,38 +1,66 @@
-import json
-from typing import List, Any
+from typing import Any, Iterable, Iterator, List, Optional
+
+from nextcloud_news_updater.common.jsonstream import JsonStream
+
+
+class FeedUpdateException(Exception):
+    """
+    Raised by update threads if a feed could not be updated and the reason
+    was already logged
+    """
+    pass
 
 
 class Feed:
     """
     Payload object for update infos
     """
+    __slots__ = ('feed_id', 'user_id', 'last_modified')
 
-    def __init__(self, feed_id: int, user_id: str) -> None:
+    def __init__(self, feed_id: int, user_id: str,
+                 last_modified: Optional[int] = None) -> None:
         self.feed_id = feed_id
         self.user_id = user_id
+        # modification time reported by the feed list, if available
+        self.last_modified = last_modified
 
 
 class Api:
     """API JSON results parser"""
 
+    # key of the feed list in the feeds JSON object or None if the feeds JSON
+    # is the list itself
+    feeds_key = 'feeds'  # type: Optional[str]
+
     def parse_users(self, json_str: str) -> List[str]:
         """Returns a list of userIDs from JSON data"""
-        try:
-            users_dict = json.loads(json_str)
-            return list(users_dict.keys())
-        except ValueError:
-            msg = 'Could not parse the JSON user list: %s' % json_str
-            raise ValueError(msg)
+        return list(self.iter_users([json_str.encode('utf-8')]))
 
     def parse_feeds(self, json_str: str, userID: str = None) -> List[Feed]:
         """Returns a list of feeds from JSON data"""
+        return list(self.iter_feeds([json_str.encode('utf-8')], userID))
+
+    def iter_users(self, chunks: Iterable[bytes]) -> Iterator[str]:
+        """
+        Yields the userIDs while the JSON data is still being received
+        """
+        try:
+            yield from JsonStream(chunks).keys()
+        except ValueError as e:
+            msg = 'Could not parse the JSON user list: %s' % e
+            raise ValueError(msg)
+
+    def iter_feeds(self, chunks: Iterable[bytes],
+                   userID: str = None) -> Iterator[Feed]:
+        """
+        Yields the feeds while the JSON data is still being received
+        """
         try:
-            feeds_json = json.loads(json_str)
-            return self._parse_feeds_json(feeds_json, userID)
-        except ValueError:
-            msg = 'Could not parse given JSON: %s' % json_str
+            for info in JsonStream(chunks).items(self.feeds_key):
+                yield self._create_feed(info, userID)
+        except ValueError as e:
+            msg = 'Could not parse given JSON: %s' % e
             raise ValueError(msg)
 
-    def _parse_feeds_json(self, feeds: dict, userID: str) -> List[Feed]:
-        feeds = feeds['feeds']
-        return [Feed(info['id'], info['userId']) for info in feeds]
+    def _create_feed(self, info: Any, userID: str) -> Feed:
+        return Feed(info['id'], info['userId'])
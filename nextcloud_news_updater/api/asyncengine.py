@@ -0,0 +1,87 @@
+import asyncio
+import time
+from typing import Any, Optional
+
+from nextcloud_news_updater.api.api import Feed, FeedUpdateException
+from nextcloud_news_updater.api.feedqueue import FeedQueue
+from nextcloud_news_updater.common.logger import Logger
+
+
+class AsyncUpdateEngine:
+    """
+    Runs the feed updates as coroutines on a single event loop instead of
+    one OS thread per parallel update. The number of updates in flight is
+    bounded by a semaphore. For profiling the engine counts as one worker
+    whose idle time is the time its slots were not in use
+    """
+    name = 'asyncio'
+
+    def __init__(self, updater: Any, logger: Logger,
+                 concurrency: int) -> None:
+        self.updater = updater
+        self.logger = logger
+        self.concurrency = concurrency
+        self.busy = 0.0
+        self.idle = 0.0
+        self.updates = 0
+
+    def run(self, feeds: FeedQueue) -> None:
+        loop = asyncio.new_event_loop()
+        start_time = time.monotonic()
+        try:
+            loop.run_until_complete(self._update_all(feeds))
+        finally:
+            loop.close()
+            elapsed = time.monotonic() - start_time
+            self.idle = max(0.0, self.concurrency * elapsed - self.busy)
+
+    async def _update_all(self, feeds: FeedQueue) -> None:
+        loop = asyncio.get_event_loop()
+        semaphore = asyncio.Semaphore(self.concurrency)
+        tasks = set()
+        try:
+            while True:
+                await semaphore.acquire()
+                try:
+                    # blocks until the lister added feeds or closed the queue
+                    feed = await loop.run_in_executor(None, feeds.pop)
+                except IndexError:
+                    semaphore.release()
+                    break
+                task = asyncio.ensure_future(self._update(feeds, feed))
+                task.add_done_callback(lambda _: semaphore.release())
+                tasks.add(task)
+                task.add_done_callback(tasks.discard)
+            if tasks:
+                await asyncio.wait(tasks)
+        finally:
+            await self.updater.close_async()
+
+    async def _update(self, feeds: FeedQueue, feed: Feed) -> None:
+        start_time = time.monotonic()
+        error = await self._try_update(feed)
+        retry = self.updater.retry
+        attempt = 0
+        while retry is not None and retry.should_retry(attempt, error):
+            delay = retry.delay(attempt)
+            attempt += 1
+            self.logger.info('Retrying feed with id %s in %.1f seconds',
+                             feed.feed_id, delay)
+            await asyncio.sleep(delay)
+            error = await self._try_update(feed)
+        duration = time.monotonic() - start_time
+        self.busy += duration
+        self.updates += 1
+        feeds.done(feed, duration, error)
+
+    async def _try_update(self, feed: Feed) -> Optional[Exception]:
+        try:
+            self.logger.info('Updating feed with id %s and user %s',
+                             feed.feed_id, feed.user_id)
+            await self.updater.update_feed_async(feed)
+        except FeedUpdateException as e:
+            return e
+        except Exception as e:
+            self.logger.exception(str(e))
+            return e
+        return None
@@ -0,0 +1,175 @@
+import json
+import threading
+from os.path import dirname, realpath, join
+from subprocess import Popen, PIPE, CalledProcessError, TimeoutExpired
+from typing import Dict, List, Optional
+
+from nextcloud_news_updater.api.resources import ProcessPolicy, \
+    create_process_policy
+from nextcloud_news_updater.common.deadline import Watchdog, kill_group
+from nextcloud_news_updater.config import Config
+
+BATCH_WORKER_SCRIPT = join(dirname(dirname(realpath(__file__))), 'php',
+                           'batch_worker.php')
+
+
+class WorkerException(Exception):
+    pass
+
+
+class PhpWorker:
+    """
+    Long lived PHP process which boots Nextcloud once and then runs update
+    commands sent over STDIN, see php/batch_worker.php for the protocol. The
+    process is started right away, the first command waits until it booted
+    """
+
+    def __init__(self, command: List[str],
+                 policy: Optional[ProcessPolicy] = None) -> None:
+        self.command = command
+        if policy is not None:
+            command = policy.wrap(command)
+        self.process = Popen(command, stdin=PIPE, stdout=PIPE,
+                             start_new_session=True)
+        if policy is not None:
+            policy.apply(self.process.pid)
+        self.processed = 0
+        self.memory = 0
+        self.booted = False
+
+    def run(self, arguments: List[str]) -> bytes:
+        """
+        Runs a command and returns its output
+        :raises CalledProcessError if the command failed
+        :raises WorkerException if the worker died
+        """
+        if not self.booted:
+            self._read_response()
+            self.booted = True
+        request = json.dumps({'arguments': arguments}) + '\n'
+        try:
+            self.process.stdin.write(request.encode('utf-8'))
+            self.process.stdin.flush()
+        except (BrokenPipeError, ValueError):
+            raise WorkerException('PHP worker %d exited with code %s' %
+                                  (self.process.pid, self.process.poll()))
+        response = self._read_response()
+        self.processed += 1
+        output = response.get('output', '').encode('utf-8')
+        if response.get('status', 1) != 0:
+            raise CalledProcessError(response.get('status', 1), arguments,
+                                     output)
+        return output
+
+    def stop(self) -> None:
+        if self.process.poll() is None:
+            try:
+                self.process.stdin.close()
+                self.process.wait(5)
+            except Exception:
+                self.process.kill()
+                self.process.wait()
+        self.process.stdout.close()
+
+    def _read_response(self) -> dict:
+        line = self.process.stdout.readline()
+        if not line:
+            self.stop()
+            raise WorkerException('PHP worker %d exited with code %s' %
+                                  (self.process.pid, self.process.returncode))
+        try:
+            response = json.loads(line.decode('utf-8'))
+        except ValueError:
+            self.stop()
+            raise WorkerException('PHP worker %d sent invalid response: %s' %
+                                  (self.process.pid, line.strip()))
+        self.memory = response.get('memory', 0)
+        return response
+
+
+class PhpWorkerPool:
+    """
+    Pool of PHP workers which are shared by all update threads. Workers are
+    recycled after they updated max_feeds feeds or once their memory usage
+    exceeds max_memory bytes. A worker which exceeds the timeout of a
+    command, including the boot of a new worker, is killed. New workers are
+    started with the priority and limits of the policy
+    """
+
+    def __init__(self, command: List[str], max_feeds: int,
+                 max_memory: int,
+                 policy: Optional[ProcessPolicy] = None) -> None:
+        self.command = command
+        self.max_feeds = max_feeds
+        self.max_memory = max_memory
+        self.policy = policy
+        self.started = 0
+        self.recycled = 0
+        self._idle = []  # type: List[PhpWorker]
+        self._lock = threading.Lock()
+        self.watchdog = Watchdog()
+
+    def run(self, arguments: List[str],
+            timeout: Optional[float] = None) -> bytes:
+        """
+        Runs a command in an idle worker
+        :raises CalledProcessError if the command failed
+        :raises TimeoutExpired if the command took longer than timeout
+        seconds
+        """
+        worker = self._acquire()
+        watch = None
+        if timeout is not None:
+            watch = self.watchdog.watch(
+                timeout, lambda: kill_group(worker.process.pid))
+        try:
+            try:
+                return worker.run(arguments)
+            finally:
+                if watch is not None and not self.watchdog.cancel(watch):
+                    worker.stop()
+                    raise TimeoutExpired(arguments, timeout)
+        except (CalledProcessError, TimeoutExpired):
+            raise
+        except BaseException:
+            worker.stop()
+            raise
+        finally:
+            if worker.process.poll() is None:
+                self._release(worker)
+
+    def stats(self) -> Dict[str, int]:
+        with self._lock:
+            return {'started': self.started, 'recycled': self.recycled}
+
+    def close(self) -> None:
+        with self._lock:
+            idle, self._idle = self._idle, []
+        for worker in idle:
+            worker.stop()
+
+    def _acquire(self) -> PhpWorker:
+        with self._lock:
+            if self._idle:
+                return self._idle.pop()
+            self.started += 1
+        return PhpWorker(self.command, self.policy)
+
+    def _release(self, worker: PhpWorker) -> None:
+        if worker.processed >= self.max_feeds or \
+                worker.memory > self.max_memory:
+            with self._lock:
+                self.recycled += 1
+            worker.stop()
+            return
+        with self._lock:
+            self._idle.append(worker)
+
+
+def create_worker_pool(config: Config,
+                       command: List[str]) -> Optional[PhpWorkerPool]:
+    if config.batchsize <= 0:
+        return None
+    return PhpWorkerPool(command, config.batchsize,
+                         config.batchmemory * 1024 * 1024,
+                         create_process_policy(config))
@@ -0,0 +1,173 @@
+import json
+import os
+import random
+import threading
+import time
+from typing import Callable, Dict, List, Optional
+from urllib.error import HTTPError, URLError
+
+from nextcloud_news_updater.config import Config
+
+# longest time a failing feed is quarantined
+MAX_QUARANTINE = 24 * 60 * 60
+# time dispatch is paused for when the server breaker opens for the first
+# time, doubled every time it opens again without a successful update
+SERVER_PAUSE = 30
+MAX_SERVER_PAUSE = 10 * 60
+# status codes which are retried because they usually go away on their own
+TRANSIENT_STATUS_CODES = (429, 502, 503, 504)
+
+
+def is_transient(error: Optional[Exception]) -> bool:
+    """
+    Returns whether a failed update is worth retrying right away: dropped
+    connections and gateway errors are, timeouts are not because a feed
+    host which is down would tie up an update slot for another timeout
+    """
+    if error is None:
+        return False
+    cause = error.__cause__ or error
+    if isinstance(cause, HTTPError):
+        return cause.code in TRANSIENT_STATUS_CODES
+    return isinstance(cause, (ConnectionError, URLError))
+
+
+def is_server_error(error: Optional[Exception]) -> bool:
+    """
+    Returns whether Nextcloud itself failed to handle an update
+    """
+    if error is None:
+        return False
+    cause = error.__cause__ or error
+    return isinstance(cause, HTTPError) and cause.code >= 500
+
+
+class RetryPolicy:
+    """
+    Retries transient errors up to retries times with exponential backoff
+    and full jitter: the n-th retry waits a random time between 0 and
+    base * 2^n seconds, at most cap seconds, so that updates which failed
+    at the same time do not hit Nextcloud again at the same time
+    """
+
+    def __init__(self, retries: int, base: float = 1.0, cap: float = 30.0,
+                 rng: Callable[[], float] = random.random) -> None:
+        self.retries = retries
+        self.base = base
+        self.cap = cap
+        self.rng = rng
+
+    def should_retry(self, attempt: int, error: Optional[Exception]) -> bool:
+        return attempt < self.retries and is_transient(error)
+
+    def delay(self, attempt: int) -> float:
+        return self.rng() * min(self.cap, self.base * 2 ** attempt)
+
+
+class CircuitBreaker:
+    """
+    Keeps failing feeds and a failing Nextcloud from wasting update slots.
+    A feed which failed feed_threshold times in a row is quarantined for
+    quarantine seconds, and for twice as long after every further failure
+    up to MAX_QUARANTINE. A successful update closes its breaker again.
+    Server errors do not count against single feeds, instead
+    server_threshold of them in a row open the server breaker which pauses
+    dispatch. A threshold of 0 disables the breaker
+    """
+
+    def __init__(self, path: Optional[str], feed_threshold: int,
+                 server_threshold: int, quarantine: float,
+                 clock: Callable[[], float] = time.time) -> None:
+        self.path = path
+        self.feed_threshold = feed_threshold
+        self.server_threshold = server_threshold
+        self.quarantine = quarantine
+        self.clock = clock
+        # consecutive failures and end of the quarantine per feed id
+        self.feeds = {}  # type: Dict[int, List[float]]
+        self.server_errors = 0
+        # number of times the server breaker opened since the last success
+        self.server_opens = 0
+        self.paused_until = 0.0
+        self._lock = threading.Lock()
+
+    def allows(self, feed_id: int) -> bool:
+        return self.quarantined_until(feed_id) <= self.clock()
+
+    def quarantined_until(self, feed_id: int) -> float:
+        with self._lock:
+            record = self.feeds.get(feed_id)
+            return 0 if record is None else record[1]
+
+    def record(self, feed_id: int, error: Optional[Exception]) -> float:
+        """
+        Records the outcome of an update and returns the number of seconds
+        dispatch should be paused for, 0 if it should go on
+        """
+        with self._lock:
+            if error is None:
+                self.feeds.pop(feed_id, None)
+                self.server_errors = 0
+                self.server_opens = 0
+                return 0
+            if is_server_error(error):
+                return self._record_server_error()
+            if self.feed_threshold > 0:
+                record = self.feeds.setdefault(feed_id, [0, 0.0])
+                record[0] += 1
+                excess = record[0] - self.feed_threshold
+                if excess >= 0:
+                    quarantine = min(MAX_QUARANTINE,
+                                     self.quarantine * 2 ** min(excess, 32))
+                    record[1] = self.clock() + quarantine
+            return 0
+
+    def _record_server_error(self) -> float:
+        if self.server_threshold <= 0:
+            return 0
+        self.server_errors += 1
+        if self.server_errors < self.server_threshold:
+            return 0
+        pause = min(MAX_SERVER_PAUSE,
+                    SERVER_PAUSE * 2 ** min(self.server_opens, 32))
+        self.server_errors = 0
+        self.server_opens += 1
+        self.paused_until = self.clock() + pause
+        return pause
+
+    def load(self) -> None:
+        if self.path is None:
+            return
+        try:
+            with open(self.path, 'r') as infile:
+                data = json.load(infile)
+        except FileNotFoundError:
+            return
+        with self._lock:
+            self.feeds = {int(feed_id): record
+                          for feed_id, record in data['feeds'].items()}
+            self.server_opens, self.paused_until = data['server']
+
+    def save(self) -> None:
+        if self.path is None:
+            return
+        with self._lock:
+            data = {'feeds': {feed_id: list(record)
+                              for feed_id, record in self.feeds.items()},
+                    'server': [self.server_opens, self.paused_until]}
+        tmp_path = self.path + '.tmp'
+        with open(tmp_path, 'w') as outfile:
+            json.dump(data, outfile, separators=(',', ':'))
+        os.replace(tmp_path, self.path)
+
+
+def create_circuit_breaker(config: Config) -> Optional[CircuitBreaker]:
+    if config.feedbreaker <= 0 and config.serverbreaker <= 0:
+        return None
+    path = None
+    if config.statedir:
+        path = os.path.join(config.statedir, 'breaker.json')
+    breaker = CircuitBreaker(path, config.feedbreaker, config.serverbreaker,
+                             config.interval)
+    breaker.load()
+    return breaker
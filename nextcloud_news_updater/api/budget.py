@@ -0,0 +1,70 @@
+import threading
+from typing import Dict
+
+
+class Budget:
+    """
+    Number of feed updates which may run at the same time, shared by the
+    updaters of several Nextcloud instances. Free slots go to the waiting
+    instance which uses the fewest slots relative to its weight, so an
+    instance with weight 2 gets twice as many slots as one with weight 1
+    while both have feeds to update, and idle instances leave their share
+    to the others
+    """
+
+    def __init__(self, capacity: int) -> None:
+        self.capacity = capacity
+        self.in_use = 0
+        self.weights = {}  # type: Dict[str, int]
+        self.used = {}  # type: Dict[str, int]
+        self._waiting = {}  # type: Dict[str, int]
+        self._condition = threading.Condition()
+
+    def share(self, name: str, weight: int = 1) -> 'BudgetShare':
+        with self._condition:
+            self.weights[name] = weight
+            self.used[name] = 0
+        return BudgetShare(self, name)
+
+    def acquire(self, name: str) -> None:
+        with self._condition:
+            self._waiting[name] = self._waiting.get(name, 0) + 1
+            try:
+                while self.in_use >= self.capacity or \
+                        self._next_in_line() != name:
+                    self._condition.wait()
+            finally:
+                self._waiting[name] -= 1
+                if self._waiting[name] == 0:
+                    del self._waiting[name]
+            self.in_use += 1
+            self.used[name] += 1
+            # the next instance in line might be able to take a slot, too
+            self._condition.notify_all()
+
+    def release(self, name: str) -> None:
+        with self._condition:
+            self.in_use -= 1
+            self.used[name] -= 1
+            self._condition.notify_all()
+
+    def _next_in_line(self) -> str:
+        return min(self._waiting, key=lambda name: (
+            self.used[name] / self.weights[name], name))
+
+
+class BudgetShare:
+    """
+    Handle through which the queue of one instance takes slots of a shared
+    budget
+    """
+
+    def __init__(self, budget: Budget, name: str) -> None:
+        self.budget = budget
+        self.name = name
+
+    def acquire(self) -> None:
+        self.budget.acquire(self.name)
+
+    def release(self) -> None:
+        self.budget.release(self.name)
@@ -1,15 +1,136 @@
-from subprocess import check_output, CalledProcessError, STDOUT
-from typing import List, Any
-
-from nextcloud_news_updater.api.api import Api, Feed
+from subprocess import CalledProcessError, STDOUT, PIPE, Popen, \
+    TimeoutExpired
+from typing import List, Any, Iterator, Optional, Union
+
+from nextcloud_news_updater.api.api import Api, Feed, FeedUpdateException
+from nextcloud_news_updater.api.batch import BATCH_WORKER_SCRIPT, \
+    PhpWorkerPool, create_worker_pool
+from nextcloud_news_updater.api.feedcache import ALL_FEEDS
+from nextcloud_news_updater.api.feedqueue import FeedQueue, \
+    extend_in_batches
+from nextcloud_news_updater.api.resources import HostThrottle, \
+    create_host_throttle, create_process_policy
 from nextcloud_news_updater.api.updater import Updater, UpdateThread
-from nextcloud_news_updater.common.logger import Logger
+from nextcloud_news_updater.common.deadline import Watchdog, kill_group
+from nextcloud_news_updater.common.jsonstream import iter_chunks
+from nextcloud_news_updater.common.logger import Lazy, Logger
 from nextcloud_news_updater.config import Config
 
 
+# number of bytes of a streamed command's output which are kept for the
+# error message if the command fails
+ERROR_OUTPUT_SIZE = 4096
+# number of bytes of a command's output which are kept by run, the rest is
+# read and dropped so that a chatty command can not fill the memory
+MAX_OUTPUT_SIZE = 1024 * 1024
+
+
 class Cli:
-    def run(self, commands: List[str]) -> bytes:
-        return check_output(commands, stderr=STDOUT)
+    """
+    Runs console commands. Every command is started in its own process
+    group, so that a command which exceeds its timeout can be killed
+    together with the processes it started, and with the priority and
+    limits of the configured process policy
+    """
+
+    def __init__(self, config: Config) -> None:
+        self.watchdog = Watchdog()
+        self.policy = create_process_policy(config)
+
+    def run(self, commands: List[str],
+            timeout: Optional[float] = None) -> bytes:
+        """
+        Runs a command and returns its output, at most MAX_OUTPUT_SIZE bytes
+        of it
+        :raises CalledProcessError if the command failed
+        :raises TimeoutExpired if the command took longer than timeout
+        seconds
+        """
+        process = Popen(self.policy.wrap(commands), stdout=PIPE,
+                        stderr=STDOUT, start_new_session=True)
+        self.policy.apply(process.pid)
+        watch = None
+        if timeout is not None:
+            watch = self.watchdog.watch(timeout,
+                                        lambda: kill_group(process.pid))
+        output = b''
+        finished = False
+        try:
+            for chunk in iter_chunks(process.stdout.read1):
+                if len(output) < MAX_OUTPUT_SIZE:
+                    output += chunk[:MAX_OUTPUT_SIZE - len(output)]
+            finished = True
+        finally:
+            if not finished:
+                kill_group(process.pid)
+            # stop watching before the process is reaped and its id reused
+            expired = watch is not None and not self.watchdog.cancel(watch)
+            process.stdout.close()
+            process.wait()
+        if expired:
+            raise TimeoutExpired(commands, timeout, output)
+        if process.returncode != 0:
+            raise CalledProcessError(process.returncode, commands, output)
+        return output
+
+    def stream(self, commands: List[str]) -> Iterator[bytes]:
+        """
+        Like run but yields the output in chunks while the command is still
+        running instead of buffering all of it
+        """
+        process = Popen(self.policy.wrap(commands), stdout=PIPE,
+                        stderr=STDOUT, start_new_session=True)
+        self.policy.apply(process.pid)
+        head = b''
+        finished = False
+        try:
+            for chunk in iter_chunks(process.stdout.read1):
+                if len(head) < ERROR_OUTPUT_SIZE:
+                    head += chunk[:ERROR_OUTPUT_SIZE - len(head)]
+                yield chunk
+            finished = True
+        finally:
+            if not finished:
+                kill_group(process.pid)
+            process.stdout.close()
+            process.wait()
+        if process.returncode != 0:
+            raise CalledProcessError(process.returncode, commands, head)
+
+    async def run_async(self, commands: List[str],
+                        timeout: Optional[float] = None) -> bytes:
+        """
+        Non blocking variant of run which is used by the asyncio engine
+        """
+        import asyncio
+        process = await asyncio.create_subprocess_exec(
+            *self.policy.wrap(commands), stdout=PIPE, stderr=STDOUT,
+            start_new_session=True)
+        self.policy.apply(process.pid)
+
+        async def read() -> bytes:
+            output = b''
+            while True:
+                chunk = await process.stdout.read(64 * 1024)
+                if not chunk:
+                    break
+                if len(output) < MAX_OUTPUT_SIZE:
+                    output += chunk[:MAX_OUTPUT_SIZE - len(output)]
+            await process.wait()
+            return output
+
+        try:
+            output = await asyncio.wait_for(read(), timeout)
+        except asyncio.TimeoutError:
+            kill_group(process.pid)
+            await process.wait()
+            raise TimeoutExpired(commands, timeout) from None
+        except asyncio.CancelledError:
+            kill_group(process.pid)
+            raise
+        if process.returncode != 0:
+            raise CalledProcessError(process.returncode, commands, output)
+        return output
 
 
 class CliApi(Api):
@@ -32,29 +153,51 @@ class CliApi(Api):
             'news:updater:update-feed']
         self.after_cleanup_command = self.base_command + [
             'news:updater:after-update']
+        self.batch_worker_command = [config.php]
+        if phpini is not None and phpini.strip() != '':
+            self.batch_worker_command += ['-c', phpini]
+        self.batch_worker_command += [BATCH_WORKER_SCRIPT, self.directory]
+
+    def update_arguments(self, feed: Feed) -> List[str]:
+        """
+        Returns the occ arguments for updating a single feed
+        """
+        return ['news:updater:update-feed', str(feed.feed_id), feed.user_id]
+
+    def update_command(self, feed: Feed) -> List[str]:
+        return self.base_command + self.update_arguments(feed)
 
 
 class CliApiV2(CliApi):
     """Cli API for Nextcloud News up to v14 (API version 2)"""
 
-    def _parse_feeds_json(self, feeds: dict, userID: str) -> List[Feed]:
-        feeds = feeds['updater']
-        return [Feed(info['feedId'], info['userId']) for info in feeds]
+    feeds_key = 'updater'
+
+    def _create_feed(self, info: Any, userID: str) -> Feed:
+        return Feed(info['feedId'], info['userId'])
 
 
 class CliApiV15(CliApi):
     """Cli API for Nextcloud News v15+"""
 
+    feeds_key = None
+
     def __init__(self, config: Config) -> None:
         super().__init__(config)
         self.all_feeds_command = self.base_command + ['news:feed:list']
         self.users_list_command = self.base_command + ['user:list', '--output',
                                                        'json']
 
-    def _parse_feeds_json(self, feeds_json: Any, userID: str) -> List[Feed]:
-        if not feeds_json:
-            return []
-        return [Feed(info['id'], userID) for info in feeds_json]
+    def update_arguments(self, feed: Feed) -> List[str]:
+        return ['news:updater:update-feed', feed.user_id, str(feed.feed_id)]
+
+    def _create_feed(self, info: Any, userID: str) -> Feed:
+        # newer News versions serialize the microsecond timestamp as string
+        try:
+            last_modified = int(info['lastModified'])  # type: Optional[int]
+        except (KeyError, TypeError, ValueError):
+            last_modified = None
+        return Feed(info['id'], userID, last_modified)
 
 
 def create_cli_api(config: Config) -> CliApi:
@@ -66,35 +209,62 @@ def create_cli_api(config: Config) -> CliApi:
         return CliApiV15(config)
 
 
+def format_command_error(command: List[str],
+                         error: Union[CalledProcessError,
+                                      TimeoutExpired]) -> str:
+    if isinstance(error, TimeoutExpired):
+        return "Command '%s' was killed after %s seconds" % (
+            ' '.join(command), error.timeout)
+    return "Command '%s' returned %d with output: '%s'" % (
+        ' '.join(command), error.returncode, error.output.decode().strip())
+
+
 class CliUpdateThread(UpdateThread):
-    def __init__(self, feeds: List[Feed], logger: Logger, api: CliApi,
-                 cli: Cli) -> None:
+    def __init__(self, feeds: FeedQueue, logger: Logger, api: CliApi,
+                 cli: Cli, workers: Optional[PhpWorkerPool] = None,
+                 timeout: Optional[float] = None,
+                 throttle: Optional[HostThrottle] = None) -> None:
         super().__init__(feeds, logger)
         self.cli = cli
         self.api = api
+        self.workers = workers
+        self.timeout = timeout
+        self.throttle = throttle
 
     def run_command(self, command: List[str]) -> None:
-        self.logger.info('Running update command: %s' % ' '.join(command))
+        self.logger.info('Running update command: %s', Lazy(' '.join, command))
         try:
-            self.cli.run(command)
-        except CalledProcessError as e:
-            self.logger.error("Command '%s' returned %d with output: '%s'" %
-                              (' '. join(command),
-                               e.returncode,
-                               e.output.decode().strip()))
+            self.cli.run(command, self.timeout)
+        except (CalledProcessError, TimeoutExpired) as e:
+            message = format_command_error(command, e)
+            self.logger.error(message)
+            raise FeedUpdateException(message) from e
+
+    def run_in_worker(self, arguments: List[str]) -> None:
+        self.logger.info('Running update command in PHP worker: %s',
+                         Lazy(' '.join, arguments))
+        try:
+            self.workers.run(arguments, self.timeout)
+        except (CalledProcessError, TimeoutExpired) as e:
+            message = format_command_error(arguments, e)
+            self.logger.error(message)
+            raise FeedUpdateException(message) from e
 
     def update_feed(self, feed: Feed) -> None:
-        command = self.api.update_feed_command + [str(feed.feed_id),
-                                                  feed.user_id]
-        self.run_command(command)
+        if self.throttle is not None:
+            self.throttle.wait()
+        if self.workers is not None:
+            self.run_in_worker(self.api.update_arguments(feed))
+        else:
+            self.run_command(self.api.update_command(feed))
+
 
 class CliUpdateThreadV15(CliUpdateThread):
-    """Cli Updater for Nextcloud News v15+"""
+    """
+    Cli Updater for Nextcloud News v15+, the changed argument order of the
+    update command is handled by CliApiV15
+    """
 
-    def update_feed(self, feed: Feed) -> None:
-        command = self.api.update_feed_command + [feed.user_id,
-                                                  str(feed.feed_id)]
-        self.run_command(command)
 
 class CliUpdater(Updater):
     def __init__(self, config: Config, logger: Logger, api: CliApi,
@@ -102,25 +272,77 @@ class CliUpdater(Updater):
         super().__init__(config, logger)
         self.cli = cli
         self.api = api
+        self.workers = create_worker_pool(config, api.batch_worker_command)
+        self.throttle = create_host_throttle(config)
 
     def before_update(self) -> None:
-        self.logger.info('Running before update command: %s' %
+        self.logger.info('Running before update command: %s',
                          ' '.join(self.api.before_cleanup_command))
         self.cli.run(self.api.before_cleanup_command)
 
-    def start_update_thread(self, feeds: List[Feed]) -> CliUpdateThread:
-        return CliUpdateThread(feeds, self.logger, self.api, self.cli)
+    def start_update_thread(self, feeds: FeedQueue) -> CliUpdateThread:
+        return CliUpdateThread(feeds, self.logger, self.api, self.cli,
+                               self.workers, self.config.timeout,
+                               self.throttle)
+
+    def update_feeds(self, feeds: FeedQueue) -> None:
+        try:
+            super().update_feeds(feeds)
+        finally:
+            if self.throttle is not None:
+                self.log_throttled(self.throttle.reset())
+            if self.workers is not None:
+                self.logger.info('PHP worker statistics: %s',
+                                 self.workers.stats())
+                self.workers.close()
+
+    async def update_feed_async(self, feed: Feed) -> None:
+        if self.workers is not None:
+            await super().update_feed_async(feed)
+            return
+        if self.throttle is not None:
+            import asyncio
+            delay = self.throttle.delay()
+            while delay > 0:
+                await asyncio.sleep(delay)
+                delay = self.throttle.delay()
+        command = self.api.update_command(feed)
+        self.logger.info('Running update command: %s', Lazy(' '.join, command))
+        try:
+            await self.cli.run_async(command, self.config.timeout)
+        except (CalledProcessError, TimeoutExpired) as e:
+            message = format_command_error(command, e)
+            self.logger.error(message)
+            raise FeedUpdateException(message) from e
+
+    def log_throttled(self, seconds: float) -> None:
+        """
+        Reports how long updates were held back because the host was busy,
+        added up over all update threads
+        """
+        if seconds > 0:
+            self.logger.info('Updates waited %.1f seconds for the load of '
+                             'the host to drop', seconds)
+        if self.metrics is not None:
+            self.metrics.throttled.inc(amount=seconds)
 
     def all_feeds(self) -> List[Feed]:
-        feeds_json_bytes = self.cli.run(self.api.all_feeds_command).strip()
-        feeds_json = str(feeds_json_bytes, 'utf-8')
-        self.logger.info('Running get all feeds command: %s' %
+        return list(self.iter_feeds())
+
+    def iter_feeds(self) -> Iterator[Feed]:
+        if self.feed_cache is not None and self.feed_cache.is_fresh():
+            self.logger.info('Using cached feed list')
+            return self.feed_cache.replay()
+        self.logger.info('Running get all feeds command: %s',
                          ' '.join(self.api.all_feeds_command))
-        self.logger.info('Received these feeds to update: %s' % feeds_json)
-        return self.api.parse_feeds(feeds_json)
+        chunks = self.cli.stream(self.api.all_feeds_command)
+        if self.feed_cache is None:
+            return self.api.iter_feeds(chunks)
+        return self.feed_cache.store(ALL_FEEDS, chunks, self.api.iter_feeds,
+                                     refresh=True)
 
     def after_update(self) -> None:
-        self.logger.info('Running after update command: %s' %
+        self.logger.info('Running after update command: %s',
                          ' '.join(self.api.after_cleanup_command))
         self.cli.run(self.api.after_cleanup_command)
 
@@ -128,25 +350,73 @@ class CliUpdater(Updater):
 class CliUpdaterV15(CliUpdater):
     """Cli Updater for Nextcloud News v15+"""
 
-    def start_update_thread(self, feeds: List[Feed]) -> CliUpdateThread:
-        return CliUpdateThreadV15(feeds, self.logger, self.api, self.cli)
+    def start_update_thread(self, feeds: FeedQueue) -> CliUpdateThread:
+        return CliUpdateThreadV15(feeds, self.logger, self.api, self.cli,
+                                  self.workers, self.config.timeout,
+                                  self.throttle)
 
     def all_feeds(self) -> List[Feed]:
-        self.logger.info('Running get user list command: %s' %
+        feeds = []  # type: List[Feed]
+        self.stream_feeds(feeds)
+        return feeds
+
+    def stream_feeds(self, feeds: Union[FeedQueue, List[Feed]]) -> None:
+        """
+        Lists the feeds of all users in parallel and adds each user's feeds
+        to the queue as soon as they arrive. Users whose feeds can not be
+        listed are skipped, or keep their cached feeds if the feed list
+        cache is enabled
+        """
+        if self.feed_cache is not None and self.feed_cache.is_fresh():
+            count = extend_in_batches(
+                feeds, self.owned_feeds(self.feed_cache.replay()))
+            self.logger.info('Received %d feeds to update from the cached '
+                             'feed list', count)
+            return
+        self.logger.info('Running get user list command: %s',
                          ' '.join(self.api.users_list_command))
-        users_json = self.cli.run(self.api.users_list_command).strip()
-        users_json = str(users_json, 'utf-8')
-        users = self.api.parse_users(users_json)
-
-        feeds_list = []
-        for userID in users:
-            self.logger.info('Running get feeds for user "%s" command: %s' %
-                             (userID, ' '.join(self.api.all_feeds_command)))
-            cmd = self.api.all_feeds_command + [userID]
-            feeds_json_bytes = self.cli.run(cmd).strip()
-            feeds_json = str(feeds_json_bytes, 'utf-8')
-            self.logger.info('Received these feeds to update for user %s: %s' %
-                             (userID, feeds_json))
-            feeds_list += self.api.parse_feeds(feeds_json, userID)
-
-        return feeds_list
+        users = self.api.iter_users(
+            self.cli.stream(self.api.users_list_command))
+
+        from concurrent.futures import ThreadPoolExecutor
+        listed = []  # type: List[str]
+        results = []  # type: List[Any]
+        with ThreadPoolExecutor(max_workers=self.config.threads) as executor:
+            for userID in users:
+                listed.append(userID)
+                results.append(executor.submit(self._list_user_feeds, feeds,
+                                               userID))
+        # users whose feeds could not be listed are listed again in the next
+        # run instead of using their cached feeds until the next refresh
+        if self.feed_cache is not None and \
+                all(result.result() for result in results):
+            self.feed_cache.refreshed(listed)
+
+    def _list_user_feeds(self, feeds: Union[FeedQueue, List[Feed]],
+                         userID: str) -> bool:
+        """
+        Adds the feeds of a user to the queue and returns whether they could
+        be listed
+        """
+        cmd = self.api.all_feeds_command + [userID]
+        self.logger.info('Running get feeds for user "%s" command: %s', userID,
+                         ' '.join(cmd))
+        try:
+            chunks = self.cli.stream(cmd)
+            if self.feed_cache is None:
+                user_feeds = self.api.iter_feeds(chunks, userID)
+            else:
+                user_feeds = self.feed_cache.store(
+                    userID, chunks,
+                    lambda chunks: self.api.iter_feeds(chunks, userID))
+            user_feeds = self.owned_feeds(user_feeds)
+            count = extend_in_batches(feeds, user_feeds)
+            self.logger.info('Received %d feeds to update for user %s', count,
+                             userID)
+            return True
+        except CalledProcessError as e:
+            self.logger.error('Could not list feeds of user %s: %s', userID,
+                              format_command_error(cmd, e))
+        except Exception as e:
+            self.logger.error('Could not list feeds of user %s: %s', userID, e)
+        return False
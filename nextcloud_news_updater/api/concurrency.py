@@ -0,0 +1,107 @@
+import threading
+from collections import deque
+from typing import List, Optional
+from urllib.error import HTTPError
+
+from nextcloud_news_updater.common.deadline import is_timeout
+from nextcloud_news_updater.config import Config
+
+# smallest number of finished updates after which the limit is adjusted
+MIN_WINDOW = 10
+# number of windows whose mean update duration is considered for the baseline
+BASELINE_WINDOWS = 100
+
+
+def is_overload(error: Optional[Exception]) -> bool:
+    """
+    Returns whether a failed update hints at an overloaded Nextcloud:
+    timeouts and server errors do, errors of single feeds (e.g. a feed
+    host which is down) do not
+    """
+    if error is None:
+        return False
+    cause = error.__cause__ or error
+    if isinstance(cause, HTTPError):
+        return cause.code >= 500
+    return is_timeout(cause)
+
+
+class AimdController:
+    """
+    Adjusts the number of parallel updates between floor and ceiling using
+    additive increase and multiplicative decrease: after every window of
+    finished updates the limit grows by one, unless the mean update
+    duration exceeded tolerance times the baseline duration or too many
+    updates timed out or hit server errors, in which case the limit is
+    multiplied by decrease.
+    The baseline is the lowest mean duration of the last windows. Halving
+    the limit brings the load back below the point where updates start to
+    slow down, so the baseline is measured again in every cycle and follows
+    feeds which become slower for good
+    """
+
+    def __init__(self, floor: int, ceiling: int, initial: int,
+                 tolerance: float = 2.0, max_error_rate: float = 0.05,
+                 decrease: float = 0.5) -> None:
+        self.floor = floor
+        self.ceiling = ceiling
+        self.limit = max(floor, min(ceiling, initial))
+        self.tolerance = tolerance
+        self.max_error_rate = max_error_rate
+        self.decrease = decrease
+        self.increases = 0
+        self.decreases = 0
+        self._means = deque(maxlen=BASELINE_WINDOWS)  # type: deque
+        self._durations = []  # type: List[float]
+        self._overloads = 0
+        self._lock = threading.Lock()
+
+    @property
+    def baseline(self) -> Optional[float]:
+        return min(self._means) if self._means else None
+
+    def record(self, duration: float, error: Optional[Exception]) -> int:
+        """
+        Records a finished update and returns the current limit
+        """
+        with self._lock:
+            self._durations.append(duration)
+            if is_overload(error):
+                self._overloads += 1
+            if len(self._durations) >= max(MIN_WINDOW, self.limit):
+                self._adjust()
+            return self.limit
+
+    def resize(self, ceiling: int) -> int:
+        """
+        Changes the highest limit, e.g. when the number of update threads is
+        changed at runtime, and returns the current limit
+        """
+        with self._lock:
+            self.ceiling = ceiling
+            self.floor = min(self.floor, ceiling)
+            self.limit = min(self.limit, ceiling)
+            return self.limit
+
+    def _adjust(self) -> None:
+        mean = sum(self._durations) / len(self._durations)
+        error_rate = self._overloads / len(self._durations)
+        self._durations = []
+        self._overloads = 0
+        self._means.append(mean)
+        if error_rate > self.max_error_rate or \
+                mean > self.baseline * self.tolerance:
+            limit = max(self.floor, int(self.limit * self.decrease))
+            if limit < self.limit:
+                self.decreases += 1
+            self.limit = limit
+        elif self.limit < self.ceiling:
+            self.limit += 1
+            self.increases += 1
+
+
+def create_concurrency_controller(config: Config) -> Optional[AimdController]:
+    if config.maxthreads <= 0:
+        return None
+    return AimdController(config.minthreads, config.maxthreads,
+                          config.threads)
@@ -0,0 +1,120 @@
+import time
+from typing import Any, Dict, List, Optional, Set, Tuple
+
+from nextcloud_news_updater.api.api import Feed
+from nextcloud_news_updater.api.metrics import error_class
+from nextcloud_news_updater.config import Config
+
+COMMANDS = ('status', 'run', 'update', 'resize', 'drain')
+
+
+class ControlError(Exception):
+    """
+    Raised if a command of the control socket can not be carried out, the
+    message is sent back to the client
+    """
+    pass
+
+
+class UpdaterControl:
+    """
+    Carries out the commands which are sent to the control socket of a
+    running updater: status, run, update, resize and drain. Feeds which
+    should be updated are given by their id and looked up in the queue of
+    the current or last run, or given as id and user id
+    """
+
+    def __init__(self, updater: Any) -> None:
+        self.updater = updater
+
+    def handle(self, request: Dict[str, Any]) -> Dict[str, Any]:
+        command = request.get('command')
+        if command not in COMMANDS:
+            raise ControlError('Unknown command: %s' % command)
+        return getattr(self, command)(request)
+
+    def status(self, request: Dict[str, Any]) -> Dict[str, Any]:
+        updater = self.updater
+        queue = updater.queue
+        now = time.monotonic()
+        status = {
+            'mode': updater.config.mode,
+            'threads': updater.config.threads,
+            'phases': {name: now - start for name, start
+                       in list(updater.phases.items())},
+            'next_run': updater.next_run,
+            'last_run': updater.last_run,
+            'draining': updater.draining,
+        }  # type: Dict[str, Any]
+        if queue is not None:
+            status.update(queued=len(queue), in_flight=queue.in_flight,
+                          completed=queue.completed, failures=queue.failures,
+                          timeouts=queue.timeouts)
+        return status
+
+    def run(self, request: Dict[str, Any]) -> Dict[str, Any]:
+        if self.updater.draining:
+            raise ControlError('The updater is being drained')
+        if not self.updater.trigger_run():
+            raise ControlError('The updater is not waiting for a run')
+        return {'refresh': self.updater.config.mode == 'continuous'}
+
+    def update(self, request: Dict[str, Any]) -> Dict[str, Any]:
+        feeds = request.get('feeds')
+        if not isinstance(feeds, list) or not feeds:
+            raise ControlError('No feeds given')
+        found, unknown = self.find_feeds(feeds)
+        results = []
+        for feed, duration, error in self.updater.update_now(found):
+            results.append({
+                'id': feed.feed_id,
+                'user': feed.user_id,
+                'duration': duration,
+                'error': None if error is None else error_class(error),
+            })
+        return {'updated': results, 'unknown': unknown}
+
+    def resize(self, request: Dict[str, Any]) -> Dict[str, Any]:
+        threads = request.get('threads')
+        if not isinstance(threads, int) or threads <= 0:
+            raise ControlError('Number of threads must be positive')
+        self.updater.resize(threads)
+        return {'threads': threads}
+
+    def drain(self, request: Dict[str, Any]) -> Dict[str, Any]:
+        return {'dropped': self.updater.drain()}
+
+    def find_feeds(self, feeds: List[Any]) -> Tuple[List[Feed], List[int]]:
+        """
+        Returns the feeds for a list of feed ids or [id, user id] pairs and
+        the ids which are not in the queue of the current or last run
+        """
+        found = []  # type: List[Feed]
+        wanted = set()  # type: Set[int]
+        for feed in feeds:
+            if isinstance(feed, list) and len(feed) == 2:
+                found.append(Feed(int(feed[0]), str(feed[1])))
+            elif isinstance(feed, int):
+                wanted.add(feed)
+            else:
+                raise ControlError('Invalid feed: %s' % feed)
+        queue = self.updater.queue
+        if wanted and queue is not None:
+            table = queue.table
+            for index, feed_id in enumerate(table.feed_ids):
+                if feed_id in wanted:
+                    wanted.remove(feed_id)
+                    found.append(table[index])
+                    if not wanted:
+                        break
+        return found, sorted(wanted)
+
+
+def create_control_server(config: Config, updater: Any) -> Optional[Any]:
+    if not config.controlsocket:
+        return None
+    from nextcloud_news_updater.common.controlserver import ControlServer
+    server = ControlServer(config.controlsocket,
+                           UpdaterControl(updater).handle)
+    server.start()
+    return server
@@ -0,0 +1,195 @@
+import json
+import os
+import threading
+import time
+from typing import Callable, Dict, Iterable, Iterator, Optional
+
+from nextcloud_news_updater.api.api import Feed
+from nextcloud_news_updater.api.feedtable import FeedTable
+from nextcloud_news_updater.config import Config
+
+# key of the list which holds all feeds if the feed list is not fetched per
+# user
+ALL_FEEDS = ''
+
+
+class CachedList:
+    """
+    Feeds of one feed list response together with the hash of the response
+    and the validators which were sent with it
+    """
+    __slots__ = ('table', 'digest', 'etag', 'last_modified')
+
+    def __init__(self, table: FeedTable, digest: str,
+                 etag: Optional[str] = None,
+                 last_modified: Optional[str] = None) -> None:
+        self.table = table
+        self.digest = digest
+        self.etag = etag
+        self.last_modified = last_modified
+
+    def to_json(self) -> dict:
+        return {'digest': self.digest, 'etag': self.etag,
+                'lastModified': self.last_modified,
+                'feeds': self.table.to_json()}
+
+    @staticmethod
+    def from_json(data: dict) -> 'CachedList':
+        return CachedList(FeedTable.from_json(data['feeds']), data['digest'],
+                          data['etag'], data['lastModified'])
+
+
+class FeedListCache:
+    """
+    Keeps the last received feed lists so that they do not have to be
+    downloaded and parsed again in every run. The full feed list is fetched
+    again every refresh seconds, in between the web updater sends
+    conditional requests and the console updater reuses the cached lists.
+    Responses are hashed so that unchanged lists are recognized even if the
+    server ignores the validators. The lists are stored in the state
+    directory so that a restart does not need to list the feeds again
+    """
+
+    def __init__(self, path: Optional[str], source: str, refresh: float,
+                 clock: Callable[[], float] = time.time) -> None:
+        self.path = path
+        # identifies the Nextcloud instance and API, a cache for another one
+        # is discarded
+        self.source = source
+        self.refresh = refresh
+        self.clock = clock
+        self.refreshed_at = 0.0
+        self.lists = {}  # type: Dict[str, CachedList]
+        self.changed = False
+        self._lock = threading.Lock()
+
+    def is_fresh(self) -> bool:
+        """
+        Whether the cached lists may be used instead of listing the feeds
+        again
+        """
+        return bool(self.lists) and \
+            self.clock() < self.refreshed_at + self.refresh
+
+    def validators(self, key: str) -> Dict[str, str]:
+        """
+        Returns the headers for a conditional request of a cached list
+        """
+        with self._lock:
+            cached = self.lists.get(key)
+        headers = {}  # type: Dict[str, str]
+        if cached is not None:
+            if cached.etag is not None:
+                headers['If-None-Match'] = cached.etag
+            if cached.last_modified is not None:
+                headers['If-Modified-Since'] = cached.last_modified
+        return headers
+
+    def replay(self, key: Optional[str] = None,
+               verified: bool = False) -> Iterator[Feed]:
+        """
+        Yields the cached feeds of a list or of all lists if key is None.
+        Unless the server verified that the list did not change, the
+        modification times are left out because they might be outdated and
+        would make the scheduler back off from feeds which changed
+        """
+        with self._lock:
+            if key is None:
+                tables = [cached.table for cached in self.lists.values()]
+            else:
+                tables = [self.lists[key].table]
+        for table in tables:
+            for feed in table:
+                if not verified:
+                    feed.last_modified = None
+                yield feed
+
+    def store(self, key: str, chunks: Iterable[bytes],
+              parse: Callable[[Iterable[bytes]], Iterator[Feed]],
+              etag: Optional[str] = None,
+              last_modified: Optional[str] = None,
+              refresh: bool = False) -> Iterator[Feed]:
+        """
+        Yields the feeds which parse returns for the response chunks and
+        caches them once the response was parsed completely. If refresh is
+        True the list is a full refresh, which is only marked as refreshed
+        once the whole list arrived so that a failed listing is repeated in
+        the next run
+        """
+        import hashlib
+        digest = hashlib.sha256()
+
+        def hashed() -> Iterator[bytes]:
+            for chunk in chunks:
+                digest.update(chunk)
+                yield chunk
+
+        table = FeedTable()
+        for feed in parse(hashed()):
+            table.append(feed)
+            yield feed
+        cached = CachedList(table, digest.hexdigest(), etag, last_modified)
+        with self._lock:
+            previous = self.lists.get(key)
+            # an unchanged list does not need to be written to disk again
+            if previous is None or previous.digest != cached.digest or \
+                    previous.etag != etag or \
+                    previous.last_modified != last_modified:
+                self.lists[key] = cached
+                self.changed = True
+        if refresh:
+            self.refreshed()
+
+    def refreshed(self, keys: Optional[Iterable[str]] = None) -> None:
+        """
+        Marks the end of a successful full refresh and drops the cached
+        lists which are not in keys, e.g. the ones of deleted users
+        """
+        with self._lock:
+            if keys is not None:
+                keys = set(keys)
+                for key in list(self.lists):
+                    if key not in keys:
+                        del self.lists[key]
+            self.refreshed_at = self.clock()
+            self.changed = True
+
+    def load(self) -> None:
+        if self.path is None:
+            return
+        try:
+            with open(self.path, 'r') as infile:
+                data = json.load(infile)
+        except FileNotFoundError:
+            return
+        if data['source'] != self.source:
+            return
+        with self._lock:
+            self.refreshed_at = data['refreshedAt']
+            self.lists = {key: CachedList.from_json(values)
+                          for key, values in data['lists'].items()}
+
+    def save(self) -> None:
+        if self.path is None or not self.changed:
+            return
+        with self._lock:
+            data = {'source': self.source, 'refreshedAt': self.refreshed_at,
+                    'lists': {key: cached.to_json()
+                              for key, cached in self.lists.items()}}
+            self.changed = False
+        tmp_path = self.path + '.tmp'
+        with open(tmp_path, 'w') as outfile:
+            json.dump(data, outfile, separators=(',', ':'))
+        os.replace(tmp_path, self.path)
+
+
+def create_feed_list_cache(config: Config) -> Optional[FeedListCache]:
+    if config.feedlistrefresh <= 0:
+        return None
+    path = None
+    if config.statedir:
+        path = os.path.join(config.statedir, 'feeds.json')
+    cache = FeedListCache(path, '%s %s' % (config.apilevel, config.url),
+                          config.feedlistrefresh)
+    cache.load()
+    return cache
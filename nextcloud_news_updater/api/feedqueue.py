@@ -0,0 +1,522 @@
+import heapq
+import threading
+import time
+from array import array
+from collections import OrderedDict
+from typing import Any, Callable, Dict, Iterable, List, Optional, Tuple
+
+from nextcloud_news_updater.api.api import Feed
+from nextcloud_news_updater.api.breaker import CircuitBreaker
+from nextcloud_news_updater.api.budget import BudgetShare
+from nextcloud_news_updater.api.feedtable import FeedTable, \
+    NO_MODIFICATION_TIME
+from nextcloud_news_updater.api.scheduler import FeedScheduler
+from nextcloud_news_updater.common.deadline import is_timeout
+from nextcloud_news_updater.config import Config
+
+AcceptCallback = Callable[[Feed], bool]
+FinishedCallback = Callable[[Feed, float, Optional[Exception]], None]
+
+# number of received feeds which are added to a queue at once
+BATCH_SIZE = 500
+
+# states of the feeds in a ContinuousFeedQueue
+QUEUED = 0
+IN_FLIGHT = 1
+REMOVED = 2
+
+
+class QueueWait:
+    """
+    Time the feeds of a single user spent waiting in the queue
+    """
+    __slots__ = ('count', 'total', 'max')
+
+    def __init__(self) -> None:
+        self.count = 0
+        self.total = 0.0
+        self.max = 0.0
+
+    def add(self, seconds: float) -> None:
+        self.count += 1
+        self.total += seconds
+        self.max = max(self.max, seconds)
+
+
+class FeedQueue:
+    """
+    Thread safe queue of feeds which are waiting to be updated. Feeds can be
+    added while the update threads are already working on the queue: pop
+    blocks until a feed is available and raises an IndexError once the
+    queue was closed and all feeds were handed out.
+    Feeds for which accept returns False are dropped when they are added,
+    the finished callback is called by the update threads once a feed was
+    updated. Queued feeds are kept in a FeedTable and referenced by their
+    index. If the queue has a budget share, pop waits for a slot of the
+    budget after taking a feed and done gives the slot back
+    """
+
+    def __init__(self, accept: Optional[AcceptCallback] = None,
+                 finished: Optional[FinishedCallback] = None) -> None:
+        self.accept = accept
+        self.finished = finished
+        self.skipped = 0
+        # feeds which were handed out by pop and are not done yet
+        self.in_flight = 0
+        # maximum number of feeds in flight, 0 means unlimited
+        self.limit = 0
+        self.completed = 0
+        self.failures = 0
+        # updates which failed because they ran into their timeout
+        self.timeouts = 0
+        self.waits = {}  # type: Dict[str, QueueWait]
+        self.table = FeedTable()
+        self.budget = None  # type: Optional[BudgetShare]
+        self._size = 0
+        self._next = 0
+        self._closed = False
+        self._drained = False
+        self._condition = threading.Condition()
+        # replaced by the simulator which runs the queue in simulated time
+        self.clock = time.monotonic  # type: Callable[[], float]
+        self._paused_until = 0.0
+
+    def put(self, feed: Feed) -> None:
+        self.extend([feed])
+
+    def extend(self, feeds: Iterable[Feed]) -> None:
+        accepted = []
+        skipped = 0
+        for feed in feeds:
+            if self.accept is None or self.accept(feed):
+                accepted.append(feed)
+            else:
+                skipped += 1
+        with self._condition:
+            if self._drained:
+                return
+            now = self.clock()
+            self.skipped += skipped
+            for feed in accepted:
+                self._add(feed, now)
+            self._condition.notify_all()
+
+    def close(self) -> None:
+        """
+        Signals that no more feeds will be added
+        """
+        with self._condition:
+            self._closed = True
+            self._condition.notify_all()
+
+    def drain(self) -> int:
+        """
+        Closes the queue and drops the feeds which were not handed out yet,
+        feeds which are added afterwards are ignored. Returns the number of
+        dropped feeds
+        """
+        with self._condition:
+            dropped = self._size
+            self._size = 0
+            self._drained = True
+            self._closed = True
+            self._condition.notify_all()
+        return dropped
+
+    def pop(self) -> Feed:
+        with self._condition:
+            while True:
+                feed = self._hand_out()
+                if feed is not None:
+                    break
+                if self._closed and self._size == 0:
+                    raise IndexError('pop from closed and empty feed queue')
+                paused = self._paused_until - self.clock()
+                self._condition.wait(paused if paused > 0
+                                     else self._wait_timeout())
+        if self.budget is not None:
+            self.budget.acquire()
+        return feed
+
+    def poll(self) -> Optional[Feed]:
+        """
+        Like pop but returns None instead of waiting if no feed may be handed
+        out right now. Does not take a slot of the budget
+        """
+        with self._condition:
+            if self._closed and self._size == 0:
+                raise IndexError('poll from closed and empty feed queue')
+            return self._hand_out()
+
+    def done(self, feed: Feed, duration: float,
+             error: Optional[Exception] = None) -> None:
+        """
+        Reports that a feed which was handed out by pop was updated
+        """
+        if self.budget is not None:
+            self.budget.release()
+        if self.finished is not None:
+            self.finished(feed, duration, error)
+        with self._condition:
+            self.in_flight -= 1
+            self.completed += 1
+            if error is not None:
+                self.failures += 1
+                if is_timeout(error):
+                    self.timeouts += 1
+            if self.limit > 0:
+                self._condition.notify()
+            self._release(feed)
+
+    def set_limit(self, limit: int) -> None:
+        """
+        Changes the maximum number of feeds which are updated at the same
+        time, 0 means unlimited
+        """
+        with self._condition:
+            if limit != self.limit:
+                self.limit = limit
+                self._condition.notify_all()
+
+    def pause(self, seconds: float) -> None:
+        """
+        Stops handing out feeds for the given number of seconds
+        """
+        with self._condition:
+            self._paused_until = max(self._paused_until,
+                                     self.clock() + seconds)
+
+    def wait_summary(self, limit: int = 10,
+                     reset: bool = False) -> List[Tuple[str, QueueWait]]:
+        """
+        Returns the users whose feeds waited longest in the queue and starts
+        over if reset is True
+        """
+        with self._condition:
+            waits = list(self.waits.items())
+            if reset:
+                self.waits = {}
+        waits.sort(key=lambda item: item[1].max, reverse=True)
+        return waits[:limit]
+
+    def _hand_out(self) -> Optional[Feed]:
+        """
+        Takes the next feed while holding the lock, None if no feed may be
+        handed out right now
+        """
+        if self._paused_until > self.clock() or self._size == 0 or \
+                self._limit_reached():
+            return None
+        index = self._take()
+        if index is None:
+            return None
+        self._size -= 1
+        self.in_flight += 1
+        feed = self.table[index]
+        wait = self.waits.get(feed.user_id)
+        if wait is None:
+            wait = self.waits[feed.user_id] = QueueWait()
+        wait.add(self.clock() - self.table.queued_at[index])
+        return feed
+
+    def _limit_reached(self) -> bool:
+        return 0 < self.limit <= self.in_flight
+
+    def _add(self, feed: Feed, now: float) -> None:
+        """
+        Adds an accepted feed while holding the lock
+        """
+        self._append(self.table.append(feed, now))
+        self._size += 1
+
+    def _append(self, index: int) -> None:
+        """
+        Called while holding the lock once a feed was added to the table
+        """
+        pass
+
+    def _take(self) -> Optional[int]:
+        """
+        Returns the table index of the next feed or None if no feed may be
+        handed out right now. Only called if the queue is not empty and
+        while holding the lock
+        """
+        index = self._next
+        self._next += 1
+        return index
+
+    def _release(self, feed: Feed) -> None:
+        """
+        Called while holding the lock once a feed was updated
+        """
+        pass
+
+    def _wait_timeout(self) -> Optional[float]:
+        """
+        Returns after how many seconds pop should check again for a feed
+        which can be handed out, None waits until the queue changes
+        """
+        return None
+
+    def __len__(self) -> int:
+        with self._condition:
+            return self._size
+
+
+class FairFeedQueue(FeedQueue):
+    """
+    Hands out the feeds of all users in turns so that a few users with
+    thousands of feeds do not occupy all update threads while everyone else
+    waits. If user_limit is greater than 0, no more than user_limit feeds of
+    the same user are updated at the same time
+    """
+
+    def __init__(self, accept: Optional[AcceptCallback] = None,
+                 finished: Optional[FinishedCallback] = None,
+                 user_limit: int = 0) -> None:
+        super().__init__(accept, finished)
+        self.user_limit = user_limit
+        # table indexes of the queued feeds and the position of the next
+        # one per user index, in the order the users get their next turn
+        self._users = OrderedDict()  # type: OrderedDict
+        self._in_flight = {}  # type: Dict[int, int]
+
+    def _append(self, index: int) -> None:
+        user = self.table.users[index]
+        queued = self._users.get(user)
+        if queued is None:
+            queued = self._users[user] = [array('q'), 0]
+        queued[0].append(index)
+
+    def _take(self) -> Optional[int]:
+        for user, queued in self._users.items():
+            in_flight = self._in_flight.get(user, 0)
+            if self.user_limit <= 0 or in_flight < self.user_limit:
+                break
+        else:
+            return None
+        indexes, position = queued
+        self._in_flight[user] = in_flight + 1
+        if position + 1 < len(indexes):
+            queued[1] = position + 1
+            self._users.move_to_end(user)
+        else:
+            del self._users[user]
+        return indexes[position]
+
+    def _release(self, feed: Feed) -> None:
+        user = self.table.user_index(feed.user_id)
+        in_flight = self._in_flight[user] - 1
+        if in_flight > 0:
+            self._in_flight[user] = in_flight
+        else:
+            del self._in_flight[user]
+        if self.user_limit > 0:
+            # threads might be waiting for this user's slot
+            self._condition.notify_all()
+
+
+class LongestFirstFeedQueue(FeedQueue):
+    """
+    Hands out the feeds with the longest predicted update duration first so
+    that slow feeds do not end up at the end of a run while most update
+    threads are already idle (longest processing time first scheduling).
+    Durations are predicted by the scheduler from previous runs, feeds
+    without a recorded duration are assumed to take as long as the known
+    feeds on average. Feeds which are added while the update threads are
+    already working are only ordered among the feeds which are still queued
+    """
+
+    def __init__(self, accept: Optional[AcceptCallback] = None,
+                 finished: Optional[FinishedCallback] = None,
+                 scheduler: Optional[FeedScheduler] = None) -> None:
+        super().__init__(accept, finished)
+        self.scheduler = scheduler
+        self.default_duration = 0.0
+        if scheduler is not None:
+            self.default_duration = scheduler.mean_duration() or 0.0
+        # (negated predicted duration, index) entries, ties are handed out
+        # in the order the feeds were listed
+        self._heap = []  # type: List[Tuple[float, int]]
+
+    def _append(self, index: int) -> None:
+        duration = None
+        if self.scheduler is not None:
+            duration = self.scheduler.predicted_duration(
+                self.table.feed_ids[index])
+        if duration is None:
+            duration = self.default_duration
+        heapq.heappush(self._heap, (-duration, index))
+
+    def _take(self) -> Optional[int]:
+        return heapq.heappop(self._heap)[1]
+
+
+class ContinuousFeedQueue(FeedQueue):
+    """
+    Queue for the continuous mode which is never drained: feeds are handed
+    out in the order of their due time and queued again once they were
+    updated, either at the due time of the scheduler or interval seconds
+    later. The feed list is refreshed by wrapping extend calls in
+    begin_refresh and end_refresh, known feeds keep their place and feeds
+    which were not listed again are dropped. Feeds which are quarantined
+    by the circuit breaker are queued at the end of their quarantine.
+    Every feed is stored once in the table whose queue time column holds
+    its due time, the heap contains (due time, index) entries. Entries of
+    feeds which were rescheduled or dropped are skipped when they reach the
+    top instead of being removed from the heap
+    """
+
+    def __init__(self, accept: Optional[AcceptCallback] = None,
+                 finished: Optional[FinishedCallback] = None,
+                 interval: float = 15 * 60,
+                 scheduler: Optional[FeedScheduler] = None,
+                 breaker: Optional[CircuitBreaker] = None,
+                 clock: Callable[[], float] = time.time) -> None:
+        super().__init__(accept, finished)
+        self.interval = interval
+        self.scheduler = scheduler
+        self.breaker = breaker
+        self.clock = clock
+        self._heap = []  # type: List[Tuple[float, int]]
+        self._indexes = {}  # type: Dict[int, int]
+        self._state = bytearray()
+        # number of the refresh in which a feed was listed last
+        self._listed = array('L')
+        self._refresh = 0
+
+    def begin_refresh(self) -> None:
+        with self._condition:
+            self._refresh += 1
+
+    def end_refresh(self) -> int:
+        """
+        Drops the feeds which were not added since begin_refresh was called
+        and returns their number
+        """
+        removed = 0
+        with self._condition:
+            for index, listed in enumerate(self._listed):
+                if listed != self._refresh and \
+                        self._state[index] != REMOVED:
+                    if self._state[index] == QUEUED:
+                        self._size -= 1
+                    self._state[index] = REMOVED
+                    removed += 1
+        return removed
+
+    def close(self) -> None:
+        with self._condition:
+            self._heap = []
+            self._size = 0
+            super().close()
+
+    def _add(self, feed: Feed, now: float) -> None:
+        due = 0.0
+        if self.scheduler is not None:
+            due = self.scheduler.listed(feed)
+        if self.breaker is not None:
+            due = max(due, self.breaker.quarantined_until(feed.feed_id))
+        index = self._indexes.get(feed.feed_id)
+        if index is None:
+            index = self.table.append(feed)
+            self._indexes[feed.feed_id] = index
+            self._state.append(REMOVED)
+            self._listed.append(self._refresh)
+        else:
+            self._listed[index] = self._refresh
+            last_modified = feed.last_modified
+            if last_modified is None:
+                last_modified = NO_MODIFICATION_TIME
+            self.table.last_modified[index] = last_modified
+        state = self._state[index]
+        if state == REMOVED:
+            self._size += 1
+            self._schedule(index, due or now)
+        elif state == QUEUED and due and due != self.table.queued_at[index]:
+            # the interval changed because the feed was modified
+            self._schedule(index, due)
+
+    def _schedule(self, index: int, due: float) -> None:
+        self._state[index] = QUEUED
+        self.table.queued_at[index] = due
+        heapq.heappush(self._heap, (due, index))
+
+    def _top(self) -> Optional[Tuple[float, int]]:
+        """
+        Returns the heap entry of the feed which is due next after dropping
+        outdated entries
+        """
+        heap = self._heap
+        while heap:
+            due, index = heap[0]
+            if self._state[index] == QUEUED and \
+                    self.table.queued_at[index] == due:
+                return heap[0]
+            heapq.heappop(heap)
+        return None
+
+    def _take(self) -> Optional[int]:
+        top = self._top()
+        if top is None or top[0] > self.clock():
+            return None
+        heapq.heappop(self._heap)
+        self._state[top[1]] = IN_FLIGHT
+        return top[1]
+
+    def _release(self, feed: Feed) -> None:
+        index = self._indexes[feed.feed_id]
+        if self._state[index] != IN_FLIGHT:
+            # dropped from the feed list during the update
+            return
+        if self._closed:
+            self._state[index] = REMOVED
+            return
+        due = 0.0
+        if self.scheduler is not None:
+            due = self.scheduler.due(feed.feed_id)
+        if self.breaker is not None:
+            due = max(due, self.breaker.quarantined_until(feed.feed_id))
+        self._size += 1
+        self._schedule(index, due or self.clock() + self.interval)
+        self._condition.notify_all()
+
+    def _wait_timeout(self) -> Optional[float]:
+        top = self._top()
+        if top is None:
+            return None
+        return max(0.0, top[0] - self.clock())
+
+
+def create_feed_queue(config: Config,
+                      accept: Optional[AcceptCallback] = None,
+                      finished: Optional[FinishedCallback] = None,
+                      scheduler: Optional[FeedScheduler] = None,
+                      breaker: Optional[CircuitBreaker] = None) \
+        -> FeedQueue:
+    if config.mode == 'continuous':
+        return ContinuousFeedQueue(accept, finished, config.interval,
+                                   scheduler, breaker)
+    if config.dispatch == 'fair':
+        return FairFeedQueue(accept, finished, config.userlimit)
+    if config.dispatch == 'longest':
+        return LongestFirstFeedQueue(accept, finished, scheduler)
+    return FeedQueue(accept, finished)
+
+
+def extend_in_batches(target: Any, feeds: Iterable[Feed],
+                      batch_size: int = BATCH_SIZE) -> int:
+    """
+    Adds feeds to a queue or list in batches while they are being received
+    and returns the number of added feeds
+    """
+    count = 0
+    batch = []  # type: List[Feed]
+    for feed in feeds:
+        batch.append(feed)
+        if len(batch) >= batch_size:
+            target.extend(batch)
+            count += len(batch)
+            batch = []
+    target.extend(batch)
+    return count + len(batch)
@@ -0,0 +1,91 @@
+from array import array
+from typing import Dict, Iterable, Iterator, List, Optional
+
+from nextcloud_news_updater.api.api import Feed
+
+# stored instead of None if the feed list did not contain the modification
+# time of a feed
+NO_MODIFICATION_TIME = -2 ** 63
+
+
+class FeedTable:
+    """
+    Compact storage for the feeds of a run. Instead of one object per feed
+    the feed ids, modification times and queue times are kept in arrays of
+    machine integers and floats, and every user id is stored only once and
+    referenced by its index. A feed takes 28 bytes this way, Feed objects
+    are only created for the feeds which are currently being updated
+    """
+
+    def __init__(self) -> None:
+        self.feed_ids = array('q')
+        self.users = array('i')
+        self.last_modified = array('q')
+        self.queued_at = array('d')
+        self.user_ids = []  # type: List[str]
+        self._user_indexes = {}  # type: Dict[str, int]
+
+    def append(self, feed: Feed, queued_at: float = 0.0) -> int:
+        """
+        Adds a feed and returns its index
+        """
+        user = self.user_index(feed.user_id)
+        last_modified = feed.last_modified
+        if last_modified is None:
+            last_modified = NO_MODIFICATION_TIME
+        self.feed_ids.append(feed.feed_id)
+        self.users.append(user)
+        self.last_modified.append(last_modified)
+        self.queued_at.append(queued_at)
+        return len(self.feed_ids) - 1
+
+    def extend(self, feeds: Iterable[Feed]) -> None:
+        for feed in feeds:
+            self.append(feed)
+
+    def user_index(self, user_id: str) -> int:
+        index = self._user_indexes.get(user_id)
+        if index is None:
+            index = self._user_indexes[user_id] = len(self.user_ids)
+            self.user_ids.append(user_id)
+        return index
+
+    def user_id(self, index: int) -> str:
+        """
+        Returns the user id of the feed at index
+        """
+        return self.user_ids[self.users[index]]
+
+    def __getitem__(self, index: int) -> Feed:
+        last_modified = self.last_modified[index]  # type: Optional[int]
+        if last_modified == NO_MODIFICATION_TIME:
+            last_modified = None
+        return Feed(self.feed_ids[index], self.user_id(index), last_modified)
+
+    def __iter__(self) -> Iterator[Feed]:
+        for index in range(len(self.feed_ids)):
+            yield self[index]
+
+    def __len__(self) -> int:
+        return len(self.feed_ids)
+
+    def to_json(self) -> dict:
+        """
+        Returns the feeds column by column, which is a lot faster to store
+        and load than one object per feed. Queue times are left out
+        """
+        return {'feedIds': self.feed_ids.tolist(),
+                'users': self.users.tolist(),
+                'lastModified': self.last_modified.tolist(),
+                'userIds': self.user_ids}
+
+    @staticmethod
+    def from_json(data: dict) -> 'FeedTable':
+        table = FeedTable()
+        table.feed_ids = array('q', data['feedIds'])
+        table.users = array('i', data['users'])
+        table.last_modified = array('q', data['lastModified'])
+        table.queued_at = array('d', bytes(8 * len(table.feed_ids)))
+        for user_id in data['userIds']:
+            table.user_index(user_id)
+        return table
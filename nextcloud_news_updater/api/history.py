@@ -0,0 +1,120 @@
+import threading
+import time
+from typing import List, Optional, Tuple
+
+from nextcloud_news_updater.api.api import Feed
+from nextcloud_news_updater.api.metrics import error_class
+from nextcloud_news_updater.config import Config
+
+# number of update records which are buffered before they are written
+FLUSH_SIZE = 1000
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS runs (
+    id INTEGER PRIMARY KEY,
+    mode TEXT NOT NULL,
+    started REAL NOT NULL,
+    finished REAL,
+    updates INTEGER NOT NULL DEFAULT 0,
+    failures INTEGER NOT NULL DEFAULT 0,
+    success INTEGER
+);
+CREATE TABLE IF NOT EXISTS updates (
+    run INTEGER NOT NULL REFERENCES runs (id),
+    feed_id INTEGER NOT NULL,
+    user_id TEXT NOT NULL,
+    started REAL NOT NULL,
+    duration REAL NOT NULL,
+    success INTEGER NOT NULL,
+    error TEXT
+);
+CREATE INDEX IF NOT EXISTS updates_run ON updates (run);
+"""
+
+
+class RunHistory:
+    """
+    Appends every feed update and a summary of every run to an SQLite
+    database which is read by the analyze command. Updates are buffered and
+    written in batches by the update thread which filled the buffer, without
+    holding the lock of the buffer, so that the other update threads keep
+    recording while it waits for the disk.
+    In the continuous mode every refresh of the feed list starts a new run
+    """
+
+    def __init__(self, path: str, mode: str) -> None:
+        self.path = path
+        self.mode = mode
+        self.run_id = None  # type: Optional[int]
+        self.updates = 0
+        self.failures = 0
+        self._buffer = []  # type: List[Tuple]
+        # guards the buffer and the counters, the connection has its own
+        # lock which is only held while writing
+        self._lock = threading.Lock()
+        self._write_lock = threading.Lock()
+        # only imported if the history is kept
+        import sqlite3
+        self._connection = sqlite3.connect(path, check_same_thread=False,
+                                           timeout=30)
+        self._connection.executescript(SCHEMA)
+
+    def begin_run(self) -> None:
+        with self._lock:
+            self.updates = 0
+            self.failures = 0
+        with self._write_lock:
+            with self._connection:
+                cursor = self._connection.execute(
+                    'INSERT INTO runs (mode, started) VALUES (?, ?)',
+                    (self.mode, time.time()))
+        self.run_id = cursor.lastrowid
+
+    def record(self, feed: Feed, duration: float,
+               error: Optional[Exception]) -> None:
+        entry = (self.run_id, feed.feed_id, feed.user_id,
+                 time.time() - duration, duration, error is None,
+                 None if error is None else error_class(error))
+        batch = None
+        with self._lock:
+            self._buffer.append(entry)
+            self.updates += 1
+            if error is not None:
+                self.failures += 1
+            if len(self._buffer) >= FLUSH_SIZE:
+                batch, self._buffer = self._buffer, []
+        if batch is not None:
+            with self._write_lock:
+                with self._connection:
+                    self._insert(batch)
+
+    def finish_run(self, success: bool) -> None:
+        with self._lock:
+            batch, self._buffer = self._buffer, []
+            updates, failures = self.updates, self.failures
+        with self._write_lock:
+            with self._connection:
+                self._insert(batch)
+                self._connection.execute(
+                    'UPDATE runs SET finished = ?, updates = ?, '
+                    'failures = ?, success = ? WHERE id = ?',
+                    (time.time(), updates, failures, success, self.run_id))
+
+    def close(self) -> None:
+        with self._lock:
+            batch, self._buffer = self._buffer, []
+        with self._write_lock:
+            with self._connection:
+                self._insert(batch)
+            self._connection.close()
+
+    def _insert(self, batch: List[Tuple]) -> None:
+        if batch:
+            self._connection.executemany(
+                'INSERT INTO updates VALUES (?, ?, ?, ?, ?, ?, ?)', batch)
+
+
+def create_run_history(config: Config) -> Optional[RunHistory]:
+    if not config.history:
+        return None
+    return RunHistory(config.history, config.mode)
@@ -0,0 +1,100 @@
+from typing import Optional
+
+from nextcloud_news_updater.api.feedqueue import FeedQueue
+from nextcloud_news_updater.common.deadline import is_timeout
+from nextcloud_news_updater.common.prometheus import Counter, Gauge, \
+    Histogram, Registry
+from nextcloud_news_updater.config import Config
+
+PREFIX = 'nextcloud_news_updater_'
+UPDATE_BUCKETS = (0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30, 60, 120, 300)
+
+
+def error_class(error: Exception) -> str:
+    """
+    Returns the name of the exception which caused a failed update, update
+    threads wrap errors which they already logged in FeedUpdateException
+    """
+    return type(error.__cause__ or error).__name__
+
+
+class UpdaterMetrics:
+    """
+    Metrics about the update runs which are served in the Prometheus text
+    format. Queue depth and updates in flight are read from the queue of
+    the current run when the metrics are scraped
+    """
+
+    def __init__(self) -> None:
+        self.registry = Registry()
+        self.queue = None  # type: Optional[FeedQueue]
+        register = self.registry.register
+        self.runs = register(Counter(
+            PREFIX + 'runs_total', 'Finished update runs', ['result']))
+        self.run_duration = register(Gauge(
+            PREFIX + 'run_duration_seconds', 'Duration of the last run'))
+        self.phase_duration = register(Gauge(
+            PREFIX + 'phase_duration_seconds',
+            'Duration of the phases of the last run', ['phase']))
+        self.update_duration = register(Histogram(
+            PREFIX + 'feed_update_duration_seconds',
+            'Duration of single feed updates', UPDATE_BUCKETS))
+        self.updates = register(Counter(
+            PREFIX + 'feed_updates_total', 'Finished feed updates',
+            ['result']))
+        self.failures = register(Counter(
+            PREFIX + 'feed_update_failures_total',
+            'Failed feed updates by error class', ['error']))
+        self.throttled = register(Counter(
+            PREFIX + 'throttled_seconds_total',
+            'Seconds which updates waited for the load of the host to drop, '
+            'added up over all update threads'))
+        self.concurrency_limit = register(Gauge(
+            PREFIX + 'concurrency_limit',
+            'Maximum number of parallel updates at the end of the last run'))
+        self.throughput = register(Gauge(
+            PREFIX + 'feeds_per_second',
+            'Feeds updated per second during the updates of the last run'))
+        register(Gauge(PREFIX + 'queue_depth',
+                       'Feeds waiting to be updated',
+                       callback=self._queue_depth))
+        register(Gauge(PREFIX + 'updates_in_flight',
+                       'Feeds which are currently being updated',
+                       callback=self._in_flight))
+
+    def feed_updated(self, duration: float,
+                     error: Optional[Exception]) -> None:
+        self.update_duration.observe(duration)
+        if error is None:
+            self.updates.inc('success')
+        else:
+            self.updates.inc('timeout' if is_timeout(error) else 'failure')
+            self.failures.inc(error_class(error))
+
+    def phase_finished(self, phase: str, duration: float) -> None:
+        self.phase_duration.set(duration, phase)
+        if phase == 'updates' and duration > 0 and self.queue is not None:
+            self.throughput.set(self.queue.completed / duration)
+
+    def run_finished(self, duration: float, success: bool) -> None:
+        self.runs.inc('success' if success else 'failure')
+        if success:
+            self.run_duration.set(duration)
+
+    def _queue_depth(self) -> int:
+        queue = self.queue
+        return 0 if queue is None else len(queue)
+
+    def _in_flight(self) -> int:
+        queue = self.queue
+        return 0 if queue is None else queue.in_flight
+
+
+def create_metrics(config: Config) -> Optional[UpdaterMetrics]:
+    if config.metricsport <= 0:
+        return None
+    from nextcloud_news_updater.common.metricsserver import MetricsServer
+    metrics = UpdaterMetrics()
+    MetricsServer(metrics.registry, config.metricsport,
+                  config.metricsaddress).start()
+    return metrics
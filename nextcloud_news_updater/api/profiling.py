@@ -0,0 +1,230 @@
+import io
+import os
+import sys
+import threading
+import time
+from collections import Counter, OrderedDict
+from typing import Any, Dict, List, Optional, Tuple
+
+from nextcloud_news_updater.config import Config
+
+# seconds between two samples of the sampling profiler
+SAMPLE_INTERVAL = 0.005
+# number of functions listed in the profiler output
+PROFILE_LIMIT = 40
+# cProfile is built on sys.monitoring from Python 3.12 on: only one profiler
+# may be active at a time and it sees the calls of all threads
+PROCESS_WIDE_CPROFILE = sys.version_info >= (3, 12)
+
+
+def child_cpu_time() -> float:
+    """
+    CPU time of the finished child processes, e.g. PHP processes started by
+    the console updater
+    """
+    times = os.times()
+    return times.children_user + times.children_system
+
+
+class CallProfiler:
+    """
+    Runs cProfile in the thread which starts it and in all threads which are
+    started afterwards. Before Python 3.12 each thread gets its own profile
+    which are merged in the output, later versions use a single profile for
+    the whole process
+    :raises ValueError on start if another profiler is already active
+    """
+
+    def __init__(self) -> None:
+        self.profiles = []  # type: List[Any]
+        self._lock = threading.Lock()
+
+    def start(self) -> None:
+        self._enable()
+        if not PROCESS_WIDE_CPROFILE:
+            threading.setprofile(self._start_thread)
+
+    def stop(self) -> None:
+        if not PROCESS_WIDE_CPROFILE:
+            threading.setprofile(None)
+        # profiles of threads which are still running keep collecting until
+        # the threads finish, their output covers the time until now
+        for profile in self.profiles:
+            profile.disable()
+
+    def format(self, limit: int) -> str:
+        import pstats
+        output = io.StringIO()
+        with self._lock:
+            profiles = list(self.profiles)
+        stats = pstats.Stats(*profiles, stream=output)
+        stats.sort_stats('cumulative').print_stats(limit)
+        return output.getvalue()
+
+    def _start_thread(self, *args: Any) -> None:
+        sys.setprofile(None)
+        self._enable()
+
+    def _enable(self) -> None:
+        import cProfile
+        profile = cProfile.Profile()
+        with self._lock:
+            self.profiles.append(profile)
+        profile.enable()
+
+
+class SamplingProfiler(threading.Thread):
+    """
+    Looks at the stacks of all threads every interval seconds. Much cheaper
+    than cProfile because nothing is traced between two samples, but
+    functions which run shorter than the interval are only caught
+    statistically
+    """
+
+    def __init__(self, interval: float = SAMPLE_INTERVAL) -> None:
+        super().__init__(daemon=True)
+        self.interval = interval
+        self.samples = 0
+        # samples in which a function was running and in which it was on the
+        # stack, e.g. waiting for a function it called
+        self.own = Counter()  # type: Counter
+        self.total = Counter()  # type: Counter
+        self._stopped = threading.Event()
+
+    def run(self) -> None:
+        ident = threading.get_ident()
+        while not self._stopped.wait(self.interval):
+            for thread, frame in sys._current_frames().items():
+                if thread != ident:
+                    self._sample(frame)
+
+    def stop(self) -> None:
+        self._stopped.set()
+        self.join()
+
+    def format(self, limit: int) -> str:
+        lines = ['%d samples every %.0f ms' % (self.samples,
+                                               self.interval * 1000)]
+        for title, counts in (('own', self.own), ('total', self.total)):
+            lines.append('')
+            lines.append('%8s  %6s  function' % ('samples', title + ' %'))
+            for location, count in counts.most_common(limit):
+                lines.append('%8d  %6.1f  %s' % (
+                    count, 100 * count / max(1, self.samples), location))
+        return '\n'.join(lines) + '\n'
+
+    def _sample(self, frame: Any) -> None:
+        self.samples += 1
+        self.own[self._location(frame)] += 1
+        seen = set()
+        while frame is not None:
+            location = self._location(frame)
+            if location not in seen:
+                seen.add(location)
+                self.total[location] += 1
+            frame = frame.f_back
+
+    def _location(self, frame: Any) -> str:
+        code = frame.f_code
+        return '%s (%s:%d)' % (code.co_name, code.co_filename,
+                               code.co_firstlineno)
+
+
+class RunProfile:
+    """
+    Records the wall and CPU time of the phases of the update runs and how
+    long the update threads were busy and waiting for feeds, and appends a
+    report to a file after every run. The optional cProfile or sampling
+    profiler only runs until the first report is written.
+    In the continuous mode a report is written after every refresh of the
+    feed list, its phases cover the time since the previous report and the
+    worker times the time since the start
+    """
+
+    def __init__(self, path: str, profiler: str = 'none') -> None:
+        self.path = path
+        self.profiler = profiler
+        self.phases = OrderedDict()  # type: Dict[str, Tuple[float, ...]]
+        # objects with the name, busy, idle and updates attributes of the
+        # update threads
+        self.workers = []  # type: List[Any]
+        self._calls = None  # type: Any
+        self._profiled = False
+        self._lock = threading.Lock()
+
+    def begin(self) -> None:
+        with self._lock:
+            self.phases = OrderedDict()
+            self.workers = []
+        if self._profiled or self.profiler == 'none':
+            return
+        self._profiled = True
+        if self.profiler == 'cprofile':
+            self._calls = CallProfiler()
+            try:
+                self._calls.start()
+                return
+            except ValueError:
+                # another profiling tool is already active, which cProfile
+                # does not allow from Python 3.12 on
+                self.profiler = 'sampling'
+        self._calls = SamplingProfiler()
+        self._calls.start()
+
+    def phase_finished(self, name: str, wall: float, cpu: float,
+                       child_cpu: float) -> None:
+        with self._lock:
+            self.phases[name] = (wall, cpu, child_cpu)
+
+    def add_worker(self, worker: Any) -> None:
+        with self._lock:
+            self.workers.append(worker)
+
+    def write(self, title: str) -> None:
+        report = self.format(title)
+        with self._lock:
+            self.phases = OrderedDict()
+        if self._calls is not None:
+            self._calls.stop()
+            report += '\n--- %s ---\n%s' % (self.profiler,
+                                            self._calls.format(PROFILE_LIMIT))
+            self._calls = None
+        with open(self.path, 'a') as outfile:
+            outfile.write(report + '\n')
+
+    def format(self, title: str) -> str:
+        lines = ['=== %s at %s ===' % (
+            title, time.strftime('%Y-%m-%d %H:%M:%S'))]
+        lines.append('%-16s %10s %10s %12s' % (
+            'phase', 'wall s', 'cpu s', 'child cpu s'))
+        with self._lock:
+            phases = list(self.phases.items())
+            workers = list(self.workers)
+        for name, (wall, cpu, child_cpu) in phases:
+            lines.append('%-16s %10.3f %10.3f %12.3f' % (name, wall, cpu,
+                                                         child_cpu))
+        if workers:
+            lines.append('')
+            lines.append('%-16s %10s %10s %10s %7s' % (
+                'worker', 'updates', 'busy s', 'idle s', 'busy %'))
+            busy = idle = updates = 0.0
+            for worker in workers:
+                lines.append(self._format_worker(
+                    worker.name, worker.updates, worker.busy, worker.idle))
+                busy += worker.busy
+                idle += worker.idle
+                updates += worker.updates
+            lines.append(self._format_worker('total', updates, busy, idle))
+        return '\n'.join(lines) + '\n'
+
+    def _format_worker(self, name: str, updates: float, busy: float,
+                       idle: float) -> str:
+        share = 100 * busy / (busy + idle) if busy + idle > 0 else 0
+        return '%-16s %10d %10.3f %10.3f %7.1f' % (
+            name, updates, busy, idle, share)
+
+
+def create_run_profile(config: Config) -> Optional[RunProfile]:
+    if not config.profile:
+        return None
+    return RunProfile(config.profile, config.profiler)
@@ -0,0 +1,158 @@
+import os
+import threading
+import time
+from typing import Callable, List, Optional
+
+from nextcloud_news_updater.config import Config
+
+# I/O scheduling classes of the ionice command
+IONICE_CLASSES = {'besteffort': 2, 'idle': 3}
+# seconds between two checks of the load while new PHP processes are held
+# back, readings are reused for this long
+CHECK_INTERVAL = 5
+
+
+def available_memory() -> Optional[int]:
+    """
+    Returns the bytes of memory which are available for new processes
+    without swapping, None if the system does not tell
+    """
+    try:
+        with open('/proc/meminfo', 'r') as infile:
+            for line in infile:
+                if line.startswith('MemAvailable:'):
+                    return int(line.split()[1]) * 1024
+    except OSError:
+        pass
+    return None
+
+
+def load_average() -> Optional[float]:
+    try:
+        return os.getloadavg()[0]
+    except OSError:
+        return None
+
+
+class ProcessPolicy:
+    """
+    Priority and resource limits of the PHP processes so that they do not
+    slow down the web frontend on the same host. The I/O priority is set by
+    starting PHP with the ionice command, the niceness and the limits are
+    set right after the process was started because preexec_fn is not safe
+    in a program with threads
+    """
+
+    def __init__(self, nice: int = 0, ionice: str = 'none',
+                 memory: int = 0, cpu: int = 0) -> None:
+        self.nice = nice
+        self.ionice = ionice
+        # limit of the address space in bytes and of the CPU time in
+        # seconds, 0 means unlimited
+        self.memory = memory
+        self.cpu = cpu
+
+    def wrap(self, command: List[str]) -> List[str]:
+        if self.ionice == 'none':
+            return command
+        return ['ionice', '-c', str(IONICE_CLASSES[self.ionice])] + command
+
+    def apply(self, pid: int) -> None:
+        try:
+            # the niceness is inherited and may only be raised
+            if self.nice > os.getpriority(os.PRIO_PROCESS, pid):
+                os.setpriority(os.PRIO_PROCESS, pid, self.nice)
+            if self.memory > 0 or self.cpu > 0:
+                import resource
+                if self.memory > 0:
+                    resource.prlimit(pid, resource.RLIMIT_AS,
+                                     (self.memory, self.memory))
+                if self.cpu > 0:
+                    resource.prlimit(pid, resource.RLIMIT_CPU,
+                                     (self.cpu, self.cpu))
+        except ProcessLookupError:
+            # the process already exited
+            pass
+
+
+class HostThrottle:
+    """
+    Holds back new PHP processes while the host is busy: while the load
+    average of the last minute is above max_load or less than min_memory
+    bytes of memory are available. 0 disables a threshold. The readings are
+    shared by all update threads and taken at most every interval seconds.
+    The time the update threads spent waiting is added up
+    """
+
+    def __init__(self, max_load: float, min_memory: int,
+                 interval: float = CHECK_INTERVAL,
+                 clock: Callable[[], float] = time.monotonic,
+                 load: Callable[[], Optional[float]] = load_average,
+                 memory: Callable[[], Optional[int]] = available_memory) \
+            -> None:
+        self.max_load = max_load
+        self.min_memory = min_memory
+        self.interval = interval
+        self.clock = clock
+        self.load = load
+        self.memory = memory
+        self.throttled = 0.0
+        self._checked_at = None  # type: Optional[float]
+        self._busy = False
+        self._lock = threading.Lock()
+
+    def delay(self) -> float:
+        """
+        Returns how long to wait until the load is checked again, 0 if a
+        process may be started right away
+        """
+        now = self.clock()
+        with self._lock:
+            if self._checked_at is None or \
+                    now - self._checked_at >= self.interval:
+                self._checked_at = now
+                self._busy = self._is_busy()
+            if not self._busy:
+                return 0
+            delay = self._checked_at + self.interval - now
+            self.throttled += delay
+            return delay
+
+    def wait(self) -> None:
+        """
+        Blocks until a process may be started
+        """
+        delay = self.delay()
+        while delay > 0:
+            time.sleep(delay)
+            delay = self.delay()
+
+    def reset(self) -> float:
+        """
+        Returns the seconds spent waiting since the last reset
+        """
+        with self._lock:
+            throttled, self.throttled = self.throttled, 0.0
+        return throttled
+
+    def _is_busy(self) -> bool:
+        if self.max_load > 0:
+            load = self.load()
+            if load is not None and load > self.max_load:
+                return True
+        if self.min_memory > 0:
+            memory = self.memory()
+            if memory is not None and memory < self.min_memory:
+                return True
+        return False
+
+
+def create_process_policy(config: Config) -> ProcessPolicy:
+    return ProcessPolicy(config.nice, config.ionice,
+                         config.phpmemory * 1024 * 1024, config.phpcpu)
+
+
+def create_host_throttle(config: Config) -> Optional[HostThrottle]:
+    if config.maxload <= 0 and config.minfreememory <= 0:
+        return None
+    return HostThrottle(config.maxload, config.minfreememory * 1024 * 1024)
@@ -0,0 +1,185 @@
+import json
+import os
+import threading
+import time
+from typing import Callable, Dict, Optional
+
+from nextcloud_news_updater.api.api import Feed
+from nextcloud_news_updater.config import Config
+
+
+class FeedRecord:
+    """
+    Update history of a single feed
+    """
+    __slots__ = ('interval', 'last_update', 'duration', 'failures',
+                 'last_modified', 'updated')
+
+    def __init__(self, interval: float) -> None:
+        self.interval = interval
+        self.last_update = 0.0
+        self.duration = None  # type: Optional[float]
+        self.failures = 0
+        self.last_modified = None  # type: Optional[int]
+        # whether the feed was updated successfully since it was last listed
+        self.updated = False
+
+    def to_json(self) -> list:
+        return [self.interval, self.last_update, self.duration,
+                self.failures, self.last_modified, self.updated]
+
+    @staticmethod
+    def from_json(values: list) -> 'FeedRecord':
+        record = FeedRecord(values[0])
+        record.last_update, record.duration, record.failures, \
+            record.last_modified, record.updated = values[1:]
+        return record
+
+
+class FeedScheduler:
+    """
+    Decides which feeds are due for an update based on their history. Every
+    feed has its own update interval between min_interval and max_interval:
+    feeds which changed since their last update are updated twice as often,
+    unchanged feeds back off by 50% and failing feeds by 100%. Feeds are only
+    known to have changed if the feed list contains their modification time,
+    otherwise failing feeds back off until their next successful update
+    which resets the interval to min_interval.
+    Feeds are considered due if they become due within slack seconds, which
+    should be half of the interval between two runs so that feeds are updated
+    in the run closest to their due time.
+    If adaptive is False, all feeds are always due and only the durations of
+    the updates are recorded, e.g. to order the feeds by their duration
+    """
+
+    def __init__(self, path: str, min_interval: float, max_interval: float,
+                 slack: float = 0,
+                 clock: Callable[[], float] = time.time,
+                 adaptive: bool = True) -> None:
+        self.path = path
+        self.min_interval = min_interval
+        self.max_interval = max_interval
+        self.slack = slack
+        self.clock = clock
+        self.adaptive = adaptive
+        self.records = {}  # type: Dict[int, FeedRecord]
+        self._lock = threading.Lock()
+
+    def is_due(self, feed: Feed) -> bool:
+        if not self.adaptive:
+            return True
+        return self.listed(feed) <= self.clock() + self.slack
+
+    def listed(self, feed: Feed) -> float:
+        """
+        Adapts the interval of a feed which was found in the feed list and
+        returns the time at which it is due, 0 for unknown feeds
+        """
+        if not self.adaptive:
+            return 0
+        with self._lock:
+            record = self.records.get(feed.feed_id)
+            if record is None:
+                return 0
+            if feed.last_modified is not None:
+                if record.updated and record.last_modified is not None:
+                    if feed.last_modified != record.last_modified:
+                        record.interval /= 2
+                    else:
+                        record.interval *= 1.5
+                    record.interval = self._bound(record.interval)
+                record.last_modified = feed.last_modified
+                record.updated = False
+            return record.last_update + record.interval
+
+    def due(self, feed_id: int) -> float:
+        """
+        Returns the time at which a feed is due, 0 for unknown feeds
+        """
+        if not self.adaptive:
+            return 0
+        with self._lock:
+            record = self.records.get(feed_id)
+            return 0 if record is None else \
+                record.last_update + record.interval
+
+    def record(self, feed: Feed, duration: float,
+               error: Optional[Exception] = None) -> None:
+        """
+        Records the outcome of an update
+        """
+        now = self.clock()
+        with self._lock:
+            record = self.records.get(feed.feed_id)
+            if record is None:
+                record = FeedRecord(self.min_interval)
+                record.last_modified = feed.last_modified
+                self.records[feed.feed_id] = record
+            if record.duration is None:
+                record.duration = duration
+            else:
+                record.duration = 0.7 * record.duration + 0.3 * duration
+            if error is None:
+                record.failures = 0
+                record.updated = True
+                if feed.last_modified is None:
+                    # nothing else shrinks the interval of such feeds
+                    record.interval = self.min_interval
+            else:
+                record.failures += 1
+                record.interval = self._bound(record.interval * 2)
+            record.last_update = now
+
+    def predicted_duration(self, feed_id: int) -> Optional[float]:
+        with self._lock:
+            record = self.records.get(feed_id)
+            return None if record is None else record.duration
+
+    def mean_duration(self) -> Optional[float]:
+        """
+        Returns the mean of the predicted durations of all known feeds, None
+        if no update was recorded yet
+        """
+        with self._lock:
+            durations = [record.duration for record in self.records.values()
+                         if record.duration is not None]
+        if not durations:
+            return None
+        return sum(durations) / len(durations)
+
+    def load(self) -> None:
+        try:
+            with open(self.path, 'r') as infile:
+                data = json.load(infile)
+        except FileNotFoundError:
+            return
+        with self._lock:
+            self.records = {int(feed_id): FeedRecord.from_json(values)
+                            for feed_id, values in data['feeds'].items()}
+
+    def save(self) -> None:
+        with self._lock:
+            data = {'feeds': {feed_id: record.to_json()
+                              for feed_id, record in self.records.items()}}
+        tmp_path = self.path + '.tmp'
+        with open(tmp_path, 'w') as outfile:
+            json.dump(data, outfile, separators=(',', ':'))
+        os.replace(tmp_path, self.path)
+
+    def _bound(self, interval: float) -> float:
+        return max(self.min_interval, min(self.max_interval, interval))
+
+
+def create_scheduler(config: Config) -> Optional[FeedScheduler]:
+    # longest first dispatch needs the update durations of the feeds
+    durations = config.dispatch == 'longest' and config.mode != 'continuous'
+    if config.maxinterval <= 0 and not durations:
+        return None
+    path = os.path.join(config.statedir, 'schedule.json')
+    min_interval = config.mininterval or config.interval
+    scheduler = FeedScheduler(path, min_interval,
+                              max(min_interval, config.maxinterval),
+                              config.interval / 2,
+                              adaptive=config.maxinterval > 0)
+    scheduler.load()
+    return scheduler
@@ -0,0 +1,51 @@
+from typing import Iterable, Iterator, Optional
+
+from nextcloud_news_updater.api.api import Feed
+from nextcloud_news_updater.config import Config
+
+
+def jump_hash(key: int, buckets: int) -> int:
+    """
+    Jump consistent hash by Lamping and Veach: maps a key to one of buckets
+    buckets so that adding a bucket only moves 1/buckets of the keys, all
+    of them to the new bucket
+    """
+    key &= 0xffffffffffffffff
+    bucket = -1
+    candidate = 0
+    while candidate < buckets:
+        bucket = candidate
+        key = (key * 2862933555777941757 + 1) & 0xffffffffffffffff
+        candidate = int((bucket + 1) * ((1 << 31) / ((key >> 33) + 1)))
+    return bucket
+
+
+class Shard:
+    """
+    Slice of the feeds which is updated by one of count updater instances.
+    Feeds are assigned by their id, so every instance updates a stable set
+    of feeds without coordinating with the others. The first shard runs
+    the cleanup before and after the updates
+    """
+
+    def __init__(self, index: int, count: int) -> None:
+        self.index = index
+        self.count = count
+
+    @property
+    def runs_cleanup(self) -> bool:
+        return self.index == 0
+
+    def owns(self, feed_id: int) -> bool:
+        return jump_hash(feed_id, self.count) == self.index
+
+    def filter(self, feeds: Iterable[Feed]) -> Iterator[Feed]:
+        for feed in feeds:
+            if self.owns(feed.feed_id):
+                yield feed
+
+
+def create_shard(config: Config) -> Optional[Shard]:
+    if config.shardcount <= 1:
+        return None
+    return Shard(config.shardindex, config.shardcount)
@@ -1,10 +1,25 @@
-import sys
 import threading
 import time
-import traceback
-from typing import List
+from contextlib import contextmanager
+from typing import Any, Callable, Dict, Iterable, Iterator, List, \
+    Optional, Tuple
 
-from nextcloud_news_updater.api.api import Feed
+from nextcloud_news_updater.api.api import Feed, FeedUpdateException
+from nextcloud_news_updater.api.breaker import RetryPolicy, \
+    create_circuit_breaker
+from nextcloud_news_updater.api.budget import BudgetShare
+from nextcloud_news_updater.api.concurrency import \
+    create_concurrency_controller
+from nextcloud_news_updater.api.control import create_control_server
+from nextcloud_news_updater.api.feedcache import create_feed_list_cache
+from nextcloud_news_updater.api.feedqueue import ContinuousFeedQueue, \
+    FeedQueue, create_feed_queue, extend_in_batches
+from nextcloud_news_updater.api.history import create_run_history
+from nextcloud_news_updater.api.metrics import create_metrics
+from nextcloud_news_updater.api.profiling import child_cpu_time, \
+    create_run_profile
+from nextcloud_news_updater.api.scheduler import create_scheduler
+from nextcloud_news_updater.api.sharding import create_shard
 from nextcloud_news_updater.common.logger import Logger
 from nextcloud_news_updater.config import Config
 
@@ -12,29 +27,58 @@ from nextcloud_news_updater.config import Config
 class UpdateThread(threading.Thread):
     """
     Baseclass for the updating thread which executes the feed updates in
-    parallel
+    parallel. Transient errors are retried according to the retry policy
+    which is set by the updater. The time spent updating feeds and waiting
+    for feeds is added up for profiling
     """
-    lock = threading.Lock()
+    retry = None  # type: Optional[RetryPolicy]
 
-    def __init__(self, feeds: List[Feed], logger: Logger) -> None:
+    def __init__(self, feeds: FeedQueue, logger: Logger) -> None:
         super().__init__()
         self.feeds = feeds
         self.logger = logger
+        self.busy = 0.0
+        self.idle = 0.0
+        self.updates = 0
 
     def run(self) -> None:
         while True:
-            with UpdateThread.lock:
-                if len(self.feeds) > 0:
-                    feed = self.feeds.pop()
-                else:
-                    return
+            wait_time = time.monotonic()
             try:
-                self.logger.info('Updating feed with id %s and user %s' %
-                                 (feed.feed_id, feed.user_id))
-                self.update_feed(feed)
-            except Exception as e:
-                self.logger.error(str(e))
-                traceback.print_exc(file=sys.stderr)
+                feed = self.feeds.pop()
+            except IndexError:
+                return
+            start_time = time.monotonic()
+            self.idle += start_time - wait_time
+            error = self._try_update(feed)
+            attempt = 0
+            while self.retry is not None and \
+                    self.retry.should_retry(attempt, error):
+                delay = self.retry.delay(attempt)
+                attempt += 1
+                self.logger.info('Retrying feed with id %s in %.1f seconds',
+                                 feed.feed_id, delay)
+                time.sleep(delay)
+                error = self._try_update(feed)
+            duration = time.monotonic() - start_time
+            self.busy += duration
+            self.updates += 1
+            self.feeds.done(feed, duration, error)
+
+    def _try_update(self, feed: Feed) -> Optional[Exception]:
+        """
+        Updates a feed and returns the error if it failed
+        """
+        try:
+            self.logger.info('Updating feed with id %s and user %s',
+                             feed.feed_id, feed.user_id)
+            self.update_feed(feed)
+        except FeedUpdateException as e:
+            return e
+        except Exception as e:
+            self.logger.exception(str(e))
+            return e
+        return None
 
     def update_feed(self, feed: Feed) -> None:
         """
@@ -44,6 +88,63 @@ class UpdateThread(threading.Thread):
         raise NotImplementedError
 
 
+class ListFeedsThread(threading.Thread):
+    """
+    Fetches the feeds to update in the background so the update threads can
+    start as soon as the first feeds arrive
+    """
+
+    def __init__(self, updater: 'Updater', feeds: FeedQueue) -> None:
+        super().__init__()
+        self.updater = updater
+        self.feeds = feeds
+        self.error = None  # type: Optional[Exception]
+
+    def run(self) -> None:
+        try:
+            with self.updater.phase('all_feeds'):
+                self.updater.stream_feeds(self.feeds)
+        except Exception as e:
+            self.error = e
+        finally:
+            self.feeds.close()
+
+
+class PeriodicThread(threading.Thread):
+    """
+    Calls a function right away and then every interval seconds for as long
+    as the updater runs, or earlier if it is triggered. Failed calls are
+    logged and retried after 30 seconds
+    """
+
+    def __init__(self, interval: float, target: Callable[[], None],
+                 logger: Logger) -> None:
+        super().__init__(daemon=True)
+        self.interval = interval
+        self.target = target
+        self.logger = logger
+        self._triggered = threading.Event()
+
+    def trigger(self) -> None:
+        """
+        Calls the function again right away, or right after the current call
+        """
+        self._triggered.set()
+
+    def run(self) -> None:
+        while True:
+            start_time = time.monotonic()
+            try:
+                self.target()
+                timeout = self.interval - (time.monotonic() - start_time)
+            except Exception as e:
+                self.logger.exception('%s: Trying again in 30 seconds', e)
+                timeout = 30
+            if timeout > 0:
+                self._triggered.wait(timeout)
+            self._triggered.clear()
+
+
 class Updater:
     """
     Baseclass for implementing your own updater type. Takes care of logging,
@@ -53,57 +154,499 @@ class Updater:
     def __init__(self, config: Config, logger: Logger) -> None:
         self.logger = logger
         self.config = config
+        self.scheduler = create_scheduler(config)
+        self.metrics = create_metrics(config)
+        self.concurrency = create_concurrency_controller(config)
+        self.retry = RetryPolicy(config.retries)
+        self.breaker = create_circuit_breaker(config)
+        self.shard = create_shard(config)
+        self.feed_cache = create_feed_list_cache(config)
+        self.profile = create_run_profile(config)
+        self.history = create_run_history(config)
+        # share of the update slots when running several instances
+        self.budget = None  # type: Optional[BudgetShare]
+        self.queue = None  # type: Optional[FeedQueue]
+        # state which is reported and changed through the control socket:
+        # the start times of the running phases, a summary of the last run,
+        # the time of the next run while waiting for it and the update
+        # threads of the current run
+        self.phases = {}  # type: Dict[str, float]
+        self.last_run = None  # type: Optional[Dict[str, Any]]
+        self.next_run = None  # type: Optional[float]
+        self.draining = False
+        self.update_threads = None  # type: Optional[List[UpdateThread]]
+        self.started_workers = 0
+        self._refresher = None  # type: Optional[PeriodicThread]
+        self._wakeup = threading.Event()
+        self._resize_lock = threading.Lock()
 
     def run(self) -> None:
+        control = create_control_server(self.config, self)
+        try:
+            if self.config.mode == 'continuous':
+                self.run_continuously()
+            else:
+                self.run_in_interval()
+        finally:
+            if control is not None:
+                control.close()
+
+    def run_in_interval(self) -> None:
+        """
+        Updates all feeds once or, in the endless mode, again and again with
+        a pause of interval seconds between the starts of two runs
+        """
         single_run = self.config.mode == 'singlerun'
         if single_run:
-            self.logger.info('Running update once with %d threads' %
+            self.logger.info('Running update once with %d threads',
                              self.config.threads)
         else:
-            self.logger.info(('Running update in an interval of %d seconds '
-                              'using %d threads') % (self.config.interval,
-                                                     self.config.threads))
-        while True:
+            self.logger.info('Running update in an interval of %d seconds '
+                             'using %d threads', self.config.interval,
+                             self.config.threads)
+        while not self.draining:
+            self._wakeup.clear()
             start_time = time.time()  # reset clock
+            if self.profile is not None:
+                self.profile.begin()
+            if self.history is not None:
+                self.history.begin_run()
+            feeds = None  # type: Optional[FeedQueue]
             try:
-                self.before_update()
-                feeds = self.all_feeds()
+                if self.runs_cleanup:
+                    with self.phase('before_update'):
+                        self.before_update()
+                feeds = create_feed_queue(self.config, self.accept_feed,
+                                          self.feed_updated, self.scheduler)
+                self.setup_queue(feeds)
+                lister = ListFeedsThread(self, feeds)
+                lister.start()
+                try:
+                    with self.phase('updates'):
+                        self.update_feeds(feeds)
+                finally:
+                    lister.join()
+                    self.save_state()
+                if lister.error is not None:
+                    raise lister.error
+                if feeds.skipped > 0:
+                    self.logger.info('Skipped %d feeds which are not due '
+                                     'yet or quarantined', feeds.skipped)
+                if feeds.timeouts > 0:
+                    self.logger.error('%d feed updates were aborted after '
+                                      'the timeout of %d seconds',
+                                      feeds.timeouts, self.config.timeout)
+                self.log_queue_waits(feeds)
+                self.log_concurrency()
+                if self.runs_cleanup:
+                    with self.phase('after_update'):
+                        self.after_update()
+                if self.metrics is not None:
+                    self.metrics.run_finished(time.time() - start_time, True)
+                if self.profile is not None:
+                    self.profile.write('Run')
+                if self.history is not None:
+                    self.history.finish_run(True)
+                self.run_finished(start_time, feeds)
 
-                threads = []
-                for num in range(0, self.config.threads):
-                    thread = self.start_update_thread(feeds)
-                    thread.start()
-                    threads.append(thread)
-                for thread in threads:
-                    thread.join()
-
-                self.after_update()
-
-                if single_run:
+                if single_run or self.draining:
                     return
                 # wait until the interval finished to run again and subtract
                 # the update run time from the interval
                 update_duration_seconds = int((time.time() - start_time))
                 timeout = self.config.interval - update_duration_seconds
                 if timeout > 0:
-                    self.logger.info(('Finished updating in %d seconds, '
-                                      'next update in %d seconds') %
-                                     (update_duration_seconds, timeout))
-                    time.sleep(timeout)
+                    self.logger.info('Finished updating in %d seconds, '
+                                     'next update in %d seconds',
+                                     update_duration_seconds, timeout)
+                    self.wait_for_run(timeout)
             except Exception as e:
-                self.logger.error('%s: Trying again in 30 seconds' % e)
-                traceback.print_exc(file=sys.stderr)
-                if single_run:
+                if self.metrics is not None:
+                    self.metrics.run_finished(time.time() - start_time, False)
+                if self.profile is not None:
+                    self.profile.write('Failed run')
+                if self.history is not None:
+                    self.history.finish_run(False)
+                self.run_finished(start_time, feeds, e)
+                self.logger.exception('%s: Trying again in 30 seconds', e)
+                if single_run or self.draining:
                     return
                 else:
-                    time.sleep(30)
+                    self.wait_for_run(30)
+
+    def wait_for_run(self, seconds: float) -> None:
+        """
+        Waits for the next run of the endless mode unless a run is triggered
+        or the updater is drained before
+        """
+        self.next_run = time.time() + seconds
+        try:
+            self._wakeup.wait(seconds)
+        finally:
+            self.next_run = None
+
+    def run_finished(self, start_time: float, feeds: Optional[FeedQueue],
+                     error: Optional[Exception] = None) -> None:
+        """
+        Keeps a summary of the run for the status of the control socket
+        """
+        summary = {'started': start_time,
+                   'duration': time.time() - start_time,
+                   'success': error is None}  # type: Dict[str, Any]
+        if feeds is not None:
+            summary.update(updates=feeds.completed, failures=feeds.failures,
+                           timeouts=feeds.timeouts, skipped=feeds.skipped)
+        if error is not None:
+            summary['error'] = str(error)
+        self.last_run = summary
+
+    def run_continuously(self) -> None:
+        """
+        Keeps the update threads running and updates every feed again once
+        its interval elapsed. The feed list is refreshed and the cleanup
+        hooks are run in the background, each on its own timer
+        """
+        self.logger.info('Running updates continuously in an interval of '
+                         '%d seconds using %d threads', self.config.interval,
+                         self.config.threads)
+        if self.profile is not None:
+            self.profile.begin()
+        if self.history is not None:
+            self.history.begin_run()
+        feeds = create_feed_queue(self.config, None, self.feed_updated,
+                                  self.scheduler, self.breaker)
+        self.setup_queue(feeds)
+        refresh_interval = self.config.refreshinterval or self.config.interval
+        cleanup_interval = self.config.cleanupinterval or self.config.interval
+        if self.runs_cleanup:
+            PeriodicThread(cleanup_interval, self.cleanup,
+                           self.logger).start()
+        self._refresher = PeriodicThread(
+            refresh_interval, lambda: self.refresh_feeds(feeds), self.logger)
+        self._refresher.start()
+        with self.phase('updates'):
+            self.update_feeds(feeds)
+        # the updates only finish once the updater was drained
+        self.save_state()
+        if self.history is not None:
+            self.history.finish_run(True)
+
+    def refresh_feeds(self, feeds: ContinuousFeedQueue) -> None:
+        """
+        Adds new feeds to the queue of the continuous mode and drops the ones
+        which are no longer listed
+        """
+        feeds.begin_refresh()
+        with self.phase('all_feeds'):
+            self.stream_feeds(feeds)
+        removed = feeds.end_refresh()
+        if removed > 0:
+            self.logger.info('Dropped %d feeds which are no longer listed',
+                             removed)
+        self.save_state()
+        self.log_queue_waits(feeds, True)
+        self.log_concurrency()
+        if self.profile is not None:
+            self.profile.write('Refresh')
+        if self.history is not None:
+            self.history.finish_run(True)
+            self.history.begin_run()
+
+    def cleanup(self) -> None:
+        """
+        Runs the before and after update hooks of the continuous mode
+        """
+        with self.phase('before_update'):
+            self.before_update()
+        with self.phase('after_update'):
+            self.after_update()
+
+    @property
+    def runs_cleanup(self) -> bool:
+        """
+        Whether this instance runs the before and after update hooks, only
+        the first shard does if the feeds are split between instances
+        """
+        return self.shard is None or self.shard.runs_cleanup
+
+    def owned_feeds(self, feeds: Iterable[Feed]) -> Iterable[Feed]:
+        """
+        Leaves out the feeds of the listed feeds which are updated by other
+        shards
+        """
+        if self.shard is None:
+            return feeds
+        return self.shard.filter(feeds)
+
+    def setup_queue(self, feeds: FeedQueue) -> None:
+        """
+        Applies the current limits to a new queue and makes it the queue
+        which is reported on
+        """
+        if self.concurrency is not None:
+            feeds.set_limit(self.concurrency.limit)
+        if self.breaker is not None:
+            # the server breaker might have opened before a restart
+            pause = self.breaker.paused_until - time.time()
+            if pause > 0:
+                feeds.pause(pause)
+        feeds.budget = self.budget
+        self.queue = feeds
+        if self.draining:
+            feeds.drain()
+        if self.metrics is not None:
+            self.metrics.queue = feeds
+
+    def save_state(self) -> None:
+        if self.scheduler is not None:
+            self.scheduler.save()
+        if self.breaker is not None:
+            self.breaker.save()
+        if self.feed_cache is not None:
+            self.feed_cache.save()
+
+    def update_feeds(self, feeds: FeedQueue) -> None:
+        """
+        Updates all feeds of the queue and returns once it was closed and
+        all updates finished
+        """
+        concurrency = self.config.threads
+        if self.concurrency is not None:
+            # the queue keeps the number of parallel updates below the limit
+            concurrency = self.concurrency.ceiling
+        if self.config.engine == 'asyncio':
+            # asyncio takes longer to import than the rest of the updater
+            from nextcloud_news_updater.api.asyncengine import \
+                AsyncUpdateEngine
+            engine = AsyncUpdateEngine(self, self.logger, concurrency)
+            if self.profile is not None:
+                self.profile.add_worker(engine)
+            self.started_workers = concurrency
+            try:
+                engine.run(feeds)
+            finally:
+                self.started_workers = 0
+            return
+
+        threads = []  # type: List[UpdateThread]
+        with self._resize_lock:
+            self.update_threads = threads
+            for num in range(0, concurrency):
+                self._add_update_thread(feeds, threads)
+            self.started_workers = concurrency
+        try:
+            # threads which are added by resize are joined as well
+            for thread in threads:
+                thread.join()
+        finally:
+            with self._resize_lock:
+                self.update_threads = None
+                self.started_workers = 0
+
+    def _add_update_thread(self, feeds: FeedQueue,
+                           threads: List[UpdateThread]) -> None:
+        thread = self.start_update_thread(feeds)
+        thread.retry = self.retry
+        if self.profile is not None:
+            self.profile.add_worker(thread)
+        thread.start()
+        threads.append(thread)
+
+    def resize(self, threads: int) -> None:
+        """
+        Changes the number of update threads. Threads are added to the
+        current run right away, with the asyncio engine only from the next
+        run on. Surplus threads of the current run stay idle because the
+        queue hands out no more feeds than the new number of threads
+        """
+        with self._resize_lock:
+            self.config.threads = threads
+            limit = threads
+            if self.concurrency is not None:
+                limit = self.concurrency.resize(threads)
+            queue = self.queue
+            if queue is None or self.started_workers == 0:
+                return
+            if self.update_threads is not None:
+                while len(self.update_threads) < threads:
+                    self._add_update_thread(queue, self.update_threads)
+                self.started_workers = len(self.update_threads)
+            if self.concurrency is None and limit >= self.started_workers:
+                limit = 0
+            queue.set_limit(limit)
+
+    def trigger_run(self) -> bool:
+        """
+        Starts the next run of the endless mode right away or refreshes the
+        feed list of the continuous mode. Returns False if the updater is
+        not waiting for a run
+        """
+        if self.config.mode == 'continuous':
+            if self._refresher is None:
+                return False
+            self._refresher.trigger()
+            return True
+        if self.next_run is None:
+            return False
+        self._wakeup.set()
+        return True
+
+    def drain(self) -> int:
+        """
+        Stops the updater once the updates in flight finished. Feeds which
+        are still queued are dropped, the after update command of a run in
+        progress still runs. Returns the number of dropped feeds
+        """
+        self.draining = True
+        self._wakeup.set()
+        queue = self.queue
+        dropped = 0 if queue is None else queue.drain()
+        self.logger.info('Draining the updater, dropped %d queued feeds',
+                         dropped)
+        return dropped
+
+    def update_now(self, feeds: List[Feed]) \
+            -> List[Tuple[Feed, float, Optional[Exception]]]:
+        """
+        Updates the given feeds one after another in an extra update thread
+        next to the running updates and returns the duration and the error
+        of every update
+        """
+        results = []  # type: List[Tuple[Feed, float, Optional[Exception]]]
+
+        def finished(feed: Feed, duration: float,
+                     error: Optional[Exception]) -> None:
+            self.feed_updated(feed, duration, error)
+            results.append((feed, duration, error))
+
+        queue = FeedQueue(None, finished)
+        queue.budget = self.budget
+        queue.extend(feeds)
+        queue.close()
+        thread = self.start_update_thread(queue)
+        thread.retry = self.retry
+        thread.start()
+        thread.join()
+        return results
+
+    @contextmanager
+    def phase(self, name: str) -> Iterator[None]:
+        """
+        Measures the duration of a phase of the update run: before_update,
+        all_feeds, updates or after_update. Listing the feeds runs in the
+        background while the feeds are updated. CPU times are only measured
+        for profiling and cover the whole process
+        """
+        start_time = time.monotonic()
+        if self.profile is not None:
+            start_cpu = time.process_time()
+            start_child_cpu = child_cpu_time()
+        self.phases[name] = start_time
+        try:
+            yield
+        finally:
+            self.phases.pop(name, None)
+        duration = time.monotonic() - start_time
+        if self.metrics is not None:
+            self.metrics.phase_finished(name, duration)
+        if self.profile is not None:
+            self.profile.phase_finished(
+                name, duration, time.process_time() - start_cpu,
+                child_cpu_time() - start_child_cpu)
+
+    def log_concurrency(self) -> None:
+        if self.concurrency is None:
+            limit = self.config.threads
+        else:
+            limit = self.concurrency.limit
+            self.logger.info('Limited parallel updates to %d (between %d '
+                             'and %d, %d increases and %d decreases so '
+                             'far)', limit, self.concurrency.floor,
+                             self.concurrency.ceiling,
+                             self.concurrency.increases,
+                             self.concurrency.decreases)
+        if self.metrics is not None:
+            self.metrics.concurrency_limit.set(limit)
+
+    def log_queue_waits(self, feeds: FeedQueue, reset: bool = False) -> None:
+        for user_id, wait in feeds.wait_summary(reset=reset):
+            self.logger.info('Queue wait for user %s: %d feeds, '
+                             'average %.1f seconds, maximum %.1f seconds',
+                             user_id, wait.count, wait.total / wait.count,
+                             wait.max)
+
+    def accept_feed(self, feed: Feed) -> bool:
+        """
+        Decides whether a listed feed should be updated in this run
+        """
+        if self.breaker is not None and \
+                not self.breaker.allows(feed.feed_id):
+            return False
+        return self.scheduler is None or self.scheduler.is_due(feed)
+
+    def feed_updated(self, feed: Feed, duration: float,
+                     error: Optional[Exception]) -> None:
+        """
+        Called from the update threads once a feed was updated
+        :argument duration the update duration in seconds
+        :argument error the exception if the update failed, otherwise None
+        """
+        if self.scheduler is not None:
+            self.scheduler.record(feed, duration, error)
+        if self.metrics is not None:
+            self.metrics.feed_updated(duration, error)
+        if self.history is not None:
+            self.history.record(feed, duration, error)
+        if self.concurrency is not None and self.queue is not None:
+            self.queue.set_limit(self.concurrency.record(duration, error))
+        if self.breaker is not None:
+            pause = self.breaker.record(feed.feed_id, error)
+            if pause > 0 and self.queue is not None:
+                self.logger.error('Nextcloud failed %d updates in a row, '
+                                  'pausing updates for %d seconds',
+                                  self.breaker.server_threshold, pause)
+                self.queue.pause(pause)
 
     def before_update(self) -> None:
         raise NotImplementedError
 
-    def start_update_thread(self, feeds: List[Feed]) -> UpdateThread:
+    def start_update_thread(self, feeds: FeedQueue) -> UpdateThread:
         raise NotImplementedError
 
+    def stream_feeds(self, feeds: FeedQueue) -> None:
+        """
+        Adds all feeds which should be updated to the queue while the feed
+        list is still being received so the updates can start right away
+        """
+        count = extend_in_batches(feeds, self.owned_feeds(self.iter_feeds()))
+        self.logger.info('Received %d feeds to update', count)
+
+    def iter_feeds(self) -> Iterable[Feed]:
+        """
+        Yields the feeds which should be updated. Updaters which are able to
+        parse the feed list while it is being received can override this,
+        defaults to all_feeds
+        """
+        return self.all_feeds()
+
+    async def update_feed_async(self, feed: Feed) -> None:
+        """
+        Updates a single feed when running on the asyncio engine. Updaters
+        which do not implement non-blocking updates run the update thread's
+        update_feed method in the event loop's default executor
+        """
+        import asyncio
+        thread = self.start_update_thread(FeedQueue())
+        loop = asyncio.get_event_loop()
+        await loop.run_in_executor(None, thread.update_feed, feed)
+
+    async def close_async(self) -> None:
+        """
+        Releases resources bound to the event loop once all updates of a run
+        on the asyncio engine finished
+        """
+        pass
+
     def all_feeds(self) -> List[Feed]:
         raise NotImplementedError
 
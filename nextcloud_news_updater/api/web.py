@@ -1,14 +1,22 @@
 import base64
-from urllib.parse import urlencode
-from urllib.request import Request, urlopen
+import os
+from urllib.error import HTTPError
+from urllib.parse import urlencode, urlsplit
 from collections import OrderedDict
-from typing import List, Tuple, Any
+from typing import List, Tuple, Any, Dict, Iterator, Optional
 
 from nextcloud_news_updater.api.api import Api, Feed
+from nextcloud_news_updater.api.feedcache import ALL_FEEDS
+from nextcloud_news_updater.api.feedqueue import FeedQueue
 from nextcloud_news_updater.api.updater import Updater, UpdateThread
+from nextcloud_news_updater.common.connectionpool import ConnectionPool, \
+    AsyncConnectionPool
+from nextcloud_news_updater.common.jsonstream import iter_chunks
 from nextcloud_news_updater.common.logger import Logger
 from nextcloud_news_updater.config import Config
 
+NOT_MODIFIED = 304
+
 
 class WebApi(Api):
     def __init__(self, config: Config) -> None:
@@ -25,6 +33,15 @@ class WebApi(Api):
             url += '/'
         return url
 
+    def update_feed_url(self, feed: Feed) -> str:
+        # make sure that the order is always defined for making it easier
+        # to test and reason about, normal dicts are not ordered
+        data = OrderedDict([
+            ('userId', feed.user_id),
+            ('feedId', str(feed.feed_id)),
+        ])
+        return '%s?%s' % (self.update_url, urlencode(data))
+
 
 class WebApiV2(WebApi):
     def __init__(self, config: Config) -> None:
@@ -36,9 +53,10 @@ class WebApiV2(WebApi):
         self.all_feeds_url = '%s/updater/all-feeds' % self.base_url
         self.update_url = '%s/updater/update-feed' % self.base_url
 
-    def _parse_feeds_json(self, feeds: dict, userID: str) -> List[Feed]:
-        feeds = feeds['updater']
-        return [Feed(info['feedId'], info['userId']) for info in feeds]
+    feeds_key = 'updater'
+
+    def _create_feed(self, info: Any, userID: str) -> Feed:
+        return Feed(info['feedId'], info['userId'])
 
 
 class WebApiV15(WebApi):
@@ -53,12 +71,6 @@ class WebApiV15(WebApi):
         self.all_feeds_url = '%s/feeds/all' % self.base_url
         self.update_url = '%s/feeds/update' % self.base_url
 
-    def _parse_feeds_json(self, feeds_json: Any, userID: str) -> List[Feed]:
-        if not feeds_json:
-            return []
-        feeds_json = feeds_json['feeds']
-        return [Feed(info['id'], info['userId']) for info in feeds_json]
-
 
 def create_web_api(config: Config) -> WebApi:
     if config.apilevel == 'v1-2':
@@ -70,17 +82,130 @@ def create_web_api(config: Config) -> WebApi:
 
 
 class HttpClient:
+    """
+    Small wrapper for getting rid of the requests library. Requests are sent
+    over a pool of keep-alive connections which is shared by all update
+    threads. urllib.request is only imported for requests over a proxy, it
+    takes longer to import than the rest of the updater
+    """
+
+    def __init__(self, config: Config) -> None:
+        self.maxsize = max(config.threads, config.maxthreads)
+        self.pool = ConnectionPool(maxsize=self.maxsize)
+        self.async_pool = None  # type: Optional[AsyncConnectionPool]
+        # proxies are configured with the *_proxy environment variables
+        self._has_proxies = any(name.lower().endswith('_proxy')
+                                for name in os.environ)
+
     def get(self, url: str, auth: Tuple[str, str],
             timeout: int = 5 * 60) -> str:
         """
-        Small wrapper for getting rid of the requests library
+        Sends a GET request which is aborted with socket.timeout once it
+        took longer than timeout seconds. Over a proxy the timeout only
+        applies to every single socket operation
+        """
+        auth_header = self._auth_header(auth)
+        if self._uses_proxy(url):
+            from urllib.request import Request, urlopen
+            req = Request(url)
+            req.add_header('Authorization', auth_header)
+            response = urlopen(req, timeout=timeout)
+            return response.read().decode('utf8')
+        headers = {'Authorization': auth_header, 'Connection': 'keep-alive'}
+        with self.pool.request(url, headers, timeout, True) as response:
+            return response.read().decode('utf8')
+
+    def stream(self, url: str, auth: Tuple[str, str],
+               timeout: int = 5 * 60) -> Iterator[bytes]:
+        """
+        Like get but yields the response body in chunks instead of reading it
+        into memory at once
+        """
+        auth_header = self._auth_header(auth)
+        if self._uses_proxy(url):
+            from urllib.request import Request, urlopen
+            req = Request(url)
+            req.add_header('Authorization', auth_header)
+            with urlopen(req, timeout=timeout) as response:
+                yield from iter_chunks(response.read)
+            return
+        headers = {'Authorization': auth_header, 'Connection': 'keep-alive'}
+        with self.pool.request(url, headers, timeout) as response:
+            yield from iter_chunks(response.read)
+
+    def stream_conditional(self, url: str, auth: Tuple[str, str],
+                           validators: Dict[str, str],
+                           timeout: int = 5 * 60) -> Tuple[int, Dict[str, str],
+                                                           Iterator[bytes]]:
+        """
+        Sends a conditional request with the If-None-Match and
+        If-Modified-Since headers in validators. Returns the status code,
+        the validators of the response and its body in chunks, which is
+        empty if the status code is 304
         """
+        headers = dict(validators)
+        headers['Authorization'] = self._auth_header(auth)
+        if self._uses_proxy(url):
+            from urllib.request import Request, urlopen
+            try:
+                response = urlopen(Request(url, headers=headers),
+                                   timeout=timeout)
+            except HTTPError as e:
+                if e.code != NOT_MODIFIED:
+                    raise
+                e.close()
+                return NOT_MODIFIED, {}, iter(())
+        else:
+            headers['Connection'] = 'keep-alive'
+            response = self.pool.request(url, headers, timeout)
+            if response.status == NOT_MODIFIED:
+                response.read()
+                response.release()
+                return NOT_MODIFIED, {}, iter(())
+        received = {name: response.headers[name]
+                    for name in ('ETag', 'Last-Modified')
+                    if response.headers.get(name) is not None}
+        return response.status, received, self._iter_body(response)
+
+    async def get_async(self, url: str, auth: Tuple[str, str],
+                        timeout: int = 5 * 60) -> str:
+        """
+        Non blocking variant of get which is used by the asyncio engine
+        """
+        if self.async_pool is None:
+            self.async_pool = AsyncConnectionPool(maxsize=self.maxsize)
+        headers = {'Authorization': self._auth_header(auth),
+                   'Connection': 'keep-alive'}
+        body = await self.async_pool.request(url, headers, timeout)
+        return body.decode('utf8')
+
+    async def close_async_connections(self) -> None:
+        """
+        Closes the connections of the asyncio engine which are bound to the
+        event loop of the current run
+        """
+        if self.async_pool is not None:
+            pool, self.async_pool = self.async_pool, None
+            await pool.close()
+
+    def stats(self) -> Dict[str, int]:
+        return self.pool.stats()
+
+    def _iter_body(self, response: Any) -> Iterator[bytes]:
+        with response:
+            yield from iter_chunks(response.read)
+
+    def _auth_header(self, auth: Tuple[str, str]) -> str:
         basic_auth = bytes(':'.join(auth), 'utf-8')
-        auth_header = 'Basic ' + base64.b64encode(basic_auth).decode('utf-8')
-        req = Request(url)
-        req.add_header('Authorization', auth_header)
-        response = urlopen(req, timeout=timeout)
-        return response.read().decode('utf8')
+        return 'Basic ' + base64.b64encode(basic_auth).decode('utf-8')
+
+    def _uses_proxy(self, url: str) -> bool:
+        if not self._has_proxies:
+            return False
+        from urllib.request import getproxies, proxy_bypass
+        parts = urlsplit(url)
+        return parts.scheme in getproxies() and \
+            not proxy_bypass(parts.hostname)
 
 
 class WebUpdater(Updater):
@@ -93,26 +218,51 @@ class WebUpdater(Updater):
 
     def before_update(self) -> None:
         self.logger.info(
-            'Calling before update url:  %s' % self.api.before_cleanup_url)
+            'Calling before update url:  %s', self.api.before_cleanup_url)
         self.client.get(self.api.before_cleanup_url, self.auth)
 
-    def start_update_thread(self, feeds: List[Feed]) -> UpdateThread:
+    def start_update_thread(self, feeds: FeedQueue) -> UpdateThread:
         return WebUpdateThread(feeds, self.config, self.logger, self.api,
                                self.client)
 
+    async def update_feed_async(self, feed: Feed) -> None:
+        url = self.api.update_feed_url(feed)
+        self.logger.info('Calling update url: %s', url)
+        await self.client.get_async(url, self.auth, self.config.timeout)
+
+    async def close_async(self) -> None:
+        await self.client.close_async_connections()
+
     def all_feeds(self) -> List[Feed]:
-        feeds_json = self.client.get(self.api.all_feeds_url, self.auth)
-        self.logger.info('Received these feeds to update: %s' % feeds_json)
-        return self.api.parse_feeds(feeds_json)
+        return list(self.iter_feeds())
+
+    def iter_feeds(self) -> Iterator[Feed]:
+        if self.feed_cache is None:
+            chunks = self.client.stream(self.api.all_feeds_url, self.auth)
+            return self.api.iter_feeds(chunks)
+        fresh = self.feed_cache.is_fresh()
+        validators = {}  # type: Dict[str, str]
+        if fresh:
+            validators = self.feed_cache.validators(ALL_FEEDS)
+        status, received, chunks = self.client.stream_conditional(
+            self.api.all_feeds_url, self.auth, validators)
+        if status == NOT_MODIFIED:
+            self.logger.info('Feed list did not change, using cached list')
+            return self.feed_cache.replay(ALL_FEEDS, True)
+        return self.feed_cache.store(ALL_FEEDS, chunks, self.api.iter_feeds,
+                                     received.get('ETag'),
+                                     received.get('Last-Modified'),
+                                     refresh=not fresh)
 
     def after_update(self) -> None:
         self.logger.info(
-            'Calling after update url:  %s' % self.api.after_cleanup_url)
+            'Calling after update url:  %s', self.api.after_cleanup_url)
         self.client.get(self.api.after_cleanup_url, self.auth)
+        self.logger.info('Connection pool statistics: %s', self.client.stats())
 
 
 class WebUpdateThread(UpdateThread):
-    def __init__(self, feeds: List[Feed], config: Config, logger: Logger,
+    def __init__(self, feeds: FeedQueue, config: Config, logger: Logger,
                  api: WebApi, client: HttpClient) -> None:
         super().__init__(feeds, logger)
         self.client = client
@@ -121,13 +271,6 @@ class WebUpdateThread(UpdateThread):
         self.config = config
 
     def update_feed(self, feed: Feed) -> None:
-        # make sure that the order is always defined for making it easier
-        # to test and reason about, normal dicts are not ordered
-        data = OrderedDict([
-            ('userId', feed.user_id),
-            ('feedId', str(feed.feed_id)),
-        ])
-        url_data = urlencode(data)
-        url = '%s?%s' % (self.api.update_url, url_data)
-        self.logger.info('Calling update url: %s' % url)
+        url = self.api.update_feed_url(feed)
+        self.logger.info('Calling update url: %s', url)
         self.client.get(url, self.auth, self.config.timeout)
@@ -13,7 +13,9 @@ class ArgumentParser:
                                  type=int)
         self.parser.add_argument('--timeout', '-s',
                                  help='Maximum number of seconds for updating '
-                                      'a feed, defaults to 5 minutes',
+                                      'a feed after which the request is '
+                                      'aborted or the PHP process is killed, '
+                                      'defaults to 5 minutes',
                                  type=int)
         self.parser.add_argument('--interval', '-i',
                                  help='Update interval between fetching the '
@@ -31,10 +33,28 @@ class ArgumentParser:
                                       'urls and received data, error will '
                                       'only log errors',
                                  choices=['info', 'error'])
+        self.parser.add_argument('--logformat',
+                                 help='Log output format: text writes one '
+                                      'line of text per message, json one '
+                                      'JSON object per line, defaults to '
+                                      'text',
+                                 choices=['text', 'json'])
+        self.parser.add_argument('--logmaxlength',
+                                 help='Number of characters after which log '
+                                      'messages are truncated, defaults to '
+                                      '2000, 0 disables truncation',
+                                 type=int)
+        self.parser.add_argument('--logsample',
+                                 help='Only log every n-th info message of '
+                                      'each kind, e.g. of the messages for '
+                                      'each updated feed. Errors are always '
+                                      'logged, defaults to 1 which logs all '
+                                      'messages',
+                                 type=int)
         self.parser.add_argument('--config', '-c',
                                  help='Path to config file where all '
                                       'parameters except can be defined as '
-                                      'key values pair.  See the ' 
+                                      'key values pair.  See the '
                                       'README.rst for more information')
         self.parser.add_argument('--phpini', '-P',
                                  help='Custom absolute path to the php.ini '
@@ -57,12 +77,214 @@ class ArgumentParser:
                                  help='Mode to run the updater in: endless '
                                       'runs the update again after the '
                                       'specified interval, singlerun only '
-                                      'executes the update once',
-                                 choices=['endless', 'singlerun'])
+                                      'executes the update once, continuous '
+                                      'keeps updating and updates every feed '
+                                      'again once its interval elapsed',
+                                 choices=['endless', 'singlerun',
+                                          'continuous'])
         self.parser.add_argument('--php',
                                  help='Path to the PHP binary, '
                                       'e.g. /usr/bin/php7.0, defaults to '
                                       'php')
+        self.parser.add_argument('--engine', '-e',
+                                 help='Engine to run the feed updates with: '
+                                      'threads uses one thread per parallel '
+                                      'update, asyncio runs all updates on '
+                                      'one event loop which allows hundreds '
+                                      'of parallel updates, defaults to '
+                                      'threads',
+                                 choices=['threads', 'asyncio'])
+        self.parser.add_argument('--batchsize', '-b',
+                                 help='Number of feeds a long lived PHP '
+                                      'worker updates before it is replaced '
+                                      'by a fresh one. If set, the console '
+                                      'based updater boots Nextcloud once '
+                                      'per worker instead of once per feed, '
+                                      'defaults to 0 which disables workers',
+                                 type=int)
+        self.parser.add_argument('--batchmemory',
+                                 help='Memory usage in MB after which a PHP '
+                                      'worker is replaced by a fresh one, '
+                                      'defaults to 256',
+                                 type=int)
+        self.parser.add_argument('--nice',
+                                 help='Niceness of the PHP processes between '
+                                      '0 and 19, higher values leave more '
+                                      'CPU time to other processes like the '
+                                      'web server, defaults to 0',
+                                 type=int)
+        self.parser.add_argument('--ionice',
+                                 help='I/O scheduling class of the PHP '
+                                      'processes, requires the ionice '
+                                      'command, defaults to none which '
+                                      'keeps the class of the updater',
+                                 choices=['none', 'besteffort', 'idle'])
+        self.parser.add_argument('--phpmemory',
+                                 help='Limit of the address space of every '
+                                      'PHP process in MB, defaults to 0 '
+                                      'which means unlimited',
+                                 type=int)
+        self.parser.add_argument('--phpcpu',
+                                 help='Limit of the CPU time of every PHP '
+                                      'process in seconds, PHP workers add '
+                                      'up the CPU time of all their updates, '
+                                      'defaults to 0 which means unlimited',
+                                 type=int)
+        self.parser.add_argument('--maxload',
+                                 help='Hold back updates with the console '
+                                      'API while the load average of the '
+                                      'last minute is higher, defaults to 0 '
+                                      'which disables the check',
+                                 type=float)
+        self.parser.add_argument('--minfreememory',
+                                 help='Hold back updates with the console '
+                                      'API while less memory in MB is '
+                                      'available, defaults to 0 which '
+                                      'disables the check',
+                                 type=int)
+        self.parser.add_argument('--statedir',
+                                 help='Absolute path to a directory in which '
+                                      'the updater keeps state between runs, '
+                                      'e.g. the update history of each feed')
+        self.parser.add_argument('--mininterval',
+                                 help='Minimum number of seconds between two '
+                                      'updates of the same feed when '
+                                      'adaptive scheduling is enabled, '
+                                      'defaults to the interval',
+                                 type=int)
+        self.parser.add_argument('--maxinterval',
+                                 help='Maximum number of seconds between two '
+                                      'updates of the same feed. If set, '
+                                      'feeds are only updated when they are '
+                                      'due based on their update history '
+                                      'which requires --statedir, defaults '
+                                      'to 0 which updates all feeds in every '
+                                      'run',
+                                 type=int)
+        self.parser.add_argument('--dispatch',
+                                 help='Order in which queued feeds are '
+                                      'updated: fair takes turns between '
+                                      'users so that users with many feeds '
+                                      'do not delay everyone else, fifo '
+                                      'updates feeds in the order they were '
+                                      'listed, longest updates the feeds '
+                                      'which took longest in previous runs '
+                                      'first which requires --statedir, '
+                                      'defaults to fair',
+                                 choices=['fifo', 'fair', 'longest'])
+        self.parser.add_argument('--userlimit',
+                                 help='Maximum number of feeds of the same '
+                                      'user which are updated at the same '
+                                      'time when using fair dispatch, '
+                                      'defaults to 0 which means unlimited',
+                                 type=int)
+        self.parser.add_argument('--minthreads',
+                                 help='Lowest number of parallel updates '
+                                      'when adapting the number of parallel '
+                                      'updates, defaults to 1',
+                                 type=int)
+        self.parser.add_argument('--maxthreads',
+                                 help='Highest number of parallel updates. '
+                                      'If set, the number of parallel '
+                                      'updates starts at --threads and is '
+                                      'adapted to the update durations and '
+                                      'the rate of timeouts and server '
+                                      'errors, defaults to 0 which always '
+                                      'uses --threads',
+                                 type=int)
+        self.parser.add_argument('--refreshinterval',
+                                 help='Seconds between two refreshes of the '
+                                      'feed list in continuous mode, '
+                                      'defaults to the interval',
+                                 type=int)
+        self.parser.add_argument('--cleanupinterval',
+                                 help='Seconds between two runs of the '
+                                      'cleanup before and after the updates '
+                                      'in continuous mode, defaults to the '
+                                      'interval',
+                                 type=int)
+        self.parser.add_argument('--feedlistrefresh',
+                                 help='Seconds after which the full feed '
+                                      'list is fetched again. In between the '
+                                      'list is cached, the web API is only '
+                                      'asked whether it changed and the '
+                                      'console API is not called at all. The '
+                                      'cache is kept in the state directory '
+                                      'if one is set, defaults to 0 which '
+                                      'disables the cache',
+                                 type=int)
+        self.parser.add_argument('--retries',
+                                 help='How many times an update which failed '
+                                      'because of a dropped connection or a '
+                                      'gateway error is retried, with a '
+                                      'random growing delay in between, '
+                                      'defaults to 2',
+                                 type=int)
+        self.parser.add_argument('--feedbreaker',
+                                 help='Number of failed updates in a row '
+                                      'after which a feed is quarantined, '
+                                      'starting with one interval and twice '
+                                      'as long after every further failure, '
+                                      'defaults to 0 which never quarantines '
+                                      'feeds',
+                                 type=int)
+        self.parser.add_argument('--serverbreaker',
+                                 help='Number of server errors from '
+                                      'Nextcloud in a row after which '
+                                      'updates are paused, defaults to 0 '
+                                      'which never pauses updates',
+                                 type=int)
+        self.parser.add_argument('--shardcount', '--shard-count',
+                                 help='Number of updater instances which '
+                                      'split the feeds between them, '
+                                      'defaults to 1',
+                                 type=int)
+        self.parser.add_argument('--shardindex', '--shard-index',
+                                 help='Which of the --shardcount slices of '
+                                      'the feeds this instance updates, '
+                                      'starting at 0. Only the instance with '
+                                      'index 0 runs the cleanup before and '
+                                      'after the updates, defaults to 0',
+                                 type=int)
+        self.parser.add_argument('--profile',
+                                 help='File to which the wall and CPU time '
+                                      'of the phases of every run and the '
+                                      'time the update threads were busy '
+                                      'and idle are appended, by default '
+                                      'nothing is profiled')
+        self.parser.add_argument('--profiler',
+                                 help='Also profiles the function calls of '
+                                      'the first run and appends the output '
+                                      'to the --profile file. cprofile '
+                                      'traces every call, sampling looks at '
+                                      'the running functions every 5 ms '
+                                      'which slows the updates down a lot '
+                                      'less, defaults to none',
+                                 choices=['none', 'cprofile', 'sampling'])
+        self.parser.add_argument('--history',
+                                 help='SQLite database to which every feed '
+                                      'update and a summary of every run '
+                                      'are appended. Run '
+                                      'nextcloud-news-updater analyze '
+                                      'HISTORY for a report, by default no '
+                                      'history is kept')
+        self.parser.add_argument('--controlsocket',
+                                 help='Path of a Unix domain socket on '
+                                      'which the running updater accepts '
+                                      'commands. Run nextcloud-news-updater '
+                                      'control --help for the commands, by '
+                                      'default no socket is created')
+        self.parser.add_argument('--metricsport', '--metrics-port',
+                                 help='Port on which metrics about the '
+                                      'updates are served in the Prometheus '
+                                      'text format, defaults to 0 which '
+                                      'disables the metrics',
+                                 type=int)
+        self.parser.add_argument('--metricsaddress', '--metrics-address',
+                                 help='Address on which the metrics are '
+                                      'served, defaults to 127.0.0.1. Use '
+                                      '0.0.0.0 or :: to serve them on all '
+                                      'interfaces')
         self.parser.add_argument('url',
                                  help='The URL or absolute path to the '
                                       'directory where Nextcloud is installed.'
@@ -0,0 +1,517 @@
+import http.client
+import socket
+import ssl
+import threading
+import time
+from collections import deque
+from io import BytesIO
+from typing import Any, Dict, Optional, Tuple
+from urllib.error import HTTPError
+from urllib.parse import urljoin, urlsplit
+
+from nextcloud_news_updater.common.deadline import Watch, Watchdog
+
+# errors that indicate that the server dropped a kept alive connection
+# between two requests. Requests on such connections are retried once with a
+# fresh connection
+STALE_CONNECTION_ERRORS = (http.client.RemoteDisconnected,
+                           http.client.BadStatusLine,
+                           ConnectionResetError,
+                           ConnectionAbortedError,
+                           BrokenPipeError)
+# redirects which are followed like urlopen does, at most MAX_REDIRECTS times
+# per request
+REDIRECT_CODES = (301, 302, 303, 307, 308)
+MAX_REDIRECTS = 5
+# responses which never have a body, the pools only send GET requests
+BODYLESS_CODES = (204, 304)
+
+
+def redirect_url(url: str, location: str, status: int, reason: str,
+                 headers: Any, redirects: int) -> str:
+    """
+    Returns the URL a redirect points to
+    :raises HTTPError if there were too many redirects or the redirect does
+    not lead to an HTTP URL
+    """
+    if redirects > MAX_REDIRECTS:
+        raise HTTPError(url, status, 'Too many redirects: %s' % reason,
+                        headers, BytesIO())
+    target = urljoin(url, location)
+    if urlsplit(target).scheme.lower() not in ('http', 'https'):
+        raise HTTPError(url, status, 'Redirect to %s is not allowed: %s' % (
+            target, reason), headers, BytesIO())
+    return target
+
+
+async def close_writer(writer: Any) -> None:
+    """
+    Closes the connection of an asyncio stream and waits until its socket
+    was closed where the StreamWriter supports it
+    """
+    writer.close()
+    wait_closed = getattr(writer, 'wait_closed', None)
+    if wait_closed is not None:
+        try:
+            await wait_closed()
+        except OSError:
+            # the server already dropped the connection
+            pass
+
+
+class TLSSessionConnection(http.client.HTTPSConnection):
+    """
+    HTTPS connection which resumes a previously negotiated TLS session to
+    skip the full handshake when reconnecting to the same host
+    """
+
+    def __init__(self, host: str, port: int, timeout: float,
+                 context: ssl.SSLContext,
+                 session: Optional[ssl.SSLSession] = None) -> None:
+        super().__init__(host, port, timeout=timeout, context=context)
+        self.session = session
+
+    def connect(self) -> None:
+        http.client.HTTPConnection.connect(self)
+        if self._tunnel_host:
+            server_hostname = self._tunnel_host
+        else:
+            server_hostname = self.host
+        self.sock = self._context.wrap_socket(self.sock,
+                                              server_hostname=server_hostname,
+                                              session=self.session)
+
+
+class RequestDeadline:
+    """
+    Aborts a request which is still running once its timeout elapsed by
+    shutting down the socket of its connection, which makes the update
+    thread's blocking read return right away
+    """
+
+    def __init__(self, timeout: float) -> None:
+        self.timeout = timeout
+        self.connection = None  # type: Optional[http.client.HTTPConnection]
+        self.watch = None  # type: Optional[Watch]
+
+    def expire(self) -> None:
+        connection = self.connection
+        if connection is not None and connection.sock is not None:
+            connection.sock.shutdown(socket.SHUT_RDWR)
+
+    def check(self, error: Optional[BaseException] = None) -> None:
+        """
+        Raises a timeout if the request was aborted, errors caused by the
+        shut down socket are chained
+        """
+        if self.watch is not None and self.watch.expired:
+            raise socket.timeout('Request took longer than %s seconds' %
+                                 self.timeout) from error
+
+
+class PooledResponse:
+    """
+    Wraps a response of a pooled connection. The connection is handed back
+    to the pool once the body has been read completely and closed otherwise
+    """
+
+    def __init__(self, pool: 'ConnectionPool', key: Tuple[str, str, int],
+                 connection: http.client.HTTPConnection,
+                 response: http.client.HTTPResponse,
+                 deadline: Optional[RequestDeadline] = None) -> None:
+        self.pool = pool
+        self.key = key
+        self.connection = connection
+        self.response = response
+        self.deadline = deadline
+        self.status = response.status
+        self.reason = response.reason
+        self.headers = response.headers
+
+    def read(self, amount: Optional[int] = None) -> bytes:
+        if self.deadline is None:
+            return self.response.read(amount)
+        try:
+            data = self.response.read(amount)
+        except Exception as e:
+            self.deadline.check(e)
+            raise
+        # a shut down socket might look like the end of the body
+        self.deadline.check()
+        return data
+
+    def release(self) -> None:
+        if self.connection is None:
+            return
+        reusable = self.response.isclosed() and not self.response.will_close
+        if self.deadline is not None and \
+                not self.pool.watchdog.cancel(self.deadline.watch):
+            reusable = False
+        self.pool.release(self.key, self.connection, reusable)
+        self.connection = None
+
+    def __enter__(self) -> 'PooledResponse':
+        return self
+
+    def __exit__(self, *args: Any) -> None:
+        self.release()
+
+
+class ConnectionPool:
+    """
+    Thread safe pool of persistent HTTP/1.1 connections which is shared by
+    all update threads. Idle connections are kept per scheme, host and port
+    and evicted once they have been unused for longer than the idle timeout
+    or turn out to be broken. Requests with a deadline are aborted by the
+    pool's watchdog
+    """
+
+    def __init__(self, maxsize: int = 10, idle_timeout: float = 30,
+                 ssl_context: Optional[ssl.SSLContext] = None) -> None:
+        self.maxsize = maxsize
+        self.idle_timeout = idle_timeout
+        if ssl_context is None:
+            ssl_context = ssl.create_default_context()
+        self.ssl_context = ssl_context
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self.tls_resumptions = 0
+        self._idle = {}  # type: Dict[Tuple[str, str, int], deque]
+        self._sessions = {}  # type: Dict[Tuple[str, str, int], Any]
+        self._lock = threading.Lock()
+        self.watchdog = Watchdog()
+
+    def request(self, url: str, headers: Dict[str, str], timeout: float,
+                deadline: bool = False) -> PooledResponse:
+        """
+        Sends a GET request and returns the response once its headers were
+        received. Redirects are followed and responses with a status code of
+        400 or higher are read completely and raised as HTTPError like
+        urlopen does.
+        The timeout applies to every socket operation, if deadline is True
+        it also limits the whole request including its redirects until the
+        response is released and socket.timeout is raised once it elapsed
+        """
+        limit = None  # type: Optional[RequestDeadline]
+        if deadline:
+            limit = RequestDeadline(timeout)
+            limit.watch = self.watchdog.watch(timeout, limit.expire)
+        try:
+            redirects = 0
+            while True:
+                response = self._request(url, headers, timeout, limit)
+                location = response.headers.get('Location')
+                if response.status not in REDIRECT_CODES or not location:
+                    return response
+                response.read()
+                # the deadline keeps running for the redirected request
+                response.deadline = None
+                response.release()
+                redirects += 1
+                url = redirect_url(url, location, response.status,
+                                   response.reason, response.headers,
+                                   redirects)
+        except BaseException as e:
+            if limit is not None:
+                self.watchdog.cancel(limit.watch)
+                limit.check(e)
+            raise
+
+    def _request(self, url: str, headers: Dict[str, str], timeout: float,
+                 deadline: Optional[RequestDeadline]) -> PooledResponse:
+        parts = urlsplit(url)
+        scheme = parts.scheme.lower()
+        if scheme == 'https':
+            port = parts.port or 443
+        else:
+            port = parts.port or 80
+        key = (scheme, parts.hostname, port)
+        path = parts.path or '/'
+        if parts.query:
+            path += '?' + parts.query
+        headers = dict(headers)
+        headers['Host'] = parts.netloc.rpartition('@')[2]
+
+        while True:
+            connection, reused = self._acquire(key, timeout)
+            try:
+                if deadline is not None:
+                    deadline.connection = connection
+                    # the deadline might have passed while connecting
+                    deadline.check()
+                connection.request('GET', path, headers=headers)
+                response = connection.getresponse()
+                break
+            except STALE_CONNECTION_ERRORS as e:
+                connection.close()
+                if deadline is not None:
+                    deadline.check(e)
+                if not reused:
+                    raise
+                with self._lock:
+                    self.evictions += 1
+            except BaseException:
+                connection.close()
+                raise
+
+        result = PooledResponse(self, key, connection, response, deadline)
+        if response.status >= 400:
+            body = result.read()
+            result.release()
+            raise HTTPError(url, response.status, response.reason,
+                            response.headers, BytesIO(body))
+        return result
+
+    def release(self, key: Tuple[str, str, int],
+                connection: http.client.HTTPConnection,
+                reusable: bool) -> None:
+        if isinstance(connection, TLSSessionConnection) and connection.sock:
+            session = getattr(connection.sock, 'session', None)
+            if session is not None:
+                with self._lock:
+                    self._sessions[key] = session
+        if not reusable or connection.sock is None:
+            connection.close()
+            return
+        with self._lock:
+            idle = self._idle.setdefault(key, deque())
+            if len(idle) < self.maxsize:
+                idle.append((connection, time.monotonic()))
+                return
+        connection.close()
+
+    def close(self) -> None:
+        """
+        Closes all idle connections
+        """
+        with self._lock:
+            idle, self._idle = self._idle, {}
+        for connections in idle.values():
+            for connection, _ in connections:
+                connection.close()
+
+    def stats(self) -> Dict[str, int]:
+        with self._lock:
+            return {
+                'hits': self.hits,
+                'misses': self.misses,
+                'evictions': self.evictions,
+                'tls_resumptions': self.tls_resumptions,
+                'idle': sum(len(idle) for idle in self._idle.values()),
+            }
+
+    def _acquire(self, key: Tuple[str, str, int], timeout: float) -> \
+            Tuple[http.client.HTTPConnection, bool]:
+        now = time.monotonic()
+        stale = []
+        connection = None
+        with self._lock:
+            idle = self._idle.get(key)
+            while idle:
+                candidate, last_used = idle.pop()
+                if now - last_used > self.idle_timeout or \
+                        candidate.sock is None:
+                    stale.append(candidate)
+                    self.evictions += 1
+                else:
+                    connection = candidate
+                    # connections are handed out LIFO, so everything older
+                    # than the idle timeout piles up at the left side
+                    while idle and now - idle[0][1] > self.idle_timeout:
+                        stale.append(idle.popleft()[0])
+                        self.evictions += 1
+                    break
+            if connection is not None:
+                self.hits += 1
+            else:
+                self.misses += 1
+            session = self._sessions.get(key)
+        for candidate in stale:
+            candidate.close()
+
+        if connection is not None:
+            connection.timeout = timeout
+            connection.sock.settimeout(timeout)
+            return connection, True
+
+        scheme, host, port = key
+        if scheme == 'https':
+            connection = TLSSessionConnection(host, port, timeout,
+                                              self.ssl_context, session)
+            connection.connect()
+            if connection.sock.session_reused:
+                with self._lock:
+                    self.tls_resumptions += 1
+        else:
+            connection = http.client.HTTPConnection(host, port,
+                                                    timeout=timeout)
+        return connection, False
+
+
+class AsyncConnectionPool:
+    """
+    Keep-alive connection pool for non blocking HTTP/1.1 GET requests. A
+    pool is bound to the event loop it was first used on. asyncio is only
+    imported once the pool is used so that the threaded engine starts
+    faster
+    """
+
+    def __init__(self, maxsize: int = 10, idle_timeout: float = 30,
+                 ssl_context: Optional[ssl.SSLContext] = None) -> None:
+        self.maxsize = maxsize
+        self.idle_timeout = idle_timeout
+        if ssl_context is None:
+            ssl_context = ssl.create_default_context()
+        self.ssl_context = ssl_context
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self._idle = {}  # type: Dict[Tuple[str, str, int], deque]
+
+    async def request(self, url: str, headers: Dict[str, str],
+                      timeout: float) -> bytes:
+        """
+        Sends a GET request and returns the response body. Redirects are
+        followed and responses with a status code of 400 or higher are
+        raised as HTTPError. The timeout covers all redirects
+        """
+        import asyncio
+        return await asyncio.wait_for(self._follow(url, headers), timeout)
+
+    async def _follow(self, url: str, headers: Dict[str, str]) -> bytes:
+        redirects = 0
+        while True:
+            status, reason, response_headers, body = \
+                await self._request(url, headers)
+            location = response_headers.get('Location')
+            if status not in REDIRECT_CODES or not location:
+                break
+            redirects += 1
+            url = redirect_url(url, location, status, reason,
+                               response_headers, redirects)
+        if status >= 400:
+            raise HTTPError(url, status, reason, response_headers,
+                            BytesIO(body))
+        return body
+
+    async def _request(self, url: str, headers: Dict[str, str]) -> \
+            Tuple[int, str, http.client.HTTPMessage, bytes]:
+        import asyncio
+        parts = urlsplit(url)
+        scheme = parts.scheme.lower()
+        if scheme == 'https':
+            port = parts.port or 443
+        else:
+            port = parts.port or 80
+        key = (scheme, parts.hostname, port)
+        path = parts.path or '/'
+        if parts.query:
+            path += '?' + parts.query
+        lines = ['GET %s HTTP/1.1' % path,
+                 'Host: %s' % parts.netloc.rpartition('@')[2]]
+        lines += ['%s: %s' % (name, value) for name, value in headers.items()]
+        payload = ('\r\n'.join(lines) + '\r\n\r\n').encode('latin-1')
+
+        while True:
+            reader, writer, reused = await self._acquire(key)
+            try:
+                writer.write(payload)
+                await writer.drain()
+                status, reason, response_headers, body, keep_alive = \
+                    await self._read_response(reader)
+                break
+            except STALE_CONNECTION_ERRORS + (asyncio.IncompleteReadError,):
+                await close_writer(writer)
+                if not reused:
+                    raise
+                self.evictions += 1
+            except BaseException:
+                # the request might have been cancelled by its timeout, so
+                # the socket is closed without waiting
+                writer.close()
+                raise
+
+        if keep_alive:
+            idle = self._idle.setdefault(key, deque())
+            if len(idle) < self.maxsize:
+                idle.append((reader, writer, time.monotonic()))
+            else:
+                await close_writer(writer)
+        else:
+            await close_writer(writer)
+        return status, reason, response_headers, body
+
+    async def _acquire(self, key: Tuple[str, str, int]) -> Tuple[Any, Any,
+                                                                 bool]:
+        now = time.monotonic()
+        idle = self._idle.get(key)
+        while idle:
+            reader, writer, last_used = idle.pop()
+            if now - last_used > self.idle_timeout or reader.at_eof():
+                await close_writer(writer)
+                self.evictions += 1
+            else:
+                self.hits += 1
+                return reader, writer, True
+        self.misses += 1
+        import asyncio
+        scheme, host, port = key
+        if scheme == 'https':
+            reader, writer = await asyncio.open_connection(
+                host, port, ssl=self.ssl_context)
+        else:
+            reader, writer = await asyncio.open_connection(host, port)
+        return reader, writer, False
+
+    async def _read_response(self, reader: Any) -> \
+            Tuple[int, str, http.client.HTTPMessage, bytes, bool]:
+        while True:
+            status_line = await reader.readuntil(b'\r\n')
+            version, status, reason = (status_line.decode('latin-1').strip()
+                                       .split(' ', 2) + [''])[:3]
+            header_lines = []
+            while True:
+                line = await reader.readuntil(b'\r\n')
+                header_lines.append(line)
+                if line == b'\r\n':
+                    break
+            # interim responses like 100 Continue precede the actual one
+            if not 100 <= int(status) < 200:
+                break
+        headers = http.client.parse_headers(BytesIO(b''.join(header_lines)))
+        keep_alive = version == 'HTTP/1.1' and \
+            headers.get('Connection', '').lower() != 'close'
+
+        if int(status) in BODYLESS_CODES:
+            # the server might still send a length, but never a body
+            body = b''
+        elif headers.get('Transfer-Encoding', '').lower() == 'chunked':
+            chunks = []
+            while True:
+                size_line = await reader.readuntil(b'\r\n')
+                size = int(size_line.split(b';', 1)[0].strip(), 16)
+                if size == 0:
+                    # skip optional trailer headers
+                    while await reader.readuntil(b'\r\n') != b'\r\n':
+                        pass
+                    break
+                chunks.append(await reader.readexactly(size))
+                await reader.readexactly(2)
+            body = b''.join(chunks)
+        elif 'Content-Length' in headers:
+            body = await reader.readexactly(int(headers['Content-Length']))
+        else:
+            body = await reader.read()
+            keep_alive = False
+        return int(status), reason, headers, body, keep_alive
+
+    async def close(self) -> None:
+        """
+        Closes all idle connections, must be awaited on the event loop of
+        the pool before the loop is closed
+        """
+        idle, self._idle = self._idle, {}
+        for connections in idle.values():
+            for _, writer, _ in connections:
+                await close_writer(writer)
@@ -0,0 +1,90 @@
+import json
+import os
+import socket
+import stat
+import threading
+from socketserver import StreamRequestHandler, ThreadingMixIn, \
+    UnixStreamServer
+from typing import Any, Callable, Dict
+
+
+def remove_stale_socket(path: str) -> None:
+    """
+    Removes the socket of an updater which did not shut down cleanly
+    :raises OSError if the path is not a socket or still in use
+    """
+    try:
+        mode = os.stat(path).st_mode
+    except FileNotFoundError:
+        return
+    if not stat.S_ISSOCK(mode):
+        raise OSError('%s exists and is not a socket' % path)
+    client = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+    try:
+        client.connect(path)
+    except (ConnectionRefusedError, FileNotFoundError):
+        os.unlink(path)
+        return
+    finally:
+        client.close()
+    raise OSError('%s is used by another updater' % path)
+
+
+class ControlServer(ThreadingMixIn, UnixStreamServer):
+    """
+    Answers commands on a Unix domain socket from a background thread.
+    Clients send one JSON object with a command key per line and receive
+    one JSON object per line, which contains an ok key and either the
+    result or the message of the error which the handler raised. Only the
+    owner of the socket may connect
+    """
+    daemon_threads = True
+
+    def __init__(self, path: str,
+                 handler: Callable[[Dict[str, Any]], Dict[str, Any]]) \
+            -> None:
+        self.path = path
+        self.handler = handler
+        self._thread = None  # type: Any
+        remove_stale_socket(path)
+        super().__init__(path, ControlHandler)
+        os.chmod(path, 0o600)
+
+    def start(self) -> None:
+        self._thread = threading.Thread(target=self.serve_forever,
+                                        daemon=True)
+        self._thread.start()
+
+    def close(self) -> None:
+        if self._thread is not None:
+            self.shutdown()
+        self.server_close()
+        try:
+            os.unlink(self.path)
+        except FileNotFoundError:
+            pass
+
+    def handle_command(self, line: bytes) -> Dict[str, Any]:
+        try:
+            request = json.loads(line.decode('utf-8'))
+            if not isinstance(request, dict):
+                raise ValueError('request is not an object')
+        except ValueError as e:
+            return {'ok': False, 'error': 'Invalid request: %s' % e}
+        try:
+            result = self.handler(request)
+        except Exception as e:
+            # the message of the error is sent back to the client
+            return {'ok': False, 'error': str(e)}
+        result['ok'] = True
+        return result
+
+
+class ControlHandler(StreamRequestHandler):
+    def handle(self) -> None:
+        for line in self.rfile:
+            if not line.strip():
+                continue
+            response = self.server.handle_command(line)
+            self.wfile.write(json.dumps(response).encode('utf-8') + b'\n')
+            self.wfile.flush()
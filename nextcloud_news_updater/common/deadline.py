@@ -0,0 +1,125 @@
+import heapq
+import itertools
+import os
+import signal
+import socket
+import subprocess
+import sys
+import threading
+import time
+from typing import Callable, List, Optional, Tuple
+
+
+def is_timeout(error: Optional[Exception]) -> bool:
+    """
+    Returns whether a failed update ran into its timeout, update threads
+    wrap errors which they already logged in FeedUpdateException
+    """
+    if error is None:
+        return False
+    cause = error.__cause__ or error
+    # asyncio is not imported unless the asyncio engine is used
+    asyncio = sys.modules.get('asyncio')
+    if asyncio is not None and isinstance(cause, asyncio.TimeoutError):
+        return True
+    return isinstance(cause, (socket.timeout, TimeoutError,
+                              subprocess.TimeoutExpired))
+
+
+def kill_group(pid: int) -> None:
+    """
+    Kills a process which was started in a new session together with the
+    processes it started
+    """
+    try:
+        os.killpg(pid, signal.SIGKILL)
+    except ProcessLookupError:
+        pass
+
+
+class Watch:
+    """
+    Deadline of a single call which is watched by a Watchdog
+    """
+    __slots__ = ('deadline', 'callback', 'expired')
+
+    def __init__(self, deadline: float,
+                 callback: Optional[Callable[[], None]]) -> None:
+        self.deadline = deadline
+        self.callback = callback
+        self.expired = False
+
+
+class Watchdog:
+    """
+    Calls a function once a deadline passed unless the watch was cancelled
+    before, e.g. to abort a request or kill a process which takes too long.
+    A single background thread serves all update threads, it is started
+    with the first watch. Cancelled watches stay in the heap until they
+    reach the top or until they make up half of it
+    """
+
+    def __init__(self, clock: Callable[[], float] = time.monotonic) -> None:
+        self.clock = clock
+        self._heap = []  # type: List[Tuple[float, int, Watch]]
+        self._cancelled = 0
+        self._sequence = itertools.count()
+        self._condition = threading.Condition()
+        self._thread = None  # type: Optional[threading.Thread]
+
+    def watch(self, seconds: float, callback: Callable[[], None]) -> Watch:
+        watch = Watch(self.clock() + seconds, callback)
+        with self._condition:
+            heapq.heappush(self._heap,
+                           (watch.deadline, next(self._sequence), watch))
+            if self._thread is None:
+                self._thread = threading.Thread(target=self._run,
+                                                name='Watchdog', daemon=True)
+                self._thread.start()
+            elif self._heap[0][2] is watch:
+                self._condition.notify()
+        return watch
+
+    def cancel(self, watch: Watch) -> bool:
+        """
+        Stops watching and returns False if the deadline already passed
+        """
+        with self._condition:
+            if watch.expired:
+                return False
+            if watch.callback is not None:
+                watch.callback = None
+                self._cancelled += 1
+                if self._cancelled > len(self._heap) // 2:
+                    self._heap = [entry for entry in self._heap
+                                  if entry[2].callback is not None]
+                    heapq.heapify(self._heap)
+                    self._cancelled = 0
+            return True
+
+    def _run(self) -> None:
+        with self._condition:
+            while True:
+                heap = self._heap
+                while heap and heap[0][2].callback is None:
+                    heapq.heappop(heap)
+                    self._cancelled -= 1
+                if not heap:
+                    self._condition.wait()
+                    continue
+                remaining = heap[0][0] - self.clock()
+                if remaining > 0:
+                    self._condition.wait(remaining)
+                    continue
+                watch = heapq.heappop(heap)[2]
+                watch.expired = True
+                callback, watch.callback = watch.callback, None
+                self._condition.release()
+                try:
+                    callback()
+                except Exception:
+                    # e.g. the process exited or the socket was closed in
+                    # the meantime
+                    pass
+                finally:
+                    self._condition.acquire()
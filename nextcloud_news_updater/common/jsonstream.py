@@ -0,0 +1,164 @@
+import codecs
+import json
+from typing import Any, Iterable, Iterator, Optional
+
+WHITESPACE = ' \t\n\r'
+NUMBER_CHARS = '0123456789.eE+-'
+# size in characters after which a value which can not be decoded is
+# considered broken instead of incomplete
+MAX_VALUE_SIZE = 1024 * 1024
+
+
+class JsonStream:
+    """
+    Incremental reader for JSON documents which arrive in chunks of bytes,
+    e.g. from an HTTP response or the output of a command. Only the values
+    which are currently being decoded are kept in memory, so huge lists can
+    be processed one item at a time
+    """
+
+    def __init__(self, chunks: Iterable[bytes]) -> None:
+        self.chunks = iter(chunks)
+        self.decoder = json.JSONDecoder()
+        self._utf8 = codecs.getincrementaldecoder('utf-8')()
+        self._buffer = ''
+        self._pos = 0
+        self._eof = False
+
+    def items(self, key: Optional[str] = None) -> Iterator[Any]:
+        """
+        Yields the items of a list which is either the document itself or,
+        if key is given, the value of key in the document's top level
+        object. Yields nothing if the document is null, an empty object or
+        an object without key
+        """
+        start = self._peek()
+        if start == 'n':
+            self._value()
+        elif key is None or start == '[':
+            yield from self._list()
+        else:
+            for name in self._members():
+                if name == key:
+                    yield from self._list()
+                else:
+                    self._value()
+        self._end()
+
+    def keys(self) -> Iterator[str]:
+        """
+        Yields the keys of the document's top level object
+        """
+        for name in self._members():
+            self._value()
+            yield name
+        self._end()
+
+    def _list(self) -> Iterator[Any]:
+        self._expect('[')
+        if self._peek() == ']':
+            self._pos += 1
+            return
+        while True:
+            yield self._value()
+            if self._expect(',]') == ']':
+                return
+
+    def _members(self) -> Iterator[str]:
+        self._expect('{')
+        if self._peek() == '}':
+            self._pos += 1
+            return
+        while True:
+            name = self._value()
+            if not isinstance(name, str):
+                self._error('Expected object key')
+            self._expect(':')
+            # the caller consumes the member's value
+            yield name
+            if self._expect(',}') == '}':
+                return
+
+    def _value(self) -> Any:
+        self._peek()
+        while True:
+            try:
+                value, end = self.decoder.raw_decode(self._buffer, self._pos)
+            except ValueError:
+                if len(self._buffer) - self._pos > MAX_VALUE_SIZE or \
+                        not self._read():
+                    raise
+                continue
+            # numbers at the end of the buffer might continue in the next
+            # chunk, e.g. 12 might be the beginning of 12.5
+            if not self._incomplete(value, end) or not self._read():
+                self._pos = end
+                return value
+
+    def _incomplete(self, value: Any, end: int) -> bool:
+        if isinstance(value, bool) or not isinstance(value, (int, float)):
+            return False
+        return all(char in NUMBER_CHARS for char in self._buffer[end:])
+
+    def _expect(self, chars: str) -> str:
+        char = self._peek()
+        if char not in chars:
+            self._error('Expected one of "%s"' % chars)
+        self._pos += 1
+        return char
+
+    def _end(self) -> None:
+        if self._peek(required=False):
+            self._error('Extra data')
+
+    def _peek(self, required: bool = True) -> str:
+        """
+        Skips whitespace and returns the next character
+        """
+        while True:
+            while self._pos < len(self._buffer) and \
+                    self._buffer[self._pos] in WHITESPACE:
+                self._pos += 1
+            if self._pos < len(self._buffer):
+                return self._buffer[self._pos]
+            if not self._read():
+                if required:
+                    self._error('Unexpected end of data')
+                return ''
+
+    def _read(self) -> bool:
+        """
+        Appends the next chunk to the buffer and drops everything which was
+        consumed already. Returns False once all chunks were read
+        """
+        if self._eof:
+            return False
+        chunk = b''
+        while not chunk:
+            try:
+                chunk = next(self.chunks)
+            except StopIteration:
+                self._eof = True
+                tail = self._utf8.decode(b'', final=True)
+                self._buffer = self._buffer[self._pos:] + tail
+                self._pos = 0
+                return bool(tail)
+        self._buffer = self._buffer[self._pos:] + self._utf8.decode(chunk)
+        self._pos = 0
+        return True
+
+    def _error(self, message: str) -> None:
+        context = self._buffer[self._pos:self._pos + 100]
+        raise ValueError('%s: %s' % (message, context))
+
+
+def iter_chunks(read: Any, size: int = 64 * 1024) -> Iterator[bytes]:
+    """
+    Yields chunks from a file like object's read method until it is
+    exhausted
+    """
+    while True:
+        chunk = read(size)
+        if not chunk:
+            return
+        yield chunk
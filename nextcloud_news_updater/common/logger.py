@@ -1,20 +1,224 @@
+import atexit
+import json
 import logging
+import queue
+import sys
+from logging.handlers import QueueHandler, QueueListener
+from typing import Any, Callable, Dict, Optional
 
 from nextcloud_news_updater.config import Config
 
+LOGGER_NAME = 'Nextcloud News Updater'
+TEXT_FORMAT = '%(asctime)s - %(name)s - %(levelname)s - %(message)s'
+# number of records which wait for the writer thread at most, further
+# records are dropped instead of blocking the update threads
+QUEUE_SIZE = 10000
+
+
+class Lazy:
+    """
+    Log argument which calls a function when the message is formatted, so
+    that e.g. joining a command line only happens if the message is logged
+    """
+    __slots__ = ('function', 'args')
+
+    def __init__(self, function: Callable[..., Any], *args: Any) -> None:
+        self.function = function
+        self.args = args
+
+    def __str__(self) -> str:
+        return str(self.function(*self.args))
+
+
+def truncate(message: str, max_length: int) -> str:
+    if max_length <= 0 or len(message) <= max_length:
+        return message
+    return '%s... (%d more characters)' % (message[:max_length],
+                                           len(message) - max_length)
+
+
+class Sampler(logging.Filter):
+    """
+    Passes only every rate-th info message of each message template so that
+    frequent messages like the one for every updated feed can be logged in
+    production. Errors are never sampled
+    """
+
+    def __init__(self, rate: int) -> None:
+        super().__init__()
+        self.rate = rate
+        self._counts = {}  # type: Dict[Any, int]
+
+    def filter(self, record: logging.LogRecord) -> bool:
+        if self.rate <= 1 or record.levelno > logging.INFO:
+            return True
+        # races between threads only make the sampling less exact
+        count = self._counts.get(record.msg, 0)
+        self._counts[record.msg] = count + 1
+        if count % self.rate != 0:
+            return False
+        record.sample_rate = self.rate
+        return True
+
+
+class TextFormatter(logging.Formatter):
+    def __init__(self, max_length: int) -> None:
+        super().__init__(TEXT_FORMAT)
+        self.max_length = max_length
+
+    def formatMessage(self, record: logging.LogRecord) -> str:
+        record.message = truncate(record.message, self.max_length)
+        return super().formatMessage(record)
+
+
+class JsonFormatter(logging.Formatter):
+    """
+    Formats records as one JSON object per line. Besides the formatted
+    message the template is included so that messages can be grouped
+    """
+
+    def __init__(self, max_length: int) -> None:
+        super().__init__()
+        self.max_length = max_length
+
+    def format(self, record: logging.LogRecord) -> str:
+        entry = {
+            'time': round(record.created, 3),
+            'level': record.levelname.lower(),
+            'logger': record.name,
+            'thread': record.threadName,
+            'template': str(record.msg),
+            'message': truncate(record.getMessage(), self.max_length),
+        }  # type: Dict[str, Any]
+        sample_rate = getattr(record, 'sample_rate', None)
+        if sample_rate is not None:
+            entry['sample_rate'] = sample_rate
+        if record.exc_info:
+            entry['exception'] = self.formatException(record.exc_info)
+        return json.dumps(entry)
+
+
+class BackgroundHandler(QueueHandler):
+    """
+    Hands records to the writer thread without formatting them: messages
+    are formatted by the writer, so arguments must not be changed after
+    they were logged. Records are dropped if the writer falls behind
+    """
+
+    def __init__(self, records: queue.Queue) -> None:
+        super().__init__(records)
+        self.dropped = 0
+
+    def prepare(self, record: logging.LogRecord) -> logging.LogRecord:
+        return record
+
+    def enqueue(self, record: logging.LogRecord) -> None:
+        try:
+            self.queue.put_nowait(record)
+        except queue.Full:
+            self.dropped += 1
+
+
+class LogWriter:
+    """
+    Writes the records of the updater's logger to stderr from a background
+    thread. Only one writer is active, creating a new one replaces the
+    previous one
+    """
+    current = None  # type: Optional[LogWriter]
+
+    def __init__(self, logger: logging.Logger, formatter: logging.Formatter,
+                 sample_rate: int) -> None:
+        if LogWriter.current is not None:
+            LogWriter.current.stop()
+        else:
+            atexit.register(LogWriter.stop_current)
+        LogWriter.current = self
+        self.logger = logger
+        stream = logging.StreamHandler(sys.stderr)
+        stream.setFormatter(formatter)
+        self.handler = BackgroundHandler(queue.Queue(QUEUE_SIZE))
+        self.sampler = Sampler(sample_rate)
+        self.listener = QueueListener(self.handler.queue, stream)
+        logger.addHandler(self.handler)
+        logger.addFilter(self.sampler)
+        self.listener.start()
+
+    def stop(self) -> None:
+        self.logger.removeHandler(self.handler)
+        self.logger.removeFilter(self.sampler)
+        self.listener.stop()
+        if self.handler.dropped > 0:
+            print('%d log messages were dropped because they could not be '
+                  'written fast enough' % self.handler.dropped,
+                  file=sys.stderr)
+
+    @staticmethod
+    def stop_current() -> None:
+        if LogWriter.current is not None:
+            LogWriter.current.stop()
+            LogWriter.current = None
+
 
 class Logger:
+    """
+    Logs messages from a background thread. Arguments are only formatted
+    into the message if the message is logged, so prefer
+    logger.info('%s', value) over logger.info('%s' % value)
+    """
+
     def __init__(self, config: Config) -> None:
-        log_format = '%(asctime)s - %(name)s - %(levelname)s - %(message)s'
-        logging.basicConfig(format=log_format)
-        self.logger = logging.getLogger('Nextcloud News Updater')
+        self.logger = logging.getLogger(LOGGER_NAME)
+        self.logger.propagate = False
         if config.loglevel == 'info':
             self.logger.setLevel(logging.INFO)
         else:
             self.logger.setLevel(logging.ERROR)
+        max_length = config.logmaxlength
+        formatter = TextFormatter(max_length)  # type: logging.Formatter
+        if config.logformat == 'json':
+            formatter = JsonFormatter(max_length)
+        LogWriter(self.logger, formatter, config.logsample)
+
+    def info(self, message: str, *args: Any) -> None:
+        self.logger.info(message, *args)
+
+    def error(self, message: str, *args: Any) -> None:
+        self.logger.error(message, *args)
+
+    def exception(self, message: str, *args: Any) -> None:
+        """
+        Logs an error with the traceback of the exception which is being
+        handled
+        """
+        self.logger.error(message, *args, exc_info=True)
+
+
+class InstanceLogger(Logger):
+    """
+    Logger for one of several Nextcloud instances which are updated by the
+    same process, prefixes every message with the name of the instance
+    """
+
+    def __init__(self, logger: Logger, name: str) -> None:
+        self.logger = logger.logger
+        self.name = name
+
+    def info(self, message: str, *args: Any) -> None:
+        self.logger.info(self._prefix(message, args), *args)
+
+    def error(self, message: str, *args: Any) -> None:
+        self.logger.error(self._prefix(message, args), *args)
 
-    def info(self, message: str) -> None:
-        self.logger.info(message)
+    def exception(self, message: str, *args: Any) -> None:
+        self.logger.error(self._prefix(message, args), *args, exc_info=True)
 
-    def error(self, message: str) -> None:
-        self.logger.error(message)
+    def _prefix(self, message: str, args: Any) -> str:
+        """
+        Prefixes the template instead of passing the message as argument so
+        that every message of every instance is sampled on its own. The
+        template is only formatted if there are arguments
+        """
+        if args:
+            return self.name.replace('%', '%%') + ': ' + message
+        return self.name + ': ' + message
@@ -0,0 +1,43 @@
+import socket
+import threading
+from http.server import BaseHTTPRequestHandler, HTTPServer
+from socketserver import ThreadingMixIn
+from typing import Any
+
+from nextcloud_news_updater.common.prometheus import CONTENT_TYPE
+
+
+class MetricsServer(ThreadingMixIn, HTTPServer):
+    """
+    Serves the metrics of a registry on /metrics from a background thread.
+    Kept apart from the metrics so that http.server is only imported if
+    the metrics are served. Addresses with a colon are IPv6 addresses
+    """
+    daemon_threads = True
+
+    def __init__(self, registry: Any, port: int,
+                 host: str = '127.0.0.1') -> None:
+        self.registry = registry
+        if ':' in host:
+            self.address_family = socket.AF_INET6
+        super().__init__((host, port), MetricsHandler)
+
+    def start(self) -> None:
+        thread = threading.Thread(target=self.serve_forever, daemon=True)
+        thread.start()
+
+
+class MetricsHandler(BaseHTTPRequestHandler):
+    def do_GET(self) -> None:
+        if self.path.split('?')[0] not in ('/', '/metrics'):
+            self.send_error(404)
+            return
+        body = self.server.registry.render().encode('utf-8')
+        self.send_response(200)
+        self.send_header('Content-Type', CONTENT_TYPE)
+        self.send_header('Content-Length', str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def log_message(self, *args: Any) -> None:
+        pass
@@ -0,0 +1,189 @@
+import bisect
+import threading
+from collections import OrderedDict
+from typing import Any, Callable, Dict, List, Optional, Sequence, Tuple
+
+CONTENT_TYPE = 'text/plain; version=0.0.4; charset=utf-8'
+
+LabelValues = Tuple[str, ...]
+
+
+def format_value(value: float) -> str:
+    if value == float('inf'):
+        return '+Inf'
+    if value == int(value):
+        return str(int(value))
+    return repr(value)
+
+
+def format_labels(names: Sequence[str], values: Sequence[str]) -> str:
+    if not names:
+        return ''
+    pairs = []
+    for name, value in zip(names, values):
+        value = value.replace('\\', '\\\\').replace('"', '\\"') \
+            .replace('\n', '\\n')
+        pairs.append('%s="%s"' % (name, value))
+    return '{%s}' % ','.join(pairs)
+
+
+class Metric:
+    """
+    Baseclass for metrics which are exposed in the Prometheus text format.
+    Metrics with label names keep one value per combination of label values
+    """
+    type = 'untyped'
+
+    def __init__(self, name: str, help: str,
+                 labels: Sequence[str] = ()) -> None:
+        self.name = name
+        self.help = help
+        self.label_names = tuple(labels)
+        self._lock = threading.Lock()
+
+    def samples(self) -> List[Tuple[str, LabelValues, float]]:
+        raise NotImplementedError
+
+    def header(self) -> List[str]:
+        return ['# HELP %s %s' % (self.name, self.help),
+                '# TYPE %s %s' % (self.name, self.type)]
+
+    def render(self, const_labels: Sequence[Tuple[str, str]] = ()) \
+            -> List[str]:
+        """
+        Renders the samples, const_labels are added to every sample
+        """
+        lines = []  # type: List[str]
+        const_names = tuple(name for name, _ in const_labels)
+        const_values = tuple(value for _, value in const_labels)
+        for suffix, labels, value in self.samples():
+            names = self.label_names
+            if len(labels) > len(names):
+                names += ('le',)
+            lines.append('%s%s%s %s' % (self.name, suffix,
+                                        format_labels(const_names + names,
+                                                      const_values + labels),
+                                        format_value(value)))
+        return lines
+
+
+class Counter(Metric):
+    type = 'counter'
+
+    def __init__(self, name: str, help: str,
+                 labels: Sequence[str] = ()) -> None:
+        super().__init__(name, help, labels)
+        self._values = {}  # type: Dict[LabelValues, float]
+        if not labels:
+            self._values[()] = 0
+
+    def inc(self, *labels: str, amount: float = 1) -> None:
+        with self._lock:
+            self._values[labels] = self._values.get(labels, 0) + amount
+
+    def value(self, *labels: str) -> float:
+        with self._lock:
+            return self._values.get(labels, 0)
+
+    def samples(self) -> List[Tuple[str, LabelValues, float]]:
+        with self._lock:
+            return [('', labels, value)
+                    for labels, value in sorted(self._values.items())]
+
+
+class Gauge(Counter):
+    """
+    Value which can go up and down. If a callback is given, the value is
+    read from it when the metrics are collected
+    """
+    type = 'gauge'
+
+    def __init__(self, name: str, help: str, labels: Sequence[str] = (),
+                 callback: Optional[Callable[[], float]] = None) -> None:
+        super().__init__(name, help, labels)
+        self.callback = callback
+
+    def set(self, value: float, *labels: str) -> None:
+        with self._lock:
+            self._values[labels] = value
+
+    def samples(self) -> List[Tuple[str, LabelValues, float]]:
+        if self.callback is not None:
+            return [('', (), self.callback())]
+        return super().samples()
+
+
+class Histogram(Metric):
+    type = 'histogram'
+
+    def __init__(self, name: str, help: str, buckets: Sequence[float],
+                 labels: Sequence[str] = ()) -> None:
+        super().__init__(name, help, labels)
+        self.buckets = sorted(buckets)
+        # observations per bucket and label values, the last bucket is +Inf
+        self._counts = {}  # type: Dict[LabelValues, List[int]]
+        self._sums = {}  # type: Dict[LabelValues, float]
+
+    def observe(self, value: float, *labels: str) -> None:
+        bucket = bisect.bisect_left(self.buckets, value)
+        with self._lock:
+            counts = self._counts.get(labels)
+            if counts is None:
+                counts = self._counts[labels] = [0] * (len(self.buckets) + 1)
+                self._sums[labels] = 0.0
+            counts[bucket] += 1
+            self._sums[labels] += value
+
+    def samples(self) -> List[Tuple[str, LabelValues, float]]:
+        with self._lock:
+            values = sorted((labels, list(counts), self._sums[labels])
+                            for labels, counts in self._counts.items())
+        bounds = [format_value(bound) for bound in self.buckets] + ['+Inf']
+        samples = []  # type: List[Tuple[str, LabelValues, float]]
+        for labels, counts, total in values:
+            cumulative = 0
+            for bound, count in zip(bounds, counts):
+                cumulative += count
+                samples.append(('_bucket', labels + (bound,), cumulative))
+            samples.append(('_sum', labels, total))
+            samples.append(('_count', labels, cumulative))
+        return samples
+
+
+class Registry:
+    def __init__(self) -> None:
+        self.metrics = []  # type: List[Metric]
+
+    def register(self, metric: Any) -> Any:
+        self.metrics.append(metric)
+        return metric
+
+    def render(self) -> str:
+        lines = []  # type: List[str]
+        for metric in self.metrics:
+            lines += metric.header() + metric.render()
+        return '\n'.join(lines) + '\n'
+
+
+class LabeledRegistries:
+    """
+    Renders registries with the same metrics together, e.g. those of several
+    updater instances, and tells their samples apart by the value of label
+    """
+
+    def __init__(self, label: str, registries: Dict[str, Registry]) -> None:
+        self.label = label
+        self.registries = registries
+
+    def render(self) -> str:
+        families = OrderedDict()  # type: Dict[str, List[str]]
+        for value, registry in self.registries.items():
+            for metric in registry.metrics:
+                lines = families.get(metric.name)
+                if lines is None:
+                    lines = families[metric.name] = metric.header()
+                lines += metric.render([(self.label, value)])
+        lines = []
+        for family in families.values():
+            lines += family
+        return '\n'.join(lines) + '\n'
@@ -1,8 +1,13 @@
 import configparser
 import os
-from typing import List, Union, Any
+import shutil
+from collections import OrderedDict
+from typing import Dict, List, Union, Any
 from typing import Optional
 
+# prefix of the config file sections of the instances run by the supervisor
+INSTANCE_SECTION_PREFIX = 'updater:'
+
 
 class InvalidConfigException(Exception):
     pass
@@ -19,6 +24,7 @@ class Types:
     integer = 0
     boolean = 1
     string = 2
+    number = 3
 
 
 class Config:
@@ -35,8 +41,43 @@ class Config:
         'apilevel': Types.string,
         'mode': Types.string,
         'threads': Types.integer,
+        'timeout': Types.integer,
         'interval': Types.integer,
         'php': Types.string,
+        'engine': Types.string,
+        'batchsize': Types.integer,
+        'batchmemory': Types.integer,
+        'nice': Types.integer,
+        'ionice': Types.string,
+        'phpmemory': Types.integer,
+        'phpcpu': Types.integer,
+        'maxload': Types.number,
+        'minfreememory': Types.integer,
+        'controlsocket': Types.string,
+        'statedir': Types.string,
+        'mininterval': Types.integer,
+        'maxinterval': Types.integer,
+        'dispatch': Types.string,
+        'userlimit': Types.integer,
+        'metricsport': Types.integer,
+        'metricsaddress': Types.string,
+        'minthreads': Types.integer,
+        'maxthreads': Types.integer,
+        'refreshinterval': Types.integer,
+        'cleanupinterval': Types.integer,
+        'feedlistrefresh': Types.integer,
+        'profile': Types.string,
+        'profiler': Types.string,
+        'history': Types.string,
+        'retries': Types.integer,
+        'feedbreaker': Types.integer,
+        'serverbreaker': Types.integer,
+        'logformat': Types.string,
+        'logmaxlength': Types.integer,
+        'logsample': Types.integer,
+        'shardindex': Types.integer,
+        'shardcount': Types.integer,
+        'weight': Types.integer,
     }
 
     def __init__(self) -> None:
@@ -51,6 +92,42 @@ class Config:
         self.user = None  # type: Optional[str]
         self.url = None  # type: Optional[str]
         self.phpini = None  # type: Optional[str]
+        self.engine = 'threads'
+        self.batchsize = 0
+        self.batchmemory = 256
+        self.nice = 0
+        self.ionice = 'none'
+        self.phpmemory = 0
+        self.phpcpu = 0
+        self.maxload = 0.0
+        self.minfreememory = 0
+        self.controlsocket = None  # type: Optional[str]
+        self.statedir = None  # type: Optional[str]
+        self.mininterval = 0
+        self.maxinterval = 0
+        self.dispatch = 'fair'
+        self.userlimit = 0
+        self.metricsport = 0
+        # the metrics reveal feed and user ids, so they are only served
+        # locally unless another address is configured
+        self.metricsaddress = '127.0.0.1'
+        self.minthreads = 1
+        self.maxthreads = 0
+        self.refreshinterval = 0
+        self.cleanupinterval = 0
+        self.feedlistrefresh = 0
+        self.profile = None  # type: Optional[str]
+        self.profiler = 'none'
+        self.history = None  # type: Optional[str]
+        self.retries = 2
+        self.feedbreaker = 0
+        self.serverbreaker = 0
+        self.logformat = 'text'
+        self.logmaxlength = 2000
+        self.logsample = 1
+        self.shardindex = 0
+        self.shardcount = 1
+        self.weight = 1
 
     def is_web(self) -> bool:
         return self.url is not None and (self.url.startswith('http://') or
@@ -70,29 +147,148 @@ class ConfigValidator:
         elif not config.is_web() and not os.path.isdir(config.url):
             return ['Given path is not a directory']
 
-        if config.mode not in ['endless', 'singlerun']:
+        if config.mode not in ['endless', 'singlerun', 'continuous']:
             result += ['Unknown mode: %s' % config.mode]
         if config.loglevel not in ['info', 'error']:
             result += ['Unknown loglevel: %s' % config.loglevel]
+        if config.logformat not in ['text', 'json']:
+            result += ['Unknown logformat: %s' % config.logformat]
+        if config.timeout <= 0:
+            result += ['Timeout must be positive']
+        if config.logmaxlength < 0:
+            result += ['Maximum log message length must not be negative']
+        if config.logsample < 1:
+            result += ['Log sample rate must be at least 1']
         if config.apilevel not in ['v1-2', 'v2', 'v15']:
             result += ['Unknown apilevel: %s' % config.apilevel]
+        if config.engine not in ['threads', 'asyncio']:
+            result += ['Unknown engine: %s' % config.engine]
+        if config.dispatch not in ['fifo', 'fair', 'longest']:
+            result += ['Unknown dispatch: %s' % config.dispatch]
+        if config.userlimit < 0:
+            result += ['User limit must not be negative']
+        if config.maxthreads > 0 and config.minthreads < 1:
+            result += ['Minimum number of threads must be at least 1']
+        if config.maxthreads > 0 and config.minthreads > config.maxthreads:
+            result += ['Minimum number of threads must not exceed maximum '
+                       'number of threads']
+        if config.refreshinterval < 0:
+            result += ['Refresh interval must not be negative']
+        if config.cleanupinterval < 0:
+            result += ['Cleanup interval must not be negative']
+        if config.feedlistrefresh < 0:
+            result += ['Feed list refresh interval must not be negative']
+        if config.profiler not in ['none', 'cprofile', 'sampling']:
+            result += ['Unknown profiler: %s' % config.profiler]
+        elif config.profiler != 'none' and not config.profile:
+            result += ['Profiler requires a profile file']
+        if config.retries < 0:
+            result += ['Number of retries must not be negative']
+        if config.feedbreaker < 0:
+            result += ['Feed breaker threshold must not be negative']
+        if config.serverbreaker < 0:
+            result += ['Server breaker threshold must not be negative']
+        if config.shardcount < 1:
+            result += ['Number of shards must be at least 1']
+        elif not 0 <= config.shardindex < config.shardcount:
+            result += ['Shard index must be between 0 and the number of '
+                       'shards minus 1']
+        if config.weight < 1:
+            result += ['Weight must be at least 1']
+        if not 0 <= config.metricsport <= 65535:
+            result += ['Invalid metrics port: %d' % config.metricsport]
+        if not config.metricsaddress:
+            result += ['Metrics address must not be empty']
+
+        if config.batchsize < 0:
+            result += ['Batch size must not be negative']
+        if config.batchmemory <= 0:
+            result += ['Batch memory limit must be positive']
+        if not 0 <= config.nice <= 19:
+            result += ['Nice value must be between 0 and 19']
+        if config.ionice not in ['none', 'besteffort', 'idle']:
+            result += ['Unknown ionice class: %s' % config.ionice]
+        elif config.ionice != 'none' and not shutil.which('ionice'):
+            result += ['ionice class requires the ionice command']
+        if config.phpmemory < 0:
+            result += ['PHP memory limit must not be negative']
+        if config.phpcpu < 0:
+            result += ['PHP CPU time limit must not be negative']
+        if (config.phpmemory > 0 or config.phpcpu > 0) and \
+                not self._has_prlimit():
+            result += ['PHP resource limits are only supported on Linux']
+        if config.maxload < 0:
+            result += ['Maximum load must not be negative']
+        if config.minfreememory < 0:
+            result += ['Minimum free memory must not be negative']
+
+        if config.maxinterval > 0 and not config.statedir:
+            result += ['Adaptive scheduling requires a state directory']
+        if config.dispatch == 'longest' and config.mode != 'continuous' \
+                and not config.statedir:
+            result += ['Longest first dispatch requires a state directory']
+        if config.maxinterval > 0 and \
+                config.mininterval > config.maxinterval:
+            result += ['Minimum interval must not exceed maximum interval']
+        if config.statedir and not os.path.isdir(config.statedir):
+            result += ['State directory does not exist']
+        if config.history and \
+                not os.path.isdir(os.path.dirname(config.history) or '.'):
+            result += ['Directory of the history database does not exist']
+        if config.controlsocket and not os.path.isdir(
+                os.path.dirname(config.controlsocket) or '.'):
+            result += ['Directory of the control socket does not exist']
 
         if config.phpini and not os.path.isabs(config.phpini):
             result += ['Path to php.ini must be absolute']
 
         return result
 
+    def _has_prlimit(self) -> bool:
+        try:
+            import resource
+        except ImportError:
+            return False
+        return hasattr(resource, 'prlimit')
+
 
 class ConfigParser:
     def parse_file(self, path: str) -> Config:
+        parser = self._read(path)
+        config = Config()
+        if parser.has_section('updater') or not self._instances(parser):
+            self._parse_section(parser['updater'], config)
+        return config
+
+    def parse_instances(self, path: str) -> Dict[str, Config]:
+        """
+        Parses the [updater:<name>] sections of a config file which
+        configure the instances run by the supervisor. Values of the
+        [updater] section apply to all instances unless they are overridden
+        """
+        parser = self._read(path)
+        instances = OrderedDict()  # type: Dict[str, Config]
+        for section in self._instances(parser):
+            config = Config()
+            if parser.has_section('updater'):
+                self._parse_section(parser['updater'], config)
+            self._parse_section(parser[section], config)
+            instances[section[len(INSTANCE_SECTION_PREFIX):]] = config
+        return instances
+
+    def _read(self, path: str) -> configparser.ConfigParser:
         parser = configparser.ConfigParser()
         successfully_parsed = parser.read(path)
         if len(successfully_parsed) <= 0:
             raise InvalidConfigException(
                 'Error: could not find config file %s' % path)
-        contents = parser['updater']
+        return parser
 
-        config = Config()
+    def _instances(self, parser: configparser.ConfigParser) -> List[str]:
+        return [section for section in parser.sections()
+                if section.startswith(INSTANCE_SECTION_PREFIX)]
+
+    def _parse_section(self, contents: Any, config: Config) -> None:
         for key in contents:
             if not hasattr(config, key):
                 msg = 'Error: unknown config key with name "%s"' % key
@@ -103,12 +299,12 @@ class ConfigParser:
                 value = self._parse_ini_value(type_enum, contents, key)
                 setattr(config, key, value)
 
-        return config
-
     def _parse_ini_value(self, type_enum: int, contents: Any, key: str) -> \
-            Union[str, int, bool]:
+            Union[str, int, float, bool]:
         if type_enum == Types.integer:
             return int(contents.get(key))
+        elif type_enum == Types.number:
+            return float(contents.get(key))
         elif type_enum == Types.boolean:
             return contents.getboolean(key)
         else:
@@ -124,5 +320,7 @@ def merge_configs(args: Any, config: Config) -> None:
     :argument config the config
     """
     for key, type_enum in Config.config_keys.items():
-        if hasattr(args, key) and getattr(args, key):
-            setattr(config, key, getattr(args, key))
+        value = getattr(args, key, None)
+        # 0 is a meaningful value for many options, only unset ones are None
+        if value is not None:
+            setattr(config, key, value)
@@ -1,31 +1,48 @@
 import sys
+from collections import OrderedDict
+from typing import Any, Dict
 
-from nextcloud_news_updater.api.cli import CliUpdater, CliUpdaterV15, CliApi, \
-    create_cli_api
 from nextcloud_news_updater.api.updater import Updater
-from nextcloud_news_updater.api.web import create_web_api, WebApi, \
-    WebUpdater
 from nextcloud_news_updater.common.argumentparser import ArgumentParser
+from nextcloud_news_updater.common.logger import InstanceLogger, Logger
 from nextcloud_news_updater.config import ConfigParser, ConfigValidator, \
     Config, merge_configs
 from nextcloud_news_updater.dependencyinjection.container import \
     Container as BaseContainer
 
+# the console and the web updater are registered by name so that only the
+# one which is used is imported
+CLI_API = 'nextcloud_news_updater.api.cli.CliApi'
+WEB_API = 'nextcloud_news_updater.api.web.WebApi'
+SUPERVISOR = 'nextcloud_news_updater.supervisor.Supervisor'
+
 
 class Container(BaseContainer):
     def __init__(self) -> None:
         super().__init__()
-        self.register(CliApi, lambda c: create_cli_api(c.resolve(Config)))
-        self.register(WebApi, lambda c: create_web_api(c.resolve(Config)))
+        self.register(CLI_API, self._create_cli_api)
+        self.register(WEB_API, self._create_web_api)
         self.register(Updater, self._create_updater)
         self.register(Config, self._create_config)
+        self.register(SUPERVISOR, self._create_supervisor)
+
+    def _create_cli_api(self, container: BaseContainer) -> Any:
+        from nextcloud_news_updater.api.cli import create_cli_api
+        return create_cli_api(container.resolve(Config))
+
+    def _create_web_api(self, container: BaseContainer) -> Any:
+        from nextcloud_news_updater.api.web import create_web_api
+        return create_web_api(container.resolve(Config))
 
     def _create_updater(self, container: BaseContainer) -> Updater:
         if container.resolve(Config).is_web():
+            from nextcloud_news_updater.api.web import WebUpdater
             return container.resolve(WebUpdater)
         elif container.resolve(Config).apilevel == 'v15':
+            from nextcloud_news_updater.api.cli import CliUpdaterV15
             return container.resolve(CliUpdaterV15)
         else:
+            from nextcloud_news_updater.api.cli import CliUpdater
             return container.resolve(CliUpdater)
 
     def _create_config(self, container: BaseContainer) -> Config:
@@ -50,3 +67,67 @@ class Container(BaseContainer):
             exit(1)
 
         return config
+
+    def has_instances(self) -> bool:
+        """
+        Whether the config file contains [updater:<name>] sections which
+        should be run by the supervisor
+        """
+        args = self.resolve(ArgumentParser).parse()
+        return bool(args.config) and \
+            len(self.resolve(ConfigParser).parse_instances(args.config)) > 0
+
+    def _create_supervisor(self, container: BaseContainer) -> Any:
+        """
+        Resolves the updater of every instance through its own container,
+        the [updater] section and the command line configure the supervisor
+        and provide the defaults of the instances
+        """
+        parser = container.resolve(ArgumentParser)
+        args = parser.parse()
+        config_parser = container.resolve(ConfigParser)
+        config = config_parser.parse_file(args.config)
+        merge_configs(args, config)
+        container.register(Config, lambda c: config)
+        logger = container.resolve(Logger)
+
+        validator = container.resolve(ConfigValidator)
+        instances = config_parser.parse_instances(args.config)
+        validation_result = []
+        statedirs = {}  # type: Dict[str, str]
+        sockets = {}  # type: Dict[str, str]
+        for name, instance in instances.items():
+            merge_configs(args, instance)
+            # the supervisor serves the metrics of all instances
+            instance.metricsport = 0
+            validation_result += ['%s: %s' % (name, message) for message
+                                  in validator.validate(instance)]
+            if instance.statedir:
+                if instance.statedir in statedirs:
+                    validation_result.append(
+                        '%s: State directory is already used by %s' %
+                        (name, statedirs[instance.statedir]))
+                statedirs[instance.statedir] = name
+            if instance.controlsocket:
+                if instance.controlsocket in sockets:
+                    validation_result.append(
+                        '%s: Control socket is already used by %s' %
+                        (name, sockets[instance.controlsocket]))
+                sockets[instance.controlsocket] = name
+        if len(validation_result) > 0:
+            for message in validation_result:
+                print('Error: %s' % message, file=sys.stderr)
+            print()
+            parser.print_help(sys.stderr)
+            exit(1)
+
+        updaters = OrderedDict()  # type: Dict[str, Updater]
+        for name, instance in instances.items():
+            instance_container = Container()
+            instance_container.register(Config,
+                                        lambda c, instance=instance: instance)
+            instance_container.register(Logger, lambda c, name=name:
+                                        InstanceLogger(logger, name))
+            updaters[name] = instance_container.resolve(Updater)
+        from nextcloud_news_updater.supervisor import Supervisor
+        return Supervisor(config, updaters, logger)
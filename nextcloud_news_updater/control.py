@@ -0,0 +1,150 @@
+"""
+Sends commands to the control socket of a running updater which is started
+with the controlsocket option.
+
+    nextcloud-news-updater control /run/news-updater.sock status
+    nextcloud-news-updater control /run/news-updater.sock update 12 13:john
+"""
+import argparse
+import json
+import socket
+import sys
+import time
+from typing import Any, Dict, List, TextIO
+
+
+def send(path: str, request: Dict[str, Any]) -> Dict[str, Any]:
+    """
+    Sends a command to the updater and returns its response
+    :raises OSError if the updater does not listen on the socket
+    """
+    client = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+    try:
+        client.connect(path)
+        client.sendall(json.dumps(request).encode('utf-8') + b'\n')
+        with client.makefile('rb') as response:
+            line = response.readline()
+    finally:
+        client.close()
+    if not line:
+        raise OSError('The updater closed the connection')
+    return json.loads(line.decode('utf-8'))
+
+
+def parse_feed(value: str) -> Any:
+    """
+    Parses a feed id or a feed id and a user id separated by a colon
+    """
+    feed_id, _, user_id = value.partition(':')
+    try:
+        if user_id:
+            return [int(feed_id), user_id]
+        return int(feed_id)
+    except ValueError:
+        raise argparse.ArgumentTypeError('invalid feed: %s' % value)
+
+
+def format_status(status: Dict[str, Any], out: TextIO) -> None:
+    print('Mode: %s with %d threads%s' % (
+        status['mode'], status['threads'],
+        ', draining' if status['draining'] else ''), file=out)
+    phases = status['phases']
+    if phases:
+        print('Running: %s' % ', '.join(
+            '%s for %.1f s' % item for item in sorted(phases.items())),
+            file=out)
+    elif status['next_run'] is not None:
+        print('Waiting: next run in %.0f s' % (
+            status['next_run'] - time.time()), file=out)
+    if 'queued' in status:
+        print('Queue: %d queued, %d in flight, %d updated, %d failed, '
+              '%d timed out' % (status['queued'], status['in_flight'],
+                                status['completed'], status['failures'],
+                                status['timeouts']), file=out)
+    last_run = status['last_run']
+    if last_run is not None:
+        summary = 'Last run: started %s, took %.1f s' % (
+            time.strftime('%Y-%m-%d %H:%M:%S',
+                          time.localtime(last_run['started'])),
+            last_run['duration'])
+        if 'updates' in last_run:
+            summary += ', %d updates, %d failed, %d timed out, %d ' \
+                       'skipped' % (last_run['updates'], last_run['failures'],
+                                    last_run['timeouts'], last_run['skipped'])
+        if not last_run['success']:
+            summary += ', failed: %s' % last_run['error']
+        print(summary, file=out)
+
+
+def format_response(command: str, response: Dict[str, Any],
+                    out: TextIO) -> None:
+    if command == 'status':
+        format_status(response, out)
+    elif command == 'run':
+        print('Refreshing the feed list' if response['refresh']
+              else 'Started a run', file=out)
+    elif command == 'update':
+        for result in response['updated']:
+            print('Feed %d of user %s: %s in %.1f s' % (
+                result['id'], result['user'],
+                'updated' if result['error'] is None
+                else 'failed with %s' % result['error'],
+                result['duration']), file=out)
+        for feed_id in response['unknown']:
+            print('Feed %d: not found, pass it as %d:USER' % (
+                feed_id, feed_id), file=out)
+    elif command == 'resize':
+        print('Changed the number of threads to %d' % response['threads'],
+              file=out)
+    elif command == 'drain':
+        print('Draining, dropped %d queued feeds' % response['dropped'],
+              file=out)
+
+
+def main(argv: List[str]) -> None:
+    parser = argparse.ArgumentParser(
+        prog='nextcloud-news-updater control',
+        description='Sends commands to a running updater')
+    parser.add_argument('socket',
+                        help='Path to the control socket, the controlsocket '
+                             'option of the updater')
+    parser.add_argument('--json', action='store_true',
+                        help='Print the response as JSON')
+    commands = parser.add_subparsers(dest='command')
+    commands.add_parser('status', help='Show the current phase, the queue '
+                                       'and the last run')
+    commands.add_parser('run', help='Start the next run right away, in the '
+                                    'continuous mode refresh the feed list')
+    update = commands.add_parser('update', help='Update feeds right away and '
+                                                'wait for the results')
+    update.add_argument('feeds', nargs='+', type=parse_feed,
+                        metavar='ID[:USER]',
+                        help='Feed id, the user is looked up in the queue of '
+                             'the current or last run unless it is given')
+    resize = commands.add_parser('resize', help='Change the number of update '
+                                                'threads')
+    resize.add_argument('threads', type=int)
+    commands.add_parser('drain', help='Finish the updates in flight and '
+                                      'stop the updater')
+    args = parser.parse_args(argv)
+    if args.command is None:
+        parser.error('a command is required')
+
+    request = {'command': args.command}  # type: Dict[str, Any]
+    if args.command == 'update':
+        request['feeds'] = args.feeds
+    elif args.command == 'resize':
+        request['threads'] = args.threads
+    try:
+        response = send(args.socket, request)
+    except (OSError, ValueError) as e:
+        print('Error: could not reach the updater on %s: %s' % (
+            args.socket, e), file=sys.stderr)
+        exit(1)
+    if not response.pop('ok', False):
+        print('Error: %s' % response.get('error'), file=sys.stderr)
+        exit(1)
+    if args.json:
+        print(json.dumps(response, indent=2, sort_keys=True))
+    else:
+        format_response(args.command, response, sys.stdout)
@@ -1,5 +1,5 @@
 from typing import Callable, Any
-from typing import Dict
+from typing import Dict, List, Tuple
 
 
 class ResolveException(Exception):
@@ -27,10 +27,20 @@ class SingletonFactory(Factory):
         super().__init__(factory)
 
 
+def qualified_name(clazz: type) -> str:
+    return '%s.%s' % (clazz.__module__, clazz.__qualname__)
+
+
 class Container:
     """
-    Simple container for Dependency Injection
+    Simple container for Dependency Injection. Factories can also be
+    registered under the qualified name of a class, e.g.
+    'package.module.Class', so that the module does not have to be imported
+    until the class is resolved
     """
+    # constructor arguments and their types per class, shared by all
+    # containers so that the annotations are only looked at once
+    _wiring = {}  # type: Dict[type, List[Tuple[str, Any]]]
 
     def __init__(self) -> None:
         self._singletons = {}  # type: Dict[Any, Any]
@@ -60,6 +70,11 @@ class Container:
         :argument key the key to look up
         :return the created or looked up instance
         """
+        if isinstance(key, type) and key not in self._factories and \
+                key not in self._singletons:
+            name = qualified_name(key)
+            if name in self._factories or name in self._singletons:
+                key = name
         if key not in self._singletons:
             # if registered, determine if the result will be shared
             if key in self._factories:
@@ -95,10 +110,14 @@ class Container:
         :argument clazz the class to instantiate
         :return the instantiated class
         """
-        arguments = {}
-        if hasattr(clazz.__init__, '__annotations__'):
-            annotations = clazz.__init__.__annotations__
-            for name, type_hint in annotations.items():
-                if name != 'return':
-                    arguments[name] = self.resolve(type_hint)
-        return clazz(**arguments)
+        wiring = Container._wiring.get(clazz)
+        if wiring is None:
+            wiring = []
+            if hasattr(clazz.__init__, '__annotations__'):
+                annotations = clazz.__init__.__annotations__
+                wiring = [(name, type_hint)
+                          for name, type_hint in annotations.items()
+                          if name != 'return']
+            Container._wiring[clazz] = wiring
+        return clazz(**{name: self.resolve(type_hint)
+                        for name, type_hint in wiring})
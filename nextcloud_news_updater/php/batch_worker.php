@@ -0,0 +1,86 @@
+<?php
+/**
+ * Long lived worker for the Nextcloud News updater. Boots Nextcloud once and
+ * then runs feed update commands read from STDIN, one JSON object per line:
+ *
+ *     {"arguments": ["news:updater:update-feed", "user", "1"]}
+ *
+ * Every command is answered with one JSON line on STDOUT:
+ *
+ *     {"status": 0, "output": "", "memory": 31457280}
+ *
+ * Usage: php batch_worker.php /path/to/nextcloud
+ *
+ * This file is licensed under the General Public License version 3 or
+ * later. See the LICENSE.txt file.
+ */
+
+// STDOUT carries the protocol, so warnings and notices must not end up there
+ini_set('display_errors', 'stderr');
+
+function respond(array $data)
+{
+    fwrite(STDOUT, json_encode($data) . "\n");
+    fflush(STDOUT);
+}
+
+if ($argc < 2) {
+    fwrite(STDERR, "Usage: php batch_worker.php /path/to/nextcloud\n");
+    exit(1);
+}
+
+$directory = rtrim($argv[1], '/');
+chdir($directory);
+
+ob_start();
+require_once $directory . '/lib/base.php';
+\OC_App::loadApps();
+
+$server = \OC::$server;
+$commandClass = \OCA\News\Command\Updater\UpdateFeed::class;
+if (method_exists($server, 'get')) {
+    $updateFeed = $server->get($commandClass);
+} else {
+    $updateFeed = $server->query($commandClass);
+}
+
+$application = new \Symfony\Component\Console\Application();
+$application->setAutoExit(false);
+$application->setCatchExceptions(false);
+$application->add($updateFeed);
+ob_end_clean();
+
+respond(['ready' => true, 'memory' => memory_get_usage(true)]);
+
+while (($line = fgets(STDIN)) !== false) {
+    $request = json_decode($line, true);
+    if (!is_array($request) || !isset($request['arguments']) ||
+        $request['arguments'][0] !== $updateFeed->getName()) {
+        respond([
+            'status' => 1,
+            'output' => 'Invalid request: ' . trim($line),
+            'memory' => memory_get_usage(true),
+        ]);
+        continue;
+    }
+
+    $input = new \Symfony\Component\Console\Input\ArgvInput(
+        array_merge(['occ'], $request['arguments'])
+    );
+    $output = new \Symfony\Component\Console\Output\BufferedOutput();
+    ob_start();
+    try {
+        $status = $application->run($input, $output);
+    } catch (\Throwable $e) {
+        $status = 1;
+        $output->writeln($e->getMessage());
+    }
+    $stray = ob_get_clean();
+
+    respond([
+        'status' => $status,
+        'output' => $stray . $output->fetch(),
+        'memory' => memory_get_usage(true),
+    ]);
+    gc_collect_cycles();
+}
@@ -0,0 +1,311 @@
+"""
+Predicts how long update runs take with different numbers of update threads
+and dispatch orders before they are used for real: the update durations
+recorded in the run history, or durations drawn from a distribution, are
+replayed through the feed queues of the updater in simulated time, without
+Nextcloud or PHP.
+
+    nextcloud-news-updater simulate --history /path/to/history.sqlite
+    nextcloud-news-updater simulate --feeds 60000 --users 500 --mean 1.5
+"""
+import argparse
+import heapq
+import math
+import random
+import sys
+from typing import Any, Dict, List, Optional, TextIO, Tuple
+
+from nextcloud_news_updater.api.api import Feed
+from nextcloud_news_updater.api.feedqueue import create_feed_queue
+from nextcloud_news_updater.config import Config
+
+DISPATCHES = ('fifo', 'fair', 'longest')
+DISTRIBUTIONS = ('constant', 'exponential', 'lognormal')
+
+
+class FeedDurations:
+    """
+    Update durations of the simulated feeds in the order the feeds are
+    listed. A run replays one of the recorded durations of every feed,
+    chosen at random, while the longest dispatch predicts the mean of the
+    recorded durations like the scheduler predicts from previous runs
+    """
+
+    def __init__(self) -> None:
+        self.feeds = []  # type: List[Feed]
+        self.durations = {}  # type: Dict[int, List[float]]
+        self._means = {}  # type: Dict[int, float]
+
+    def add(self, feed_id: int, user_id: str, duration: float) -> None:
+        durations = self.durations.get(feed_id)
+        if durations is None:
+            durations = self.durations[feed_id] = []
+            self.feeds.append(Feed(feed_id, user_id))
+            self._means = {}
+        durations.append(duration)
+
+    def replay(self, seed: int = 0) -> Dict[int, float]:
+        """
+        Returns the duration of every feed in a simulated run, all
+        simulated setups replay the same durations
+        """
+        choice = random.Random(seed).choice
+        return {feed_id: choice(durations)
+                for feed_id, durations in self.durations.items()}
+
+    def predicted_duration(self, feed_id: int) -> Optional[float]:
+        if not self._means:
+            self._means = {feed_id: sum(durations) / len(durations)
+                           for feed_id, durations in self.durations.items()}
+        return self._means.get(feed_id)
+
+    def mean_duration(self) -> Optional[float]:
+        if not self.durations:
+            return None
+        return sum(self.predicted_duration(feed_id)
+                   for feed_id in self.durations) / len(self.durations)
+
+
+def read_history(path: str, runs: int) -> FeedDurations:
+    """
+    Reads the durations of the updates of the last runs from the history
+    which the updater writes if the history option is set
+    """
+    import sqlite3
+    from urllib.request import pathname2url
+    from nextcloud_news_updater.analyze import HistoryAnalyzer
+    connection = sqlite3.connect('file:%s?mode=ro' % pathname2url(path),
+                                 uri=True)
+    try:
+        durations = FeedDurations()
+        analyzer = HistoryAnalyzer(connection, runs)
+        for feed_id, user_id, duration in analyzer.feed_durations():
+            durations.add(feed_id, user_id, duration)
+        return durations
+    finally:
+        connection.close()
+
+
+def generate(feeds: int, users: int, distribution: str, mean: float,
+             sigma: float, seed: int = 0) -> FeedDurations:
+    """
+    Draws one duration with the given mean per feed. The feeds are split
+    between the users with Zipf distributed sizes, so that a few users have
+    most of the feeds, and listed user by user like the updater lists them.
+    Each feed has a single duration, so the longest dispatch predicts the
+    durations exactly
+    """
+    generator = random.Random(seed)
+    total = sum(1 / (user + 1) for user in range(users))
+    durations = FeedDurations()
+    feed_id = 0
+    share = 0.0
+    for user in range(users):
+        share += 1 / (user + 1)
+        count = round(feeds * share / total) - feed_id
+        for _ in range(count):
+            feed_id += 1
+            if distribution == 'constant':
+                duration = mean
+            elif distribution == 'exponential':
+                duration = generator.expovariate(1 / mean)
+            else:
+                # mu is chosen so that the distribution has the given mean
+                duration = generator.lognormvariate(
+                    math.log(mean) - sigma ** 2 / 2, sigma)
+            durations.add(feed_id, 'user%d' % user, duration)
+    return durations
+
+
+class SimulationResult:
+    """
+    Outcome of a simulated run: the time until the last update finished,
+    the shortest possible time for the number of threads, the time the
+    threads spent updating and how long the feeds waited in the queue, in
+    total and per user
+    """
+
+    def __init__(self, dispatch: str, threads: int, makespan: float,
+                 bound: float, busy: float, waits: Dict[str, Any]) -> None:
+        self.dispatch = dispatch
+        self.threads = threads
+        self.makespan = makespan
+        self.bound = bound
+        self.busy = busy
+        count = sum(wait.count for wait in waits.values())
+        self.mean_wait = sum(wait.total for wait in waits.values()) / \
+            max(1, count)
+        self.max_wait = max([wait.max for wait in waits.values()] or [0])
+        # mean wait of the user whose feeds waited longest on average
+        self.worst_user_wait = max([wait.total / wait.count
+                                    for wait in waits.values()] or [0])
+
+    @property
+    def utilization(self) -> float:
+        if self.makespan <= 0:
+            return 0
+        return self.busy / (self.threads * self.makespan)
+
+
+def simulate(durations: FeedDurations, replay: Dict[int, float],
+             dispatch: str, threads: int, user_limit: int = 0) \
+        -> SimulationResult:
+    """
+    Runs the update threads of a single run in simulated time: every idle
+    thread takes the next feed from the same queue the updater uses, and
+    the clock jumps to the moment the next update finishes
+    """
+    config = Config()
+    config.dispatch = dispatch
+    config.userlimit = user_limit
+    queue = create_feed_queue(config, scheduler=durations)
+    now = 0.0
+    queue.clock = lambda: now
+    queue.extend(durations.feeds)
+    queue.close()
+    # (finish time, sequence, feed) of the updates in flight
+    running = []  # type: List[Tuple[float, int, Feed]]
+    sequence = 0
+    busy = 0.0
+    idle = threads
+    while True:
+        while idle > 0:
+            try:
+                feed = queue.poll()
+            except IndexError:
+                feed = None
+            if feed is None:
+                break
+            sequence += 1
+            heapq.heappush(running,
+                           (now + replay[feed.feed_id], sequence, feed))
+            idle -= 1
+        if not running:
+            break
+        now, _, feed = heapq.heappop(running)
+        duration = replay[feed.feed_id]
+        busy += duration
+        queue.done(feed, duration)
+        idle += 1
+    # no run can be shorter than its longest update or than the updates
+    # spread evenly over all threads
+    bound = max(busy / threads, max(replay.values(), default=0))
+    return SimulationResult(dispatch, threads, now, bound, busy, queue.waits)
+
+
+def report(durations: FeedDurations, results: List[SimulationResult],
+           interval: float, out: TextIO) -> None:
+    users = len(set(feed.user_id for feed in durations.feeds))
+    total = results[0].busy if results else 0
+    print('%d feeds of %d users, %.1f seconds of updates per run, %.3f '
+          'seconds per update on average' % (
+              len(durations.feeds), users, total,
+              total / max(1, len(durations.feeds))), file=out)
+    print('', file=out)
+    print('  %-8s  %7s  %10s  %10s  %6s  %11s  %10s  %12s  %s' % (
+        'dispatch', 'threads', 'makespan s', 'bound s', 'busy %',
+        'mean wait s', 'max wait s', 'user wait s',
+        'fits %d s' % interval), file=out)
+    for result in results:
+        print('  %-8s  %7d  %10.1f  %10.1f  %6.1f  %11.1f  %10.1f  %12.1f  '
+              '%s' % (result.dispatch, result.threads, result.makespan,
+                      result.bound, 100 * result.utilization,
+                      result.mean_wait, result.max_wait,
+                      result.worst_user_wait,
+                      'yes' if result.makespan <= interval else 'no'),
+              file=out)
+    print('', file=out)
+    for dispatch in sorted(set(result.dispatch for result in results)):
+        fitting = [result.threads for result in results
+                   if result.dispatch == dispatch and
+                   result.makespan <= interval]
+        if fitting:
+            print('%s: %d threads finish a run within %d seconds' % (
+                dispatch, min(fitting), interval), file=out)
+        else:
+            print('%s: none of the simulated thread counts finishes a run '
+                  'within %d seconds' % (dispatch, interval), file=out)
+
+
+def parse_list(value: str) -> List[str]:
+    return [item.strip() for item in value.split(',') if item.strip()]
+
+
+def main(argv: List[str]) -> None:
+    parser = argparse.ArgumentParser(
+        prog='nextcloud-news-updater simulate',
+        description='Predicts the duration of update runs for different '
+                    'numbers of threads and dispatch orders')
+    source = parser.add_mutually_exclusive_group(required=True)
+    source.add_argument('--history',
+                        help='Replay the durations recorded in this history '
+                             'database, the history option of the updater')
+    source.add_argument('--feeds', type=int,
+                        help='Simulate this many feeds with durations drawn '
+                             'from --distribution')
+    parser.add_argument('--runs', type=int, default=20,
+                        help='Number of most recent runs of the history to '
+                             'replay, defaults to 20')
+    parser.add_argument('--users', type=int, default=1,
+                        help='Number of users who own the simulated feeds, '
+                             'defaults to 1')
+    parser.add_argument('--distribution', choices=DISTRIBUTIONS,
+                        default='lognormal',
+                        help='Distribution of the simulated update '
+                             'durations, defaults to lognormal')
+    parser.add_argument('--mean', type=float, default=1.0,
+                        help='Mean update duration in seconds, defaults to 1')
+    parser.add_argument('--sigma', type=float, default=1.0,
+                        help='Shape of the lognormal distribution, higher '
+                             'values make slow outliers more likely, '
+                             'defaults to 1')
+    parser.add_argument('--threads', type=parse_list,
+                        default=['1', '2', '5', '10', '20', '50'],
+                        help='Comma separated numbers of update threads, '
+                             'defaults to 1,2,5,10,20,50')
+    parser.add_argument('--dispatch', type=parse_list,
+                        default=list(DISPATCHES),
+                        help='Comma separated dispatch orders, defaults to '
+                             'fifo,fair,longest')
+    parser.add_argument('--userlimit', type=int, default=0,
+                        help='Maximum number of parallel updates per user '
+                             'with the fair dispatch, defaults to 0 which '
+                             'means unlimited')
+    parser.add_argument('--interval', type=int, default=15 * 60,
+                        help='Interval in seconds in which a run should '
+                             'finish, defaults to 900')
+    parser.add_argument('--seed', type=int, default=0,
+                        help='Seed of the random numbers, defaults to 0')
+    args = parser.parse_args(argv)
+    try:
+        threads = [int(count) for count in args.threads]
+    except ValueError:
+        parser.error('invalid thread counts: %s' % ','.join(args.threads))
+    if not threads or min(threads) <= 0:
+        parser.error('thread counts must be positive')
+    for dispatch in args.dispatch:
+        if dispatch not in DISPATCHES:
+            parser.error('unknown dispatch: %s' % dispatch)
+    if args.feeds is not None and (args.feeds <= 0 or args.users <= 0 or
+                                   args.mean <= 0):
+        parser.error('feeds, users and mean must be positive')
+
+    if args.history is not None:
+        import sqlite3
+        try:
+            durations = read_history(args.history, args.runs)
+        except sqlite3.Error as e:
+            print('Error: could not read history %s: %s' % (args.history, e),
+                  file=sys.stderr)
+            exit(1)
+        if not durations.feeds:
+            print('Error: the history does not contain any updates yet',
+                  file=sys.stderr)
+            exit(1)
+    else:
+        durations = generate(args.feeds, args.users, args.distribution,
+                             args.mean, args.sigma, args.seed)
+    replay = durations.replay(args.seed)
+    results = [simulate(durations, replay, dispatch, count, args.userlimit)
+               for dispatch in args.dispatch for count in threads]
+    report(durations, results, args.interval, sys.stdout)
@@ -0,0 +1,49 @@
+import threading
+from typing import Dict, List
+
+from nextcloud_news_updater.api.budget import Budget
+from nextcloud_news_updater.api.metrics import UpdaterMetrics
+from nextcloud_news_updater.api.updater import Updater
+from nextcloud_news_updater.common.logger import Logger
+from nextcloud_news_updater.common.prometheus import LabeledRegistries
+from nextcloud_news_updater.config import Config
+
+
+class Supervisor:
+    """
+    Runs the updaters of several Nextcloud instances in one process. The
+    number of parallel updates of all instances together is limited by the
+    threads of the supervisor's config and shared according to the weights
+    of the instances. Metrics of all instances are served on one port and
+    told apart by an instance label
+    """
+
+    def __init__(self, config: Config, updaters: Dict[str, Updater],
+                 logger: Logger) -> None:
+        self.config = config
+        self.updaters = updaters
+        self.logger = logger
+        self.budget = Budget(config.threads)
+        for name, updater in updaters.items():
+            updater.budget = self.budget.share(name, updater.config.weight)
+            if config.metricsport > 0:
+                updater.metrics = UpdaterMetrics()
+
+    def run(self) -> None:
+        self.logger.info('Updating %d instances using %d threads',
+                         len(self.updaters), self.config.threads)
+        if self.config.metricsport > 0:
+            from nextcloud_news_updater.common.metricsserver import \
+                MetricsServer
+            registries = LabeledRegistries('instance', {
+                name: updater.metrics.registry
+                for name, updater in self.updaters.items()})
+            MetricsServer(registries, self.config.metricsport,
+                          self.config.metricsaddress).start()
+        threads = []  # type: List[threading.Thread]
+        for name, updater in self.updaters.items():
+            thread = threading.Thread(target=updater.run, name=name)
+            thread.start()
+            threads.append(thread)
+        for thread in threads:
+            thread.join()
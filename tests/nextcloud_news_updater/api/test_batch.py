@@ -0,0 +1,76 @@
+import sys
+import time
+from subprocess import CalledProcessError, TimeoutExpired
+from unittest import TestCase
+
+from nextcloud_news_updater.api.batch import PhpWorkerPool, WorkerException
+
+FAKE_WORKER = '''
+import json, os, sys, time
+print(json.dumps({"ready": True, "memory": 1}), flush=True)
+for line in sys.stdin:
+    arguments = json.loads(line)["arguments"]
+    if arguments[0] == "crash":
+        sys.exit(3)
+    if arguments[0] == "hang":
+        time.sleep(30)
+    print(json.dumps({
+        "status": 1 if arguments[0] == "fail" else 0,
+        "output": str(os.getpid()),
+        "memory": int(arguments[1]) if len(arguments) > 1 else 1,
+    }), flush=True)
+'''
+
+
+class TestPhpWorkerPool(TestCase):
+    def setUp(self):
+        self.pool = PhpWorkerPool([sys.executable, '-c', FAKE_WORKER], 2,
+                                  100)
+
+    def tearDown(self):
+        self.pool.close()
+
+    def test_reuses_workers(self):
+        pid = self.pool.run(['update'])
+        self.assertEqual(pid, self.pool.run(['update']))
+        self.assertEqual(1, self.pool.started)
+
+    def test_recycles_after_max_feeds(self):
+        pids = [self.pool.run(['update']) for _ in range(3)]
+        self.assertEqual(pids[0], pids[1])
+        self.assertNotEqual(pids[1], pids[2])
+        self.assertEqual(1, self.pool.recycled)
+
+    def test_recycles_after_max_memory(self):
+        pid = self.pool.run(['update', '101'])
+        self.assertNotEqual(pid, self.pool.run(['update']))
+        self.assertEqual(1, self.pool.recycled)
+
+    def test_failed_command(self):
+        with self.assertRaises(CalledProcessError) as context:
+            self.pool.run(['fail'])
+        self.assertEqual(1, context.exception.returncode)
+        self.assertEqual(context.exception.output, self.pool.run(['update']))
+
+    def test_crashed_worker_is_replaced(self):
+        with self.assertRaises(WorkerException):
+            self.pool.run(['crash'])
+        self.pool.run(['update'])
+        self.assertEqual(2, self.pool.started)
+
+    def test_hanging_worker_is_killed(self):
+        start = time.monotonic()
+        with self.assertRaises(TimeoutExpired):
+            self.pool.run(['hang'], 0.2)
+        self.assertLess(time.monotonic() - start, 5)
+        self.pool.run(['update'], 5)
+        self.assertEqual(2, self.pool.started)
+
+    def test_hanging_boot_is_killed(self):
+        pool = PhpWorkerPool([sys.executable, '-c',
+                              'import time; time.sleep(30)'], 2, 100)
+        start = time.monotonic()
+        with self.assertRaises(TimeoutExpired):
+            pool.run(['update'], 0.2)
+        self.assertLess(time.monotonic() - start, 5)
+        pool.close()
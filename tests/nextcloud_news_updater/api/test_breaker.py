@@ -0,0 +1,96 @@
+import os
+import socket
+import tempfile
+from unittest import TestCase
+from urllib.error import HTTPError, URLError
+
+from nextcloud_news_updater.api.api import FeedUpdateException
+from nextcloud_news_updater.api.breaker import CircuitBreaker, RetryPolicy, \
+    is_transient
+
+
+def http_error(code):
+    return HTTPError('http://localhost', code, 'Error', {}, None)
+
+
+class Clock:
+    def __init__(self):
+        self.now = 1000.0
+
+    def __call__(self):
+        return self.now
+
+
+class TestRetryPolicy(TestCase):
+    def test_retries_transient_errors(self):
+        policy = RetryPolicy(2)
+        error = ConnectionResetError()
+        self.assertTrue(policy.should_retry(0, error))
+        self.assertTrue(policy.should_retry(1, error))
+        self.assertFalse(policy.should_retry(2, error))
+        self.assertFalse(policy.should_retry(0, None))
+
+    def test_transient_errors(self):
+        self.assertTrue(is_transient(http_error(503)))
+        self.assertTrue(is_transient(URLError('refused')))
+        self.assertFalse(is_transient(http_error(500)))
+        self.assertFalse(is_transient(http_error(404)))
+        self.assertFalse(is_transient(socket.timeout()))
+        try:
+            raise FeedUpdateException('failed') from ConnectionResetError()
+        except FeedUpdateException as e:
+            self.assertTrue(is_transient(e))
+
+    def test_delay_is_jittered_and_capped(self):
+        self.assertEqual(4, RetryPolicy(5, 1, 30, lambda: 1).delay(2))
+        self.assertEqual(30, RetryPolicy(5, 1, 30, lambda: 1).delay(10))
+        self.assertEqual(2, RetryPolicy(5, 1, 30, lambda: 0.5).delay(2))
+
+
+class TestCircuitBreaker(TestCase):
+    def setUp(self):
+        self.clock = Clock()
+        self.breaker = CircuitBreaker(None, 2, 3, 100, self.clock)
+
+    def test_quarantines_failing_feeds(self):
+        error = FeedUpdateException('failed')
+        self.breaker.record(1, error)
+        self.assertTrue(self.breaker.allows(1))
+        self.breaker.record(1, error)
+        self.assertFalse(self.breaker.allows(1))
+        self.assertEqual(1100, self.breaker.quarantined_until(1))
+        self.clock.now = 1100
+        self.assertTrue(self.breaker.allows(1))
+        self.breaker.record(1, error)
+        self.assertEqual(1300, self.breaker.quarantined_until(1))
+        self.breaker.record(1, None)
+        self.assertTrue(self.breaker.allows(1))
+
+    def test_server_errors_pause_dispatch(self):
+        error = http_error(500)
+        self.assertEqual(0, self.breaker.record(1, error))
+        self.assertEqual(0, self.breaker.record(2, error))
+        self.assertEqual(30, self.breaker.record(3, error))
+        self.assertEqual(1030, self.breaker.paused_until)
+        for feed_id in range(3):
+            pause = self.breaker.record(feed_id, error)
+        self.assertEqual(60, pause)
+        # server errors are not the fault of the feeds
+        self.assertTrue(all(self.breaker.allows(i) for i in range(3)))
+        self.breaker.record(1, None)
+        for feed_id in range(3):
+            pause = self.breaker.record(feed_id, error)
+        self.assertEqual(30, pause)
+
+    def test_persists_state(self):
+        with tempfile.TemporaryDirectory() as directory:
+            path = os.path.join(directory, 'breaker.json')
+            breaker = CircuitBreaker(path, 1, 1, 100, self.clock)
+            breaker.record(1, FeedUpdateException('failed'))
+            breaker.record(2, http_error(503))
+            breaker.save()
+            loaded = CircuitBreaker(path, 1, 1, 100, self.clock)
+            loaded.load()
+            self.assertFalse(loaded.allows(1))
+            self.assertEqual(1030, loaded.paused_until)
+            self.assertEqual(1, loaded.server_opens)
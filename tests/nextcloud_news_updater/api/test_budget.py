@@ -0,0 +1,49 @@
+import threading
+import time
+from unittest import TestCase
+
+from nextcloud_news_updater.api.budget import Budget
+
+
+class TestBudget(TestCase):
+    def wait_for(self, condition):
+        deadline = time.monotonic() + 5
+        while not condition() and time.monotonic() < deadline:
+            time.sleep(0.01)
+        self.assertTrue(condition())
+
+    def test_limits_parallel_updates(self):
+        budget = Budget(2)
+        share = budget.share('small')
+        share.acquire()
+        share.acquire()
+        waiter = threading.Thread(target=share.acquire)
+        waiter.start()
+        waiter.join(0.1)
+        self.assertTrue(waiter.is_alive())
+        share.release()
+        waiter.join(5)
+        self.assertFalse(waiter.is_alive())
+        self.assertEqual(2, budget.in_use)
+
+    def test_shares_slots_by_weight(self):
+        budget = Budget(4)
+        small = budget.share('small', 1)
+        large = budget.share('large', 3)
+        for _ in range(4):
+            small.acquire()
+        waiters = [threading.Thread(target=share.acquire, daemon=True)
+                   for share in (small, large) for _ in range(4)]
+        for waiter in waiters:
+            waiter.start()
+        self.wait_for(lambda: sum(budget._waiting.values()) == 8)
+        for released in range(1, 5):
+            small.release()
+            self.wait_for(lambda: sum(budget._waiting.values()) ==
+                          8 - released)
+        self.assertEqual({'small': 1, 'large': 3}, budget.used)
+        small.release()
+        for _ in range(3):
+            large.release()
+        self.wait_for(lambda: not budget._waiting)
+        self.assertEqual({'small': 3, 'large': 1}, budget.used)
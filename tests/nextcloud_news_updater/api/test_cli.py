@@ -1,9 +1,16 @@
 import json
+import sys
+import time
 from unittest import TestCase
+from subprocess import CalledProcessError, TimeoutExpired
 from unittest.mock import MagicMock, call
 
 from nextcloud_news_updater.api.updater import Updater
-from nextcloud_news_updater.api.cli import Cli, CliApi, CliApiV2
+from nextcloud_news_updater.api.batch import PhpWorkerPool
+from nextcloud_news_updater.api.resources import HostThrottle
+from nextcloud_news_updater.api.feedtable import FeedTable
+from nextcloud_news_updater.api.cli import Cli, CliApi, CliApiV2, \
+    CliApiV15, MAX_OUTPUT_SIZE
 from nextcloud_news_updater.config import Config
 from nextcloud_news_updater.container import Container
 
@@ -12,6 +19,8 @@ class TestCli(TestCase):
     def setUp(self):
         self.container = Container()
         self.cli = MagicMock(spec=Cli)
+        self.cli.stream.side_effect = lambda command: iter(
+            [self.cli.run(command)])
         self.container.register(Cli, lambda c: self.cli)
         self.base_url = '/'
         self.phpini = '/path/to/ini'
@@ -47,12 +56,15 @@ class TestCli(TestCase):
         update_cmd1 = base_cmd + ['news:updater:update-feed', '2', 'deb']
         update_cmd2 = base_cmd + ['news:updater:update-feed', '3', 'john']
         after_cmd = base_cmd + ['news:updater:after-update']
+        timeout = 5 * 60
 
         # ordering can be switched due to threading, so try both cases
-        return ([call(before_cmd), call(feeds_cmd), call(update_cmd1),
-                 call(update_cmd2), call(after_cmd)],
-                [call(before_cmd), call(feeds_cmd), call(update_cmd2),
-                 call(update_cmd1), call(after_cmd)])
+        return ([call(before_cmd), call(feeds_cmd),
+                 call(update_cmd1, timeout), call(update_cmd2, timeout),
+                 call(after_cmd)],
+                [call(before_cmd), call(feeds_cmd),
+                 call(update_cmd2, timeout), call(update_cmd1, timeout),
+                 call(after_cmd)])
 
     def test_api_v1_calls(self):
         self._set_config(apilevel='v1-2', url=self.base_url, mode='singlerun')
@@ -97,3 +109,191 @@ class TestCli(TestCase):
         updater.run()
         self.assertIn(self.cli.run.call_args_list,
                       self._create_commands(self.phpini))
+
+    def test_api_v15_calls_asyncio(self):
+        self._set_config(apilevel='v15', url=self.base_url, mode='singlerun',
+                         engine='asyncio')
+        updater = self.container.resolve(Updater)
+        self.cli.run.side_effect = [
+            b'', bytes(json.dumps({'john': 'John'}), 'utf-8'),
+            bytes(json.dumps([{'id': 3}, {'id': 2}]), 'utf-8'), b''
+        ]
+        updater.run()
+
+        base_cmd = ['php', '-f', '%socc' % self.base_url]
+        update_cmd = base_cmd + ['news:updater:update-feed', 'john']
+        self.assertCountEqual([call(update_cmd + ['2'], 5 * 60),
+                               call(update_cmd + ['3'], 5 * 60)],
+                              self.cli.run_async.call_args_list)
+        self.assertEqual(call(base_cmd + ['news:updater:after-update']),
+                         self.cli.run.call_args_list[-1])
+
+    def test_api_v15_calls_batch(self):
+        self._set_config(apilevel='v15', url=self.base_url, mode='singlerun',
+                         batchsize=100)
+        updater = self.container.resolve(Updater)
+        updater.workers = MagicMock(spec=PhpWorkerPool)
+        self.cli.run.side_effect = [
+            b'', bytes(json.dumps({'john': 'John'}), 'utf-8'),
+            bytes(json.dumps([{'id': 3}, {'id': 2}]), 'utf-8'), b''
+        ]
+        updater.run()
+
+        self.assertCountEqual(
+            [call(['news:updater:update-feed', 'john', '2'], 5 * 60),
+             call(['news:updater:update-feed', 'john', '3'], 5 * 60)],
+            updater.workers.run.call_args_list)
+        self.assertEqual(4, self.cli.run.call_count)
+        updater.workers.close.assert_called_once_with()
+
+    def test_api_v15_waits_for_busy_host(self):
+        self._set_config(apilevel='v15', url=self.base_url, mode='singlerun',
+                         maxload=4.0)
+        updater = self.container.resolve(Updater)
+        updater.throttle = MagicMock(spec=HostThrottle)
+        updater.throttle.reset.return_value = 12.5
+        self.cli.run.side_effect = [
+            b'', bytes(json.dumps({'john': 'John'}), 'utf-8'),
+            bytes(json.dumps([{'id': 3}, {'id': 2}]), 'utf-8'), b'', b'', b''
+        ]
+        updater.run()
+
+        self.assertEqual(2, updater.throttle.wait.call_count)
+        updater.throttle.reset.assert_called_once_with()
+        self.assertEqual(6, self.cli.run.call_count)
+
+    def test_api_v15_lists_users_in_parallel(self):
+        self._set_config(apilevel='v15', url=self.base_url, mode='singlerun')
+        updater = self.container.resolve(Updater)
+        base_cmd = ['php', '-f', '%socc' % self.base_url]
+        outputs = {
+            'user:list': {'john': 'John', 'deb': 'Deb', 'broken': 'Broken'},
+            'john': [{'id': 3}],
+            'deb': [{'id': 2}, {'id': 4}],
+        }
+
+        def run(command, timeout=None):
+            if command[-1] == 'broken':
+                raise CalledProcessError(1, command, b'error')
+            key = command[-1] if command[-2] == 'news:feed:list' \
+                else command[-3]
+            return bytes(json.dumps(outputs.get(key, '')), 'utf-8')
+
+        self.cli.run.side_effect = run
+        updater.run()
+
+        update_cmd = base_cmd + ['news:updater:update-feed']
+        updates = [args[0] for args, _ in self.cli.run.call_args_list
+                   if args[0][:len(update_cmd)] == update_cmd]
+        self.assertCountEqual([update_cmd + ['john', '3'],
+                               update_cmd + ['deb', '2'],
+                               update_cmd + ['deb', '4']], updates)
+        self.assertEqual(call(base_cmd + ['news:updater:after-update']),
+                         self.cli.run.call_args_list[-1])
+
+    def test_api_v15_feed_list_cache(self):
+        self._set_config(apilevel='v15', url=self.base_url, mode='singlerun',
+                         feedlistrefresh=3600)
+        updater = self.container.resolve(Updater)
+        base_cmd = ['php', '-f', '%socc' % self.base_url]
+        outputs = {
+            'user:list': {'john': 'John'},
+            'john': [{'id': 3, 'lastModified': 10}],
+        }
+
+        def run(command, timeout=None):
+            key = command[-1] if command[-2] == 'news:feed:list' \
+                else command[-3]
+            return bytes(json.dumps(outputs.get(key, '')), 'utf-8')
+
+        self.cli.run.side_effect = run
+        updater.run()
+        updater.run()
+
+        commands = [args[0] for args, _ in self.cli.run.call_args_list]
+        update_cmd = base_cmd + ['news:updater:update-feed', 'john', '3']
+        self.assertEqual(1, commands.count(base_cmd + ['news:feed:list',
+                                                       'john']))
+        self.assertEqual(2, commands.count(update_cmd))
+
+    def test_api_v15_failed_listing_is_not_cached(self):
+        self._set_config(apilevel='v15', url=self.base_url, mode='singlerun',
+                         feedlistrefresh=3600)
+        updater = self.container.resolve(Updater)
+        base_cmd = ['php', '-f', '%socc' % self.base_url]
+        # the feeds of john can not be parsed in the first run
+        listings = {'john': [b'[{"id": 3', b'[{"id": 3}]']}
+
+        def run(command, timeout=None):
+            if command[-2] == 'news:feed:list':
+                return listings.get(command[-1], [b'[{"id": 2}]']).pop(0)
+            if 'user:list' in command:
+                return b'{"john": "John", "deb": "Deb"}'
+            return b''
+
+        self.cli.run.side_effect = run
+        updater.run()
+        updater.run()
+
+        commands = [args[0] for args, _ in self.cli.run.call_args_list]
+        update_cmd = base_cmd + ['news:updater:update-feed', 'john', '3']
+        self.assertEqual(2, commands.count(base_cmd + ['news:feed:list',
+                                                       'john']))
+        self.assertEqual(1, commands.count(update_cmd))
+
+
+class TestCliStream(TestCase):
+    def test_stream(self):
+        command = [sys.executable, '-c', 'print("[1, 2]")']
+        self.assertEqual(b'[1, 2]\n', b''.join(Cli(Config()).stream(command)))
+
+    def test_stream_failure(self):
+        command = [sys.executable, '-c', 'print("broken"); exit(3)']
+        with self.assertRaises(CalledProcessError) as context:
+            list(Cli(Config()).stream(command))
+        self.assertEqual(3, context.exception.returncode)
+        self.assertEqual(b'broken\n', context.exception.output)
+
+    def test_run_caps_output(self):
+        command = [sys.executable, '-c',
+                   'print("x" * %d)' % (MAX_OUTPUT_SIZE * 2)]
+        self.assertEqual(b'x' * MAX_OUTPUT_SIZE, Cli(Config()).run(command, 5))
+
+    def test_run_kills_process_group_on_timeout(self):
+        # the child keeps the output open after its parent was killed
+        command = [sys.executable, '-c',
+                   'import subprocess, sys, time; '
+                   'subprocess.Popen([sys.executable, "-c", '
+                   '"import time; time.sleep(30)"]); '
+                   'print("started", flush=True); time.sleep(30)']
+        start = time.monotonic()
+        with self.assertRaises(TimeoutExpired) as context:
+            Cli(Config()).run(command, 0.5)
+        self.assertLess(time.monotonic() - start, 5)
+        self.assertEqual(b'started\n', context.exception.output)
+
+    def test_parse_streamed_feeds_v15(self):
+        config = Config()
+        config.url = '/'
+        api = CliApiV15(config)
+        data = json.dumps([{'id': 3, 'lastModified': 10}, {'id': 2}])
+        chunks = [data[i:i + 5].encode('utf-8')
+                  for i in range(0, len(data), 5)]
+        feeds = list(api.iter_feeds(chunks, 'john'))
+        self.assertEqual([(3, 'john', 10), (2, 'john', None)],
+                         [(feed.feed_id, feed.user_id, feed.last_modified)
+                          for feed in feeds])
+
+    def test_parse_string_last_modified_v15(self):
+        config = Config()
+        config.url = '/'
+        api = CliApiV15(config)
+        data = json.dumps([{'id': 3, 'lastModified': '1700000000123456'},
+                           {'id': 2, 'lastModified': 'invalid'},
+                           {'id': 1, 'lastModified': None}])
+        feeds = list(api.iter_feeds([data.encode('utf-8')], 'john'))
+        self.assertEqual([1700000000123456, None, None],
+                         [feed.last_modified for feed in feeds])
+        table = FeedTable()
+        table.extend(feeds)
+        self.assertEqual(1700000000123456, table[0].last_modified)
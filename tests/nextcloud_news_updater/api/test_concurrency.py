@@ -0,0 +1,74 @@
+import socket
+from unittest import TestCase
+from urllib.error import HTTPError
+
+from nextcloud_news_updater.api.api import FeedUpdateException
+from nextcloud_news_updater.api.concurrency import AimdController, \
+    is_overload
+
+
+class SimulatedServer:
+    """
+    Server which handles capacity updates at the same time in one second,
+    additional parallel updates queue up and take proportionally longer.
+    Updates which take longer than timeout seconds fail
+    """
+
+    def __init__(self, capacity: int, timeout: float = None) -> None:
+        self.capacity = capacity
+        self.timeout = timeout
+
+    def update(self, in_flight: int) -> tuple:
+        duration = max(1.0, in_flight / self.capacity)
+        if self.timeout is not None and duration > self.timeout:
+            return self.timeout, socket.timeout('timed out')
+        return duration, None
+
+
+class TestAimdController(TestCase):
+    def simulate(self, controller, server, rounds=500):
+        limits = []
+        for _ in range(rounds):
+            limit = controller.limit
+            limits.append(limit)
+            duration, error = server.update(limit)
+            for _ in range(limit):
+                controller.record(duration, error)
+        return limits
+
+    def test_converges_to_server_capacity(self):
+        controller = AimdController(1, 200, 5)
+        limits = self.simulate(controller, SimulatedServer(20))[100:]
+        self.assertGreaterEqual(min(limits), 10)
+        # latency doubles at twice the capacity
+        self.assertLessEqual(max(limits), 50)
+        # throughput stays close to the server's capacity
+        throughput = [min(limit, 20) for limit in limits]
+        self.assertGreater(sum(throughput) / len(throughput), 15)
+        self.assertGreater(controller.decreases, 0)
+
+    def test_backs_off_on_timeouts(self):
+        controller = AimdController(1, 200, 100, tolerance=100)
+        limits = self.simulate(controller, SimulatedServer(20, 1.5))[100:]
+        # updates time out above 30 parallel updates
+        self.assertLessEqual(max(limits), 32)
+
+    def test_floor_and_ceiling(self):
+        controller = AimdController(4, 8, 50)
+        self.assertEqual(8, controller.limit)
+        self.simulate(controller, SimulatedServer(1000), 50)
+        self.assertEqual(8, controller.limit)
+        self.simulate(controller, SimulatedServer(1, 0.5), 50)
+        self.assertEqual(4, controller.limit)
+
+    def test_is_overload(self):
+        server_error = HTTPError('http://x', 503, 'Unavailable', {}, None)
+        not_found = HTTPError('http://x', 404, 'Not Found', {}, None)
+        self.assertTrue(is_overload(server_error))
+        self.assertFalse(is_overload(not_found))
+        self.assertFalse(is_overload(None))
+        self.assertFalse(is_overload(ValueError('broken feed')))
+        try:
+            raise FeedUpdateException('timeout') from socket.timeout()
+        except FeedUpdateException as e:
+            self.assertTrue(is_overload(e))
@@ -0,0 +1,163 @@
+import os
+import tempfile
+import threading
+import time
+from unittest import TestCase
+
+from nextcloud_news_updater.api.api import Feed
+from nextcloud_news_updater.api.control import ControlError, \
+    UpdaterControl
+from nextcloud_news_updater.api.feedqueue import FeedQueue
+from nextcloud_news_updater.api.updater import Updater, UpdateThread
+from nextcloud_news_updater.common.logger import Logger
+from nextcloud_news_updater.config import Config
+
+
+def wait_until(condition, timeout=5):
+    deadline = time.monotonic() + timeout
+    while not condition():
+        if time.monotonic() > deadline:
+            raise AssertionError('condition not met in time')
+        time.sleep(0.005)
+
+
+class FakeUpdateThread(UpdateThread):
+    def __init__(self, feeds: FeedQueue, updater: 'FakeUpdater') -> None:
+        super().__init__(feeds, updater.logger)
+        self.updater = updater
+
+    def update_feed(self, feed: Feed) -> None:
+        self.updater.gate.wait()
+        self.updater.updated.append(feed.feed_id)
+
+
+class FakeUpdater(Updater):
+    def __init__(self, config: Config, feeds: int) -> None:
+        super().__init__(config, Logger(config))
+        self.feeds = [Feed(feed_id, 'user%d' % (feed_id % 3))
+                      for feed_id in range(1, feeds + 1)]
+        self.gate = threading.Event()
+        self.updated = []
+        self.runs = 0
+
+    def before_update(self) -> None:
+        self.runs += 1
+
+    def after_update(self) -> None:
+        pass
+
+    def all_feeds(self):
+        return self.feeds
+
+    def start_update_thread(self, feeds: FeedQueue) -> UpdateThread:
+        return FakeUpdateThread(feeds, self)
+
+
+class TestUpdaterControl(TestCase):
+    def setUp(self):
+        self.config = Config()
+        self.config.mode = 'endless'
+        self.config.interval = 3600
+        self.config.threads = 2
+        self.updater = FakeUpdater(self.config, 50)
+        self.control = UpdaterControl(self.updater)
+        self.thread = threading.Thread(target=self.updater.run)
+
+    def tearDown(self):
+        self.updater.drain()
+        self.updater.gate.set()
+        if self.thread.ident is not None:
+            self.thread.join(5)
+            self.assertFalse(self.thread.is_alive())
+
+    def test_resize_and_drain(self):
+        self.thread.start()
+        wait_until(lambda: self.updater.queue is not None and
+                   self.updater.queue.in_flight == 2)
+        status = self.control.handle({'command': 'status'})
+        self.assertIn('updates', status['phases'])
+        self.assertEqual(2, status['in_flight'])
+
+        self.control.handle({'command': 'resize', 'threads': 4})
+        wait_until(lambda: self.updater.queue.in_flight == 4)
+        self.control.handle({'command': 'resize', 'threads': 1})
+        self.assertEqual(1, self.updater.queue.limit)
+        self.assertEqual(4, len(self.updater.update_threads))
+
+        self.assertEqual({'dropped': 46},
+                         self.control.handle({'command': 'drain'}))
+        self.updater.gate.set()
+        self.thread.join(5)
+        self.assertEqual(4, len(self.updater.updated))
+        self.assertEqual(4, self.updater.last_run['updates'])
+        self.assertEqual(1, self.updater.runs)
+
+    def test_run(self):
+        self.updater.gate.set()
+        self.assertRaises(ControlError, self.control.handle,
+                          {'command': 'run'})
+        self.thread.start()
+        wait_until(lambda: self.updater.next_run is not None)
+        self.assertEqual(50, self.updater.last_run['updates'])
+        self.control.handle({'command': 'run'})
+        wait_until(lambda: len(self.updater.updated) == 100)
+        self.assertEqual(2, self.updater.runs)
+
+    def test_update(self):
+        self.updater.gate.set()
+        self.thread.start()
+        wait_until(lambda: self.updater.next_run is not None)
+        result = self.control.handle({'command': 'update',
+                                      'feeds': [4, [70, 'deb'], 99]})
+        self.assertEqual([(70, 'deb'), (4, 'user1')],
+                         [(update['id'], update['user'])
+                          for update in result['updated']])
+        self.assertIsNone(result['updated'][0]['error'])
+        self.assertEqual([99], result['unknown'])
+
+    def test_invalid_commands(self):
+        for request in ({'command': 'restart'},
+                        {'command': 'resize', 'threads': 0},
+                        {'command': 'update', 'feeds': []},
+                        {'command': 'update', 'feeds': ['x']}):
+            self.assertRaises(ControlError, self.control.handle, request)
+
+
+class TestControlSocket(TestCase):
+    def setUp(self):
+        self.dir = tempfile.TemporaryDirectory()
+        self.path = os.path.join(self.dir.name, 'control.sock')
+
+    def tearDown(self):
+        self.dir.cleanup()
+
+    def test_round_trip(self):
+        from nextcloud_news_updater.common.controlserver import ControlServer
+        from nextcloud_news_updater.control import send
+
+        def handle(request):
+            if request['command'] == 'fail':
+                raise ControlError('failed')
+            return {'echo': request['command']}
+
+        server = ControlServer(self.path, handle)
+        server.start()
+        try:
+            self.assertEqual(0o600, os.stat(self.path).st_mode & 0o777)
+            self.assertEqual({'ok': True, 'echo': 'status'},
+                             send(self.path, {'command': 'status'}))
+            self.assertEqual({'ok': False, 'error': 'failed'},
+                             send(self.path, {'command': 'fail'}))
+            self.assertRaises(OSError, ControlServer, self.path, handle)
+        finally:
+            server.close()
+        self.assertFalse(os.path.exists(self.path))
+
+    def test_removes_stale_socket(self):
+        from nextcloud_news_updater.common.controlserver import ControlServer
+        server = ControlServer(self.path, lambda request: {})
+        # left behind by an updater which was killed
+        server.server_close()
+        self.assertTrue(os.path.exists(self.path))
+        server = ControlServer(self.path, lambda request: {})
+        server.close()
@@ -0,0 +1,106 @@
+import json
+import os
+import tempfile
+from unittest import TestCase
+
+from nextcloud_news_updater.api.api import Feed
+from nextcloud_news_updater.api.feedcache import ALL_FEEDS, FeedListCache
+from nextcloud_news_updater.api.web import WebApi
+from nextcloud_news_updater.config import Config
+
+
+class TestFeedListCache(TestCase):
+    def setUp(self):
+        self.now = 1000.0
+        self.dir = tempfile.TemporaryDirectory()
+        self.path = os.path.join(self.dir.name, 'feeds.json')
+        self.cache = self._create_cache()
+        config = Config()
+        config.url = 'http://localhost'
+        self.api = WebApi(config)
+
+    def tearDown(self):
+        self.dir.cleanup()
+
+    def _create_cache(self, source='v1-2 http://localhost'):
+        return FeedListCache(self.path, source, 60, lambda: self.now)
+
+    def _store(self, key, feeds, etag=None):
+        body = json.dumps({'feeds': feeds}).encode('utf-8')
+        return list(self.cache.store(key, [body[:10], body[10:]],
+                                     self.api.iter_feeds, etag))
+
+    def _ids(self, feeds):
+        return [(feed.feed_id, feed.user_id, feed.last_modified)
+                for feed in feeds]
+
+    def test_store_and_replay(self):
+        feeds = self._store(ALL_FEEDS, [{'id': 3, 'userId': 'john'},
+                                        {'id': 2, 'userId': 'deb'}])
+        self.assertEqual([(3, 'john', None), (2, 'deb', None)],
+                         self._ids(feeds))
+        self.assertEqual(self._ids(feeds),
+                         self._ids(self.cache.replay(ALL_FEEDS)))
+
+    def test_replay_drops_unverified_modification_times(self):
+        list(self.cache.store(ALL_FEEDS, [],
+                              lambda chunks: iter([Feed(1, 'deb', 5)])))
+        self.assertEqual([(1, 'deb', 5)],
+                         self._ids(self.cache.replay(ALL_FEEDS, True)))
+        self.assertEqual([(1, 'deb', None)], self._ids(self.cache.replay()))
+
+    def test_unchanged_list_is_not_saved_again(self):
+        self._store('john', [{'id': 3, 'userId': 'john'}])
+        self.cache.save()
+        self.assertFalse(self.cache.changed)
+        self._store('john', [{'id': 3, 'userId': 'john'}])
+        self.assertFalse(self.cache.changed)
+        self._store('john', [{'id': 4, 'userId': 'john'}])
+        self.assertTrue(self.cache.changed)
+
+    def test_refresh_cadence(self):
+        self.assertFalse(self.cache.is_fresh())
+        self._store('john', [{'id': 3, 'userId': 'john'}])
+        self._store('deb', [{'id': 2, 'userId': 'deb'}])
+        self.cache.refreshed(['john'])
+        self.assertEqual(['john'], list(self.cache.lists))
+        self.assertTrue(self.cache.is_fresh())
+        self.now += 60
+        self.assertFalse(self.cache.is_fresh())
+
+    def test_refreshed_once_the_list_was_parsed(self):
+        body = json.dumps({'feeds': [{'id': 3, 'userId': 'john'}]})
+        feeds = self.cache.store(ALL_FEEDS, [body.encode('utf-8')],
+                                 self.api.iter_feeds, refresh=True)
+        self.assertFalse(self.cache.is_fresh())
+        self.assertEqual([(3, 'john', None)], self._ids(feeds))
+        self.assertTrue(self.cache.is_fresh())
+
+        self.now += 60
+        broken = self.cache.store(ALL_FEEDS, [body[:20].encode('utf-8')],
+                                  self.api.iter_feeds, refresh=True)
+        with self.assertRaises(ValueError):
+            list(broken)
+        self.assertFalse(self.cache.is_fresh())
+
+    def test_validators(self):
+        self.assertEqual({}, self.cache.validators(ALL_FEEDS))
+        self._store(ALL_FEEDS, [], '"abc"')
+        self.assertEqual({'If-None-Match': '"abc"'},
+                         self.cache.validators(ALL_FEEDS))
+
+    def test_save_and_load(self):
+        self._store(ALL_FEEDS, [{'id': 3, 'userId': 'john'}], '"abc"')
+        self.cache.refreshed()
+        self.cache.save()
+
+        cache = self._create_cache()
+        cache.load()
+        self.assertTrue(cache.is_fresh())
+        self.assertEqual({'If-None-Match': '"abc"'},
+                         cache.validators(ALL_FEEDS))
+        self.assertEqual([(3, 'john', None)], self._ids(cache.replay()))
+
+        cache = self._create_cache('v15 http://localhost')
+        cache.load()
+        self.assertEqual({}, cache.lists)
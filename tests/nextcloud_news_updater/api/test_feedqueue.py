@@ -0,0 +1,273 @@
+import heapq
+import os
+import random
+import tempfile
+import threading
+from unittest import TestCase
+
+from nextcloud_news_updater.api.api import Feed
+from nextcloud_news_updater.api.feedqueue import ContinuousFeedQueue, \
+    FairFeedQueue, FeedQueue, LongestFirstFeedQueue
+from nextcloud_news_updater.api.scheduler import FeedScheduler
+
+
+class TestFeedQueue(TestCase):
+    def setUp(self):
+        self.queue = FeedQueue()
+
+    def test_pop_in_order(self):
+        self.queue.extend([Feed(1, 'john'), Feed(2, 'deb')])
+        self.queue.put(Feed(3, 'john'))
+        self.queue.close()
+        self.assertEqual(3, len(self.queue))
+        self.assertEqual([1, 2, 3],
+                         [self.queue.pop().feed_id for _ in range(3)])
+        self.assertRaises(IndexError, self.queue.pop)
+
+    def test_drain(self):
+        self.queue.extend([Feed(1, 'john'), Feed(2, 'deb'), Feed(3, 'john')])
+        feed = self.queue.pop()
+        self.assertEqual(2, self.queue.drain())
+        self.queue.put(Feed(4, 'deb'))
+        self.assertEqual(0, len(self.queue))
+        self.assertRaises(IndexError, self.queue.pop)
+        self.queue.done(feed, 1.0, None)
+        self.assertEqual(1, self.queue.completed)
+
+    def test_poll(self):
+        self.queue.set_limit(1)
+        self.queue.extend([Feed(1, 'john'), Feed(2, 'deb')])
+        self.queue.close()
+        feed = self.queue.poll()
+        self.assertEqual(1, feed.feed_id)
+        self.assertIsNone(self.queue.poll())
+        self.queue.done(feed, 1.0)
+        self.assertEqual(2, self.queue.poll().feed_id)
+        self.assertRaises(IndexError, self.queue.poll)
+
+    def test_pop_waits_for_feeds(self):
+        popped = []
+
+        def consume():
+            while True:
+                try:
+                    popped.append(self.queue.pop().feed_id)
+                except IndexError:
+                    return
+
+        consumer = threading.Thread(target=consume)
+        consumer.start()
+        self.queue.put(Feed(1, 'john'))
+        self.queue.put(Feed(2, 'john'))
+        self.queue.close()
+        consumer.join(5)
+        self.assertFalse(consumer.is_alive())
+        self.assertEqual([1, 2], popped)
+
+    def test_wait_summary(self):
+        self.queue.extend([Feed(1, 'john'), Feed(2, 'deb')])
+        self.queue.pop()
+        self.queue.pop()
+        summary = self.queue.wait_summary()
+        self.assertEqual({'john', 'deb'}, {user for user, _ in summary})
+        self.assertTrue(all(wait.count == 1 for _, wait in summary))
+
+    def test_limit(self):
+        self.queue.set_limit(1)
+        self.queue.extend([Feed(1, 'john'), Feed(2, 'deb')])
+        self.queue.close()
+        first = self.queue.pop()
+
+        popped = []
+        consumer = threading.Thread(
+            target=lambda: popped.append(self.queue.pop().feed_id))
+        consumer.start()
+        consumer.join(0.1)
+        self.assertTrue(consumer.is_alive())
+        self.queue.done(first, 0.1)
+        consumer.join(5)
+        self.assertFalse(consumer.is_alive())
+        self.assertEqual([2], popped)
+        self.assertEqual(1, self.queue.in_flight)
+
+    def test_pause(self):
+        self.queue.put(Feed(1, 'john'))
+        self.queue.pause(0.2)
+        popped = []
+        consumer = threading.Thread(
+            target=lambda: popped.append(self.queue.pop().feed_id))
+        consumer.start()
+        consumer.join(0.05)
+        self.assertTrue(consumer.is_alive())
+        consumer.join(5)
+        self.assertFalse(consumer.is_alive())
+        self.assertEqual([1], popped)
+
+
+class TestFairFeedQueue(TestCase):
+    def test_interleaves_users(self):
+        queue = FairFeedQueue()
+        queue.extend([Feed(1, 'john'), Feed(2, 'john'), Feed(3, 'john'),
+                      Feed(4, 'deb'), Feed(5, 'deb'), Feed(6, 'ann')])
+        queue.close()
+        self.assertEqual([1, 4, 6, 2, 5, 3],
+                         [queue.pop().feed_id for _ in range(6)])
+        self.assertRaises(IndexError, queue.pop)
+
+    def test_user_limit(self):
+        queue = FairFeedQueue(user_limit=1)
+        queue.extend([Feed(1, 'john'), Feed(2, 'john'), Feed(3, 'deb')])
+        queue.close()
+        first = queue.pop()
+        self.assertEqual(3, queue.pop().feed_id)
+
+        popped = []
+        consumer = threading.Thread(
+            target=lambda: popped.append(queue.pop().feed_id))
+        consumer.start()
+        consumer.join(0.1)
+        # john's second feed has to wait until the first one is done
+        self.assertTrue(consumer.is_alive())
+        queue.done(first, 0.1)
+        consumer.join(5)
+        self.assertFalse(consumer.is_alive())
+        self.assertEqual([2], popped)
+
+
+def makespan(queue, durations, threads):
+    """
+    Simulates threads update threads which take feeds from the queue as soon
+    as they are idle and returns the time at which the last update finished
+    """
+    idle_at = [0.0] * threads
+    while True:
+        try:
+            feed = queue.pop()
+        except IndexError:
+            return max(idle_at)
+        heapq.heappush(idle_at,
+                       heapq.heappop(idle_at) + durations[feed.feed_id])
+
+
+class TestLongestFirstFeedQueue(TestCase):
+    def setUp(self):
+        self.directory = tempfile.TemporaryDirectory()
+        self.scheduler = FeedScheduler(
+            os.path.join(self.directory.name, 'schedule.json'), 100, 100,
+            adaptive=False)
+
+    def tearDown(self):
+        self.directory.cleanup()
+
+    def test_pops_longest_first(self):
+        for feed_id, duration in [(1, 1), (2, 5), (3, 3), (4, 5)]:
+            self.scheduler.record(Feed(feed_id, 'john'), duration)
+        queue = LongestFirstFeedQueue(scheduler=self.scheduler)
+        # feed 5 is unknown and assumed to take the mean of 3.5 seconds
+        queue.extend([Feed(feed_id, 'john') for feed_id in range(1, 6)])
+        queue.close()
+        self.assertEqual([2, 4, 5, 3, 1],
+                         [queue.pop().feed_id for _ in range(5)])
+        self.assertRaises(IndexError, queue.pop)
+
+    def test_without_durations_in_order(self):
+        queue = LongestFirstFeedQueue(scheduler=self.scheduler)
+        queue.extend([Feed(1, 'john'), Feed(2, 'deb')])
+        queue.close()
+        self.assertEqual([1, 2], [queue.pop().feed_id for _ in range(2)])
+
+    def test_shortens_makespan(self):
+        rng = random.Random(1)
+        # most feeds are fast, a few are very slow
+        durations = {feed_id: rng.lognormvariate(0, 1.5)
+                     for feed_id in range(1000)}
+        for feed_id, duration in durations.items():
+            self.scheduler.record(Feed(feed_id, 'john'), duration)
+        # the durations vary between runs
+        durations = {feed_id: duration * rng.uniform(0.7, 1.3)
+                     for feed_id, duration in durations.items()}
+        feeds = [Feed(feed_id, 'john') for feed_id in durations]
+        threads = 20
+        lower_bound = max(sum(durations.values()) / threads,
+                          max(durations.values()))
+
+        fifo = FeedQueue()
+        fifo.extend(feeds)
+        fifo.close()
+        longest = LongestFirstFeedQueue(scheduler=self.scheduler)
+        longest.extend(feeds)
+        longest.close()
+        fifo_makespan = makespan(fifo, durations, threads)
+        longest_makespan = makespan(longest, durations, threads)
+
+        self.assertLess(longest_makespan, 0.9 * fifo_makespan)
+        self.assertLess(longest_makespan, 1.01 * lower_bound)
+
+
+class Clock:
+    def __init__(self):
+        self.now = 1000.0
+
+    def __call__(self):
+        return self.now
+
+
+class TestContinuousFeedQueue(TestCase):
+    def setUp(self):
+        self.clock = Clock()
+        self.queue = ContinuousFeedQueue(interval=60, clock=self.clock)
+
+    def test_requeues_updated_feeds(self):
+        self.queue.extend([Feed(1, 'john'), Feed(2, 'deb')])
+        self.queue.done(self.queue.pop(), 0.1)
+        self.clock.now += 10
+        self.queue.done(self.queue.pop(), 0.1)
+        self.assertEqual(2, len(self.queue))
+        self.assertEqual(50, self.queue._wait_timeout())
+        self.clock.now += 50
+        self.assertEqual(1, self.queue.pop().feed_id)
+        self.assertEqual(10, self.queue._wait_timeout())
+
+    def test_pop_waits_until_due(self):
+        queue = ContinuousFeedQueue(interval=0.2)
+        queue.put(Feed(1, 'john'))
+        feed = queue.pop()
+        queue.done(feed, 0.1)
+        popped = []
+        consumer = threading.Thread(
+            target=lambda: popped.append(queue.pop().feed_id))
+        consumer.start()
+        consumer.join(0.05)
+        self.assertTrue(consumer.is_alive())
+        consumer.join(5)
+        self.assertFalse(consumer.is_alive())
+        self.assertEqual([1], popped)
+
+    def test_refresh_keeps_known_feeds(self):
+        self.queue.extend([Feed(1, 'john'), Feed(2, 'deb')])
+        self.queue.done(self.queue.pop(), 0.1)
+        self.queue.begin_refresh()
+        self.queue.extend([Feed(1, 'john'), Feed(2, 'deb'), Feed(3, 'ann')])
+        self.assertEqual(0, self.queue.end_refresh())
+        self.assertEqual(3, len(self.queue))
+        self.assertEqual([2, 3], [self.queue.pop().feed_id
+                                  for _ in range(2)])
+        self.assertEqual(3, len(self.queue.table))
+
+    def test_refresh_drops_unlisted_feeds(self):
+        self.queue.extend([Feed(1, 'john'), Feed(2, 'deb'), Feed(3, 'ann')])
+        in_flight = self.queue.pop()
+        self.queue.begin_refresh()
+        self.queue.put(Feed(3, 'ann'))
+        self.assertEqual(2, self.queue.end_refresh())
+        self.assertEqual(1, len(self.queue))
+        self.queue.done(in_flight, 0.1)
+        self.assertEqual(1, len(self.queue))
+        self.assertEqual(3, self.queue.pop().feed_id)
+
+    def test_close_stops_workers(self):
+        self.queue.put(Feed(1, 'john'))
+        feed = self.queue.pop()
+        self.queue.close()
+        self.queue.done(feed, 0.1)
+        self.assertRaises(IndexError, self.queue.pop)
@@ -0,0 +1,39 @@
+from unittest import TestCase
+
+from nextcloud_news_updater.api.api import Feed
+from nextcloud_news_updater.api.feedtable import FeedTable
+
+
+class TestFeedTable(TestCase):
+    def setUp(self):
+        self.table = FeedTable()
+
+    def test_append(self):
+        self.assertEqual(0, self.table.append(Feed(3, 'john', 1600000000)))
+        self.assertEqual(1, self.table.append(Feed(2, 'deb'), 12.5))
+        self.assertEqual(2, len(self.table))
+
+        feed = self.table[0]
+        self.assertEqual((3, 'john', 1600000000),
+                         (feed.feed_id, feed.user_id, feed.last_modified))
+        feed = self.table[1]
+        self.assertEqual((2, 'deb', None),
+                         (feed.feed_id, feed.user_id, feed.last_modified))
+        self.assertEqual(12.5, self.table.queued_at[1])
+
+    def test_users_are_stored_once(self):
+        self.table.extend([Feed(1, 'john'), Feed(2, 'deb'), Feed(3, 'john')])
+        self.assertEqual(['john', 'deb'], self.table.user_ids)
+        self.assertEqual([0, 1, 0], list(self.table.users))
+        self.assertEqual('john', self.table.user_id(2))
+        self.assertEqual([1, 2, 3], [feed.feed_id for feed in self.table])
+
+    def test_json(self):
+        self.table.extend([Feed(1, 'john', 1600000000), Feed(2, 'deb')])
+        table = FeedTable.from_json(self.table.to_json())
+        self.assertEqual([(1, 'john', 1600000000), (2, 'deb', None)],
+                         [(feed.feed_id, feed.user_id, feed.last_modified)
+                          for feed in table])
+        table.append(Feed(3, 'deb'), 5.0)
+        self.assertEqual([0, 1, 1], list(table.users))
+        self.assertEqual([0.0, 0.0, 5.0], list(table.queued_at))
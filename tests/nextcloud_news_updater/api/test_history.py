@@ -0,0 +1,75 @@
+import os
+import sqlite3
+import tempfile
+import threading
+from unittest import TestCase
+from unittest.mock import patch
+from urllib.error import URLError
+
+from nextcloud_news_updater.api.api import Feed, FeedUpdateException
+from nextcloud_news_updater.api.history import RunHistory
+
+
+class TestRunHistory(TestCase):
+    def setUp(self):
+        self.dir = tempfile.TemporaryDirectory()
+        self.path = os.path.join(self.dir.name, 'history.sqlite')
+        self.history = RunHistory(self.path, 'endless')
+
+    def tearDown(self):
+        self.history.close()
+        self.dir.cleanup()
+
+    def _query(self, query):
+        connection = sqlite3.connect(self.path)
+        try:
+            return connection.execute(query).fetchall()
+        finally:
+            connection.close()
+
+    def test_records_updates_and_runs(self):
+        self.history.begin_run()
+        self.history.record(Feed(3, 'john'), 0.5, None)
+        error = FeedUpdateException('failed')
+        error.__cause__ = URLError('refused')
+        self.history.record(Feed(2, 'deb'), 1.5, error)
+        self.history.finish_run(True)
+        self.history.begin_run()
+        self.history.finish_run(False)
+
+        self.assertEqual([(1, 'endless', 2, 1, 1), (2, 'endless', 0, 0, 0)],
+                         self._query('SELECT id, mode, updates, failures, '
+                                     'success FROM runs'))
+        self.assertEqual([(1, 3, 'john', 0.5, 1, None),
+                          (1, 2, 'deb', 1.5, 0, 'URLError')],
+                         self._query('SELECT run, feed_id, user_id, '
+                                     'duration, success, error '
+                                     'FROM updates'))
+
+    def test_flushes_full_buffer(self):
+        self.history.begin_run()
+        with patch('nextcloud_news_updater.api.history.FLUSH_SIZE', 2):
+            self.history.record(Feed(1, 'john'), 0.1, None)
+            self.assertEqual([(0,)],
+                             self._query('SELECT COUNT(*) FROM updates'))
+            self.history.record(Feed(2, 'john'), 0.1, None)
+            self.assertEqual([(2,)],
+                             self._query('SELECT COUNT(*) FROM updates'))
+
+    def test_records_while_a_batch_is_written(self):
+        self.history.begin_run()
+        with patch('nextcloud_news_updater.api.history.FLUSH_SIZE', 1):
+            # the disk is busy writing a batch of another thread
+            with self.history._write_lock:
+                flushing = threading.Thread(
+                    target=self.history.record,
+                    args=(Feed(1, 'john'), 0.1, None))
+                flushing.start()
+                flushing.join(0.1)
+                self.assertTrue(flushing.is_alive())
+                # other update threads can still add to the buffer
+                self.assertTrue(self.history._lock.acquire(timeout=1))
+                self.history._lock.release()
+            flushing.join()
+        self.history.finish_run(True)
+        self.assertEqual([(1,)], self._query('SELECT COUNT(*) FROM updates'))
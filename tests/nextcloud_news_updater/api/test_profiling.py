@@ -0,0 +1,99 @@
+import cProfile
+import os
+import tempfile
+import threading
+import time
+from unittest import TestCase, skipUnless
+
+from nextcloud_news_updater.api.profiling import CallProfiler, RunProfile, \
+    SamplingProfiler, PROCESS_WIDE_CPROFILE, PROFILE_LIMIT
+
+
+class Worker:
+    def __init__(self, name, updates, busy, idle):
+        self.name = name
+        self.updates = updates
+        self.busy = busy
+        self.idle = idle
+
+
+def spin(seconds):
+    end = time.monotonic() + seconds
+    while time.monotonic() < end:
+        pass
+
+
+class TestRunProfile(TestCase):
+    def setUp(self):
+        self.dir = tempfile.TemporaryDirectory()
+        self.path = os.path.join(self.dir.name, 'profile.txt')
+
+    def tearDown(self):
+        self.dir.cleanup()
+
+    def _read(self):
+        with open(self.path) as infile:
+            return infile.read()
+
+    def test_report(self):
+        profile = RunProfile(self.path)
+        profile.begin()
+        profile.phase_finished('updates', 2.0, 0.5, 1.25)
+        profile.add_worker(Worker('Thread-1', 3, 1.5, 0.5))
+        profile.add_worker(Worker('Thread-2', 1, 0.5, 1.5))
+        profile.write('Run')
+        lines = self._read().splitlines()
+        self.assertTrue(lines[0].startswith('=== Run at '))
+        self.assertEqual(['updates', '2.000', '0.500', '1.250'],
+                         lines[2].split())
+        self.assertEqual(['Thread-1', '3', '1.500', '0.500', '75.0'],
+                         lines[5].split())
+        self.assertEqual(['total', '4', '2.000', '2.000', '50.0'],
+                         lines[7].split())
+
+    def test_profiler_only_runs_once(self):
+        profile = RunProfile(self.path, 'sampling')
+        for run in range(2):
+            profile.begin()
+            spin(0.05)
+            profile.write('Run')
+        report = self._read()
+        self.assertEqual(2, report.count('=== Run'))
+        self.assertEqual(1, report.count('--- sampling ---'))
+
+    @skipUnless(PROCESS_WIDE_CPROFILE, 'profilers can be nested')
+    def test_cprofile_falls_back_to_sampling(self):
+        other = cProfile.Profile()
+        other.enable()
+        try:
+            profile = RunProfile(self.path, 'cprofile')
+            profile.begin()
+        finally:
+            other.disable()
+        spin(0.05)
+        profile.write('Run')
+        self.assertIn('--- sampling ---', self._read())
+
+
+class TestCallProfilers(TestCase):
+    def test_sampling(self):
+        profiler = SamplingProfiler(0.001)
+        profiler.start()
+        thread = threading.Thread(target=spin, args=(0.1,))
+        thread.start()
+        thread.join()
+        profiler.stop()
+        self.assertGreater(profiler.samples, 0)
+        self.assertIn('spin', profiler.format(10))
+
+    def test_cprofile_covers_new_threads(self):
+        profiler = CallProfiler()
+        profiler.start()
+        thread = threading.Thread(target=spin, args=(0.01,))
+        thread.start()
+        thread.join()
+        profiler.stop()
+        # one profile per thread, or one for all threads from Python 3.12 on
+        self.assertEqual(1 if PROCESS_WIDE_CPROFILE else 2,
+                         len(profiler.profiles))
+        self.assertIn('spin', profiler.format(PROFILE_LIMIT))
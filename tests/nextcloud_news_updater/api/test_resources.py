@@ -0,0 +1,100 @@
+import os
+import resource
+import sys
+from subprocess import PIPE, Popen
+from unittest import TestCase
+
+from nextcloud_news_updater.api.resources import HostThrottle, \
+    ProcessPolicy, create_host_throttle
+from nextcloud_news_updater.config import Config
+
+
+class FakeHost:
+    def __init__(self) -> None:
+        self.now = 0.0
+        self.load = 1.0
+        self.memory = 1024
+        self.readings = 0
+
+    def clock(self) -> float:
+        return self.now
+
+    def read_load(self) -> float:
+        self.readings += 1
+        return self.load
+
+    def read_memory(self) -> int:
+        return self.memory
+
+
+class TestHostThrottle(TestCase):
+    def setUp(self):
+        self.host = FakeHost()
+        self.throttle = HostThrottle(2.0, 512, 5, self.host.clock,
+                                     self.host.read_load,
+                                     self.host.read_memory)
+
+    def test_idle_host(self):
+        self.assertEqual(0, self.throttle.delay())
+        self.assertEqual(0, self.throttle.reset())
+
+    def test_high_load(self):
+        self.host.load = 3.0
+        self.assertEqual(5, self.throttle.delay())
+        self.host.now = 2
+        self.assertEqual(3, self.throttle.delay())
+        self.host.now = 5
+        self.host.load = 1.5
+        self.assertEqual(0, self.throttle.delay())
+        self.assertEqual(8, self.throttle.reset())
+        self.assertEqual(0, self.throttle.reset())
+
+    def test_low_memory(self):
+        self.host.memory = 256
+        self.assertEqual(5, self.throttle.delay())
+
+    def test_readings_are_reused(self):
+        for _ in range(10):
+            self.throttle.delay()
+        self.assertEqual(1, self.host.readings)
+        self.host.now = 5
+        self.throttle.delay()
+        self.assertEqual(2, self.host.readings)
+
+    def test_unknown_readings(self):
+        throttle = HostThrottle(2.0, 512, 5, self.host.clock,
+                                lambda: None, lambda: None)
+        self.assertEqual(0, throttle.delay())
+
+    def test_disabled(self):
+        self.assertIsNone(create_host_throttle(Config()))
+        config = Config()
+        config.maxload = 4.0
+        self.assertIsNotNone(create_host_throttle(config))
+
+
+class TestProcessPolicy(TestCase):
+    def test_wrap(self):
+        self.assertEqual(['php'], ProcessPolicy().wrap(['php']))
+        self.assertEqual(['ionice', '-c', '3', 'php'],
+                         ProcessPolicy(ionice='idle').wrap(['php']))
+
+    def test_apply(self):
+        process = Popen([sys.executable, '-c', 'input()'], stdin=PIPE)
+        try:
+            ProcessPolicy(nice=5, memory=512 * 1024 * 1024,
+                          cpu=60).apply(process.pid)
+            self.assertEqual(max(5, os.getpriority(os.PRIO_PROCESS, 0)),
+                             os.getpriority(os.PRIO_PROCESS, process.pid))
+            self.assertEqual((512 * 1024 * 1024, 512 * 1024 * 1024),
+                             resource.prlimit(process.pid,
+                                              resource.RLIMIT_AS))
+            self.assertEqual((60, 60), resource.prlimit(process.pid,
+                                                        resource.RLIMIT_CPU))
+        finally:
+            process.communicate(b'\n')
+
+    def test_apply_to_exited_process(self):
+        process = Popen([sys.executable, '-c', ''])
+        process.wait()
+        ProcessPolicy(nice=5).apply(process.pid)
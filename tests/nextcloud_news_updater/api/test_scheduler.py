@@ -0,0 +1,119 @@
+import os
+import tempfile
+from unittest import TestCase
+
+from nextcloud_news_updater.api.api import Feed
+from nextcloud_news_updater.api.scheduler import FeedScheduler
+
+
+class Clock:
+    def __init__(self):
+        self.now = 1000.0
+
+    def __call__(self):
+        return self.now
+
+
+class TestFeedScheduler(TestCase):
+    def setUp(self):
+        self.directory = tempfile.TemporaryDirectory()
+        self.path = os.path.join(self.directory.name, 'schedule.json')
+        self.clock = Clock()
+        self.scheduler = FeedScheduler(self.path, 100, 1000, 0, self.clock)
+
+    def tearDown(self):
+        self.directory.cleanup()
+
+    def _run(self, feed, duration=1, error=None):
+        due = self.scheduler.is_due(feed)
+        if due:
+            self.scheduler.record(feed, duration, error)
+        return due
+
+    def test_unknown_feeds_are_due(self):
+        self.assertTrue(self.scheduler.is_due(Feed(1, 'john')))
+
+    def test_feeds_without_changes_use_min_interval(self):
+        feed = Feed(1, 'john')
+        self.assertTrue(self._run(feed))
+        self.clock.now += 99
+        self.assertFalse(self._run(feed))
+        self.clock.now += 1
+        self.assertTrue(self._run(feed))
+
+    def test_unchanged_feeds_back_off(self):
+        self.assertTrue(self._run(Feed(1, 'john', 5)))
+        self.clock.now += 100
+        # the update did not change the feed, the interval grew to 150s
+        self.assertFalse(self._run(Feed(1, 'john', 5)))
+        self.clock.now += 50
+        self.assertTrue(self._run(Feed(1, 'john', 5)))
+        self.assertEqual(150, self.scheduler.records[1].interval)
+
+    def test_intervals_are_bounded(self):
+        for _ in range(20):
+            self.clock.now += 1000
+            self._run(Feed(1, 'john', 5))
+        self.assertEqual(1000, self.scheduler.records[1].interval)
+
+        for modified in range(20):
+            self.clock.now += 1000
+            self._run(Feed(1, 'john', modified))
+        self.assertEqual(100, self.scheduler.records[1].interval)
+
+    def test_changed_feeds_are_updated_more_often(self):
+        for _ in range(3):
+            self.clock.now += 1000
+            self._run(Feed(1, 'john', 5))
+        interval = self.scheduler.records[1].interval
+        self.clock.now += 1000
+        self._run(Feed(1, 'john', 6))
+        self.assertEqual(interval / 2, self.scheduler.records[1].interval)
+
+    def test_failing_feeds_back_off(self):
+        self._run(Feed(1, 'john'), error=Exception())
+        self.assertEqual(200, self.scheduler.records[1].interval)
+        self.assertEqual(1, self.scheduler.records[1].failures)
+        self.clock.now += 200
+        self._run(Feed(1, 'john'))
+        self.assertEqual(0, self.scheduler.records[1].failures)
+
+    def test_feeds_without_modification_time_recover(self):
+        for _ in range(3):
+            self._run(Feed(1, 'john'), error=Exception())
+            self.clock.now += 1000
+        self.assertEqual(800, self.scheduler.records[1].interval)
+        self.assertTrue(self._run(Feed(1, 'john')))
+        self.assertEqual(100, self.scheduler.records[1].interval)
+        self.clock.now += 100
+        self.assertTrue(self._run(Feed(1, 'john')))
+
+    def test_slack(self):
+        scheduler = FeedScheduler(self.path, 100, 1000, 10, self.clock)
+        scheduler.record(Feed(1, 'john'), 1)
+        self.clock.now += 90
+        self.assertTrue(scheduler.is_due(Feed(1, 'john')))
+
+    def test_persists_history(self):
+        self._run(Feed(1, 'john', 5), duration=3)
+        self.scheduler.save()
+
+        scheduler = FeedScheduler(self.path, 100, 1000, 0, self.clock)
+        scheduler.load()
+        self.assertFalse(scheduler.is_due(Feed(1, 'john', 5)))
+        self.assertEqual(3, scheduler.predicted_duration(1))
+        self.assertIsNone(scheduler.predicted_duration(2))
+
+    def test_mean_duration(self):
+        self.assertIsNone(self.scheduler.mean_duration())
+        self._run(Feed(1, 'john'), duration=1)
+        self._run(Feed(2, 'john'), duration=3)
+        self.assertEqual(2, self.scheduler.mean_duration())
+
+    def test_durations_without_adaptive_scheduling(self):
+        scheduler = FeedScheduler(self.path, 100, 100, 0, self.clock,
+                                  adaptive=False)
+        scheduler.record(Feed(1, 'john'), 2, Exception())
+        self.assertTrue(scheduler.is_due(Feed(1, 'john')))
+        self.assertEqual(0, scheduler.due(1))
+        self.assertEqual(2, scheduler.predicted_duration(1))
@@ -0,0 +1,39 @@
+from collections import Counter
+from unittest import TestCase
+
+from nextcloud_news_updater.api.api import Feed
+from nextcloud_news_updater.api.sharding import Shard, jump_hash
+
+FEED_IDS = range(1, 20001)
+
+
+class TestSharding(TestCase):
+    def test_shards_are_disjoint_and_complete(self):
+        feeds = [Feed(feed_id, 'john') for feed_id in FEED_IDS]
+        shards = [Shard(index, 3) for index in range(3)]
+        owned = [set(feed.feed_id for feed in shard.filter(feeds))
+                 for shard in shards]
+        self.assertEqual(len(FEED_IDS), sum(len(ids) for ids in owned))
+        self.assertEqual(set(FEED_IDS), set.union(*owned))
+
+    def test_shards_are_balanced(self):
+        counts = Counter(jump_hash(feed_id, 4) for feed_id in FEED_IDS)
+        self.assertEqual({0, 1, 2, 3}, set(counts))
+        for count in counts.values():
+            self.assertAlmostEqual(len(FEED_IDS) / 4, count,
+                                   delta=len(FEED_IDS) * 0.02)
+
+    def test_adding_a_shard_moves_a_fair_share(self):
+        for count in (1, 2, 5, 9):
+            moved = [feed_id for feed_id in FEED_IDS
+                     if jump_hash(feed_id, count) !=
+                     jump_hash(feed_id, count + 1)]
+            # feeds only move to the new shard
+            self.assertTrue(all(jump_hash(feed_id, count + 1) == count
+                                for feed_id in moved))
+            self.assertAlmostEqual(len(FEED_IDS) / (count + 1), len(moved),
+                                   delta=len(FEED_IDS) * 0.02)
+
+    def test_first_shard_runs_cleanup(self):
+        self.assertTrue(Shard(0, 2).runs_cleanup)
+        self.assertFalse(Shard(1, 2).runs_cleanup)
@@ -1,17 +1,24 @@
 import json
+import os
+import tempfile
 from unittest import TestCase
 from unittest.mock import MagicMock, call
 
+from nextcloud_news_updater.api.metrics import UpdaterMetrics
 from nextcloud_news_updater.api.updater import Updater
 from nextcloud_news_updater.api.web import HttpClient, WebApi, WebApiV2
 from nextcloud_news_updater.config import Config
 from nextcloud_news_updater.container import Container
+from tests.nextcloud_news_updater.common.test_connectionpool import \
+    ServerTestCase
 
 
 class TestWeb(TestCase):
     def setUp(self):
         self.container = Container()
         self.http = MagicMock(spec=HttpClient)
+        self.http.stream.side_effect = lambda url, auth: iter(
+            [self.http.get(url, auth).encode('utf-8')])
         self.container.register(HttpClient, lambda c: self.http)
         self.base_url = 'http://google.de'
 
@@ -99,3 +106,119 @@ class TestWeb(TestCase):
         })
         updater.run()
         self.assertIn(self.http.get.call_args_list, self._create_urls_v2())
+
+    def test_api_v1_calls_asyncio(self):
+        self._set_config(apilevel='v1-2', url=self.base_url, user='john',
+                         password='pass', mode='singlerun', engine='asyncio')
+        updater = self.container.resolve(Updater)
+        self._set_http_get({
+            'feeds': [{'id': 3, 'userId': 'john'}, {'id': 2, 'userId': 'deb'}]
+        })
+        updater.run()
+        before, feeds, update1, update2, after = self._create_urls_v1()[0]
+        self.assertEqual([before, feeds, after], self.http.get.call_args_list)
+        self.assertCountEqual([update1, update2],
+                              self.http.get_async.call_args_list)
+
+    def test_metrics(self):
+        self._set_config(apilevel='v1-2', url=self.base_url, user='john',
+                         password='pass', mode='singlerun')
+        updater = self.container.resolve(Updater)
+        updater.metrics = UpdaterMetrics()
+        self._set_http_get({
+            'feeds': [{'id': 3, 'userId': 'john'}, {'id': 2, 'userId': 'deb'}]
+        })
+        updater.run()
+        metrics = updater.metrics.registry.render()
+        self.assertIn('feed_updates_total{result="success"} 2\n', metrics)
+        self.assertIn('feed_update_duration_seconds_count 2\n', metrics)
+        self.assertIn('runs_total{result="success"} 1\n', metrics)
+        self.assertIn('queue_depth 0\n', metrics)
+        for phase in ('before_update', 'all_feeds', 'updates',
+                      'after_update'):
+            self.assertIn('phase_duration_seconds{phase="%s"}' % phase,
+                          metrics)
+
+    def test_shard(self):
+        self._set_config(apilevel='v1-2', url=self.base_url, user='john',
+                         password='pass', mode='singlerun', shardindex=1,
+                         shardcount=2)
+        updater = self.container.resolve(Updater)
+        self._set_http_get({
+            'feeds': [{'id': 3, 'userId': 'john'}, {'id': 4, 'userId': 'deb'},
+                      {'id': 5, 'userId': 'deb'}]
+        })
+        updater.run()
+        # only the first shard runs the cleanup, feed 3 belongs to it
+        _, feeds, _, _, _ = self._create_urls_v1()[0]
+        update_url = '%s/index.php/apps/news/api/v1-2/feeds/update' \
+                     '?userId=deb&feedId=%d'
+        auth = ('john', 'pass')
+        self.assertEqual(feeds, self.http.get.call_args_list[0])
+        self.assertCountEqual(
+            [call(update_url % (self.base_url, 4), auth, 5 * 60),
+             call(update_url % (self.base_url, 5), auth, 5 * 60)],
+            self.http.get.call_args_list[1:])
+
+    def test_feed_list_cache(self):
+        self._set_config(apilevel='v1-2', url=self.base_url, user='john',
+                         password='pass', mode='singlerun',
+                         feedlistrefresh=3600)
+        updater = self.container.resolve(Updater)
+        body = json.dumps({'feeds': [{'id': 3, 'userId': 'john'}]})
+        self.http.stream_conditional.return_value = (
+            200, {'ETag': '"v1"'}, iter([body.encode('utf-8')]))
+        updater.run()
+        self.http.stream_conditional.return_value = (304, {}, iter(()))
+        updater.run()
+
+        _, feeds, _, update, _ = self._create_urls_v1()[0]
+        self.assertEqual(
+            [call(feeds[1][0], feeds[1][1], {}),
+             call(feeds[1][0], feeds[1][1], {'If-None-Match': '"v1"'})],
+            self.http.stream_conditional.call_args_list)
+        self.assertEqual(2, self.http.get.call_args_list.count(update))
+
+    def test_profile(self):
+        with tempfile.TemporaryDirectory() as directory:
+            path = os.path.join(directory, 'profile.txt')
+            self._set_config(apilevel='v1-2', url=self.base_url, user='john',
+                             password='pass', mode='singlerun', threads=2,
+                             profile=path)
+            updater = self.container.resolve(Updater)
+            self._set_http_get({
+                'feeds': [{'id': 3, 'userId': 'john'},
+                          {'id': 2, 'userId': 'deb'}]
+            })
+            updater.run()
+            with open(path) as infile:
+                report = infile.read()
+        phases = [line.split()[0] for line in report.splitlines()[2:6]]
+        self.assertCountEqual(['before_update', 'all_feeds', 'updates',
+                               'after_update'], phases)
+        self.assertIn('\ntotal ', report)
+        self.assertEqual(2, sum(thread.updates
+                                for thread in updater.profile.workers))
+
+
+class TestHttpClient(ServerTestCase):
+    def setUp(self):
+        super().setUp()
+        self.client = HttpClient(Config())
+
+    def tearDown(self):
+        self.client.pool.close()
+        super().tearDown()
+
+    def test_stream_conditional(self):
+        url = self.url + '/etag'
+        status, received, chunks = self.client.stream_conditional(
+            url, ('john', 'pass'), {})
+        self.assertEqual((200, {'ETag': '"v1"'}), (status, received))
+        self.assertEqual(b'/etag', b''.join(chunks))
+
+        status, received, chunks = self.client.stream_conditional(
+            url, ('john', 'pass'), {'If-None-Match': '"v1"'})
+        self.assertEqual((304, {}, b''), (status, received, b''.join(chunks)))
+        # the connection is reused after both responses
+        self.assertEqual(1, self.client.stats()['hits'])
@@ -0,0 +1,208 @@
+import asyncio
+import socket
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, HTTPServer
+from socketserver import ThreadingMixIn
+from unittest import TestCase
+from urllib.error import HTTPError
+
+from nextcloud_news_updater.common.connectionpool import ConnectionPool, \
+    AsyncConnectionPool
+
+
+class Handler(BaseHTTPRequestHandler):
+    protocol_version = 'HTTP/1.1'
+
+    def do_GET(self):
+        if self.path == '/trickle':
+            self.send_response(200)
+            self.send_header('Content-Length', '20')
+            self.end_headers()
+            # every byte arrives well within the socket timeout
+            for _ in range(20):
+                time.sleep(0.1)
+                self.wfile.write(b'x')
+                self.wfile.flush()
+            return
+        if self.path == '/missing':
+            status, body = 404, b'not found'
+        elif self.path in ('/moved', '/loop'):
+            status, body = 301 if self.path == '/moved' else 307, b'moved'
+        elif self.path == '/etag' and \
+                self.headers.get('If-None-Match') == '"v1"':
+            status, body = 304, b''
+        elif self.path == '/empty':
+            status, body = 204, b''
+        else:
+            status, body = 200, self.path.encode('utf-8')
+        self.send_response(status)
+        if status not in (204, 304):
+            self.send_header('Content-Length', str(len(body)))
+        if self.path == '/etag':
+            self.send_header('ETag', '"v1"')
+        if self.path == '/moved':
+            self.send_header('Location', '/a')
+        if self.path == '/loop':
+            self.send_header('Location', '/loop')
+        if self.path == '/close':
+            self.send_header('Connection', 'close')
+        self.end_headers()
+        self.wfile.write(body)
+        if self.path == '/drop':
+            self.close_connection = True
+
+    def log_message(self, *args):
+        pass
+
+
+class Server(ThreadingMixIn, HTTPServer):
+    daemon_threads = True
+
+
+class ServerTestCase(TestCase):
+    def setUp(self):
+        self.server = Server(('127.0.0.1', 0), Handler)
+        thread = threading.Thread(target=self.server.serve_forever)
+        thread.daemon = True
+        thread.start()
+        self.url = 'http://127.0.0.1:%d' % self.server.server_address[1]
+
+    def tearDown(self):
+        self.server.shutdown()
+        self.server.server_close()
+
+
+class TestConnectionPool(ServerTestCase):
+    def setUp(self):
+        super().setUp()
+        self.pool = ConnectionPool(maxsize=2)
+
+    def tearDown(self):
+        self.pool.close()
+        super().tearDown()
+
+    def _get(self, path):
+        with self.pool.request(self.url + path, {}, 5) as response:
+            return response.read()
+
+    def test_reuses_connections(self):
+        self.assertEqual(b'/a', self._get('/a'))
+        self.assertEqual(b'/b?c=d', self._get('/b?c=d'))
+        self.assertEqual(b'/e', self._get('/e'))
+        stats = self.pool.stats()
+        self.assertEqual(1, stats['misses'])
+        self.assertEqual(2, stats['hits'])
+        self.assertEqual(1, stats['idle'])
+
+    def test_does_not_keep_closed_connections(self):
+        self._get('/close')
+        self._get('/a')
+        self.assertEqual(2, self.pool.stats()['misses'])
+
+    def test_raises_http_errors(self):
+        with self.assertRaises(HTTPError) as context:
+            self._get('/missing')
+        self.assertEqual(404, context.exception.code)
+        self._get('/a')
+        self.assertEqual(1, self.pool.stats()['hits'])
+
+    def test_follows_redirects(self):
+        self.assertEqual(b'/a', self._get('/moved'))
+        stats = self.pool.stats()
+        self.assertEqual(1, stats['misses'])
+        self.assertEqual(1, stats['hits'])
+        with self.pool.request(self.url + '/moved', {}, 5, True) as response:
+            self.assertEqual(b'/a', response.read())
+
+    def test_limits_redirects(self):
+        with self.assertRaises(HTTPError) as context:
+            self._get('/loop')
+        self.assertEqual(307, context.exception.code)
+        self.assertEqual(1, self.pool.stats()['idle'])
+
+    def test_evicts_idle_connections(self):
+        self.pool.idle_timeout = 0
+        self._get('/a')
+        time.sleep(0.01)
+        self._get('/b')
+        stats = self.pool.stats()
+        self.assertEqual(2, stats['misses'])
+        self.assertEqual(1, stats['evictions'])
+
+    def test_retries_connections_dropped_by_the_server(self):
+        self._get('/drop')
+        time.sleep(0.05)
+        self.assertEqual(b'/b', self._get('/b'))
+        stats = self.pool.stats()
+        self.assertEqual(1, stats['hits'])
+        self.assertEqual(1, stats['evictions'])
+
+    def test_deadline_limits_whole_request(self):
+        start = time.monotonic()
+        with self.assertRaises(socket.timeout):
+            with self.pool.request(self.url + '/trickle', {}, 0.5,
+                                   True) as response:
+                response.read()
+        self.assertLess(time.monotonic() - start, 1.5)
+        self.assertEqual(0, self.pool.stats()['idle'])
+        with self.pool.request(self.url + '/a', {}, 5, True) as response:
+            self.assertEqual(b'/a', response.read())
+        self.assertEqual(1, self.pool.stats()['idle'])
+
+    def test_bounds_idle_connections(self):
+        responses = [self.pool.request(self.url + '/a', {}, 5)
+                     for _ in range(3)]
+        for response in responses:
+            response.read()
+            response.release()
+        self.assertEqual(2, self.pool.stats()['idle'])
+
+
+class TestAsyncConnectionPool(ServerTestCase):
+    def setUp(self):
+        super().setUp()
+        self.pool = AsyncConnectionPool(maxsize=2)
+        self.loop = asyncio.new_event_loop()
+
+    def tearDown(self):
+        self.loop.run_until_complete(self.pool.close())
+        self.loop.close()
+        super().tearDown()
+
+    def _get(self, *paths):
+        async def requests():
+            return await asyncio.gather(*[
+                self.pool.request(self.url + path, {}, 5) for path in paths
+            ])
+
+        return self.loop.run_until_complete(requests())
+
+    def test_reuses_connections(self):
+        self.assertEqual([b'/a'], self._get('/a'))
+        self.assertEqual([b'/b', b'/c'], self._get('/b', '/c'))
+        self.assertEqual(1, self.pool.hits)
+        self.assertEqual(2, self.pool.misses)
+
+    def test_raises_http_errors(self):
+        with self.assertRaises(HTTPError) as context:
+            self._get('/missing')
+        self.assertEqual(404, context.exception.code)
+
+    def test_follows_redirects(self):
+        self.assertEqual([b'/a'], self._get('/moved'))
+        self.assertEqual(1, self.pool.hits)
+        with self.assertRaises(HTTPError) as context:
+            self._get('/loop')
+        self.assertEqual(307, context.exception.code)
+
+    def test_responses_without_body(self):
+        async def request(path):
+            return await self.pool.request(
+                self.url + path, {'If-None-Match': '"v1"'}, 2)
+
+        start = time.monotonic()
+        self.assertEqual(b'', self.loop.run_until_complete(request('/etag')))
+        self.assertEqual(b'', self.loop.run_until_complete(request('/empty')))
+        self.assertLess(time.monotonic() - start, 1)
+        self.assertEqual(1, self.pool.hits)
@@ -0,0 +1,49 @@
+import socket
+import subprocess
+import threading
+from unittest import TestCase
+
+from nextcloud_news_updater.api.api import FeedUpdateException
+from nextcloud_news_updater.common.deadline import Watchdog, is_timeout
+
+
+class TestIsTimeout(TestCase):
+    def test_timeouts(self):
+        self.assertTrue(is_timeout(socket.timeout()))
+        self.assertTrue(is_timeout(subprocess.TimeoutExpired(['php'], 1)))
+        error = FeedUpdateException('killed')
+        error.__cause__ = subprocess.TimeoutExpired(['php'], 1)
+        self.assertTrue(is_timeout(error))
+
+    def test_other_errors(self):
+        self.assertFalse(is_timeout(None))
+        self.assertFalse(is_timeout(ConnectionResetError()))
+        self.assertFalse(is_timeout(FeedUpdateException('failed')))
+
+
+class TestWatchdog(TestCase):
+    def setUp(self):
+        self.watchdog = Watchdog()
+
+    def test_calls_expired_watches(self):
+        expired = threading.Event()
+        watch = self.watchdog.watch(0.05, expired.set)
+        self.assertTrue(expired.wait(5))
+        self.assertTrue(watch.expired)
+        self.assertFalse(self.watchdog.cancel(watch))
+
+    def test_cancelled_watches_do_not_expire(self):
+        expired = []
+        first = self.watchdog.watch(0.05, lambda: expired.append(1))
+        second = self.watchdog.watch(0.1, lambda: expired.append(2))
+        self.assertTrue(self.watchdog.cancel(first))
+        done = threading.Event()
+        self.watchdog.watch(0.15, done.set)
+        self.assertTrue(done.wait(5))
+        self.assertEqual([2], expired)
+        self.assertTrue(second.expired)
+
+    def test_drops_cancelled_watches(self):
+        for _ in range(100):
+            self.watchdog.cancel(self.watchdog.watch(60, lambda: None))
+        self.assertLess(len(self.watchdog._heap), 2)
@@ -0,0 +1,40 @@
+import json
+from unittest import TestCase
+
+from nextcloud_news_updater.common.jsonstream import JsonStream
+
+
+def split(data: bytes, size: int) -> list:
+    return [data[i:i + size] for i in range(0, len(data), size)]
+
+
+class TestJsonStream(TestCase):
+    def test_items_across_chunks(self):
+        data = json.dumps({
+            'version': 1,
+            'feeds': [{'id': i, 'userId': 'jöhn'} for i in range(10)],
+            'other': [1, 2],
+        }).encode('utf-8')
+        for size in (1, 3, 16, len(data)):
+            items = list(JsonStream(split(data, size)).items('feeds'))
+            self.assertEqual(list(range(10)), [item['id'] for item in items])
+            self.assertEqual('jöhn', items[0]['userId'])
+
+    def test_items_of_list(self):
+        self.assertEqual([123, 4.5],
+                         list(JsonStream([b' [12', b'3, 4.', b'5] ']).items()))
+
+    def test_items_of_empty_documents(self):
+        for data in (b'null', b'{}', b'[]', b'{"feeds": []}'):
+            self.assertEqual([], list(JsonStream([data]).items('feeds')))
+
+    def test_keys(self):
+        data = b'{"john": "John", "deb": {"name": "Deb"}}'
+        self.assertEqual(['john', 'deb'],
+                         list(JsonStream(split(data, 2)).keys()))
+
+    def test_invalid(self):
+        for data in (b'', b'PHP Warning: no', b'[1,,2]', b'[1] x',
+                     b'{"feeds": [1, 2'):
+            with self.assertRaises(ValueError):
+                list(JsonStream([data]).items('feeds'))
@@ -0,0 +1,101 @@
+import io
+import json
+import logging
+from unittest import TestCase
+from unittest.mock import patch
+
+from nextcloud_news_updater.common.logger import InstanceLogger, \
+    JsonFormatter, Lazy, LogWriter, Logger, Sampler, TextFormatter, truncate
+from nextcloud_news_updater.config import Config
+
+
+def create_record(message, *args, level=logging.INFO):
+    return logging.LogRecord('updater', level, __file__, 1, message, args,
+                             None)
+
+
+class Records(logging.Handler):
+    def __init__(self):
+        super().__init__()
+        self.records = []
+
+    def emit(self, record):
+        self.records.append(record)
+
+
+class TestLogger(TestCase):
+    def test_lazy_arguments(self):
+        calls = []
+
+        def join(parts):
+            calls.append(parts)
+            return ' '.join(parts)
+
+        record = create_record('Running %s', Lazy(join, ['php', 'occ']))
+        self.assertEqual([], calls)
+        self.assertEqual('Running php occ', record.getMessage())
+
+    def test_truncate(self):
+        self.assertEqual('abc', truncate('abc', 3))
+        self.assertEqual('ab... (1 more characters)', truncate('abc', 2))
+        self.assertEqual('abc', truncate('abc', 0))
+
+    def test_text_format_truncates(self):
+        record = create_record('Received %s', 'x' * 100)
+        line = TextFormatter(20).format(record)
+        self.assertTrue(line.endswith(
+            'INFO - Received xxxxxxxxxxx... (89 more characters)'))
+
+    def test_json_format(self):
+        record = create_record('Updating feed %d of user %s', 3, 'john')
+        entry = json.loads(JsonFormatter(0).format(record))
+        self.assertEqual('info', entry['level'])
+        self.assertEqual('Updating feed 3 of user john', entry['message'])
+        self.assertEqual('Updating feed %d of user %s', entry['template'])
+
+    def test_sampling_per_template(self):
+        sampler = Sampler(3)
+        passed = [sampler.filter(create_record('Updating %d', i))
+                  for i in range(7)]
+        self.assertEqual([True, False, False, True, False, False, True],
+                         passed)
+        self.assertTrue(sampler.filter(create_record('Received %d', 1)))
+        errors = [create_record('Failed %d', i, level=logging.ERROR)
+                  for i in range(3)]
+        self.assertTrue(all(sampler.filter(record) for record in errors))
+
+    def test_exception_is_logged_with_message(self):
+        config = Config()
+        config.logformat = 'json'
+        output = io.StringIO()
+        with patch('sys.stderr', output):
+            logger = Logger(config)
+            try:
+                raise ValueError('broken feed')
+            except ValueError as e:
+                logger.exception('%s: Trying again in 30 seconds', e)
+            LogWriter.stop_current()
+        lines = output.getvalue().splitlines()
+        self.assertEqual(1, len(lines))
+        entry = json.loads(lines[0])
+        self.assertEqual('broken feed: Trying again in 30 seconds',
+                         entry['message'])
+        self.assertIn('ValueError: broken feed', entry['exception'])
+
+    def test_instance_messages_are_sampled_by_template(self):
+        base = logging.getLogger('test-instance-logger')
+        base.propagate = False
+        base.setLevel(logging.INFO)
+        records = Records()
+        base.addHandler(records)
+        base.addFilter(Sampler(2))
+        parent = Logger.__new__(Logger)
+        parent.logger = base
+        logger = InstanceLogger(parent, '100% cloud')
+        logger.info('Updating %d', 1)
+        logger.info('Received %d', 2)
+        logger.info('Updating %d', 3)
+        logger.info('Done')
+        self.assertEqual(['100% cloud: Updating 1', '100% cloud: Received 2',
+                          '100% cloud: Done'],
+                         [record.getMessage() for record in records.records])
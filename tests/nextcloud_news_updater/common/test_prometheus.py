@@ -0,0 +1,88 @@
+import socket
+from unittest import TestCase, skipUnless
+from urllib.request import urlopen
+
+from nextcloud_news_updater.common.metricsserver import MetricsServer
+from nextcloud_news_updater.common.prometheus import Counter, Gauge, \
+    Histogram, LabeledRegistries, Registry
+
+
+class TestPrometheus(TestCase):
+    def setUp(self):
+        self.registry = Registry()
+
+    def test_counter(self):
+        counter = self.registry.register(
+            Counter('updates_total', 'Updates', ['result']))
+        counter.inc('success')
+        counter.inc('success', amount=2)
+        counter.inc('fail"ure')
+        self.assertEqual(3, counter.value('success'))
+        self.assertEqual('# HELP updates_total Updates\n'
+                         '# TYPE updates_total counter\n'
+                         'updates_total{result="fail\\"ure"} 1\n'
+                         'updates_total{result="success"} 3\n',
+                         self.registry.render())
+
+    def test_labeled_registries(self):
+        registries = {}
+        for name, value in (('small', 1), ('large', 5)):
+            registry = registries[name] = Registry()
+            counter = registry.register(Counter('updates_total', 'Updates',
+                                                ['result']))
+            counter.inc('ok', amount=value)
+        self.assertEqual('# HELP updates_total Updates\n'
+                         '# TYPE updates_total counter\n'
+                         'updates_total{instance="small",result="ok"} 1\n'
+                         'updates_total{instance="large",result="ok"} 5\n',
+                         LabeledRegistries('instance', registries).render())
+
+    def test_gauge_callback(self):
+        self.registry.register(Gauge('depth', 'Depth', callback=lambda: 4))
+        self.assertIn('\ndepth 4\n', self.registry.render())
+
+    def test_histogram(self):
+        histogram = self.registry.register(
+            Histogram('duration_seconds', 'Duration', [0.5, 1]))
+        histogram.observe(0.25)
+        histogram.observe(1)
+        histogram.observe(3)
+        self.assertEqual('# HELP duration_seconds Duration\n'
+                         '# TYPE duration_seconds histogram\n'
+                         'duration_seconds_bucket{le="0.5"} 1\n'
+                         'duration_seconds_bucket{le="1"} 2\n'
+                         'duration_seconds_bucket{le="+Inf"} 3\n'
+                         'duration_seconds_sum 4.25\n'
+                         'duration_seconds_count 3\n',
+                         self.registry.render())
+
+    def test_server(self):
+        self.registry.register(Counter('runs_total', 'Runs')).inc()
+        server = MetricsServer(self.registry, 0)
+        self.assertEqual('127.0.0.1', server.server_address[0])
+        server.start()
+        try:
+            url = 'http://127.0.0.1:%d/metrics' % server.server_address[1]
+            with urlopen(url, timeout=5) as response:
+                body = response.read().decode('utf-8')
+                content_type = response.headers['Content-Type']
+        finally:
+            server.shutdown()
+            server.server_close()
+        self.assertIn('\nruns_total 1\n', body)
+        self.assertTrue(content_type.startswith('text/plain'))
+
+    @skipUnless(socket.has_ipv6, 'IPv6 is not supported')
+    def test_server_ipv6(self):
+        try:
+            server = MetricsServer(self.registry, 0, '::1')
+        except OSError:
+            self.skipTest('IPv6 loopback is not available')
+        server.start()
+        try:
+            url = 'http://[::1]:%d/metrics' % server.server_address[1]
+            with urlopen(url, timeout=5) as response:
+                self.assertEqual(200, response.status)
+        finally:
+            server.shutdown()
+            server.server_close()
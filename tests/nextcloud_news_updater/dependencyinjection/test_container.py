@@ -50,3 +50,11 @@ class TestContainer(TestCase):
         c = self.container.resolve(C)
         self.assertIsInstance(c, C)
         self.assertIsInstance(c.param, A)
+
+    def test_register_qualified_name(self):
+        name = '%s.%s' % (__name__, B.__qualname__)
+        self.container.register(name, lambda c: 'swapped out')
+        self.assertEqual('swapped out', self.container.resolve(B))
+        self.assertEqual('swapped out', self.container.resolve(C).param)
+        self.assertIs(self.container.resolve(name),
+                      self.container.resolve(B))
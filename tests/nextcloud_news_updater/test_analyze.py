@@ -0,0 +1,52 @@
+import io
+import os
+import sqlite3
+import tempfile
+from unittest import TestCase
+
+from nextcloud_news_updater.analyze import HistoryAnalyzer, report
+from nextcloud_news_updater.api.api import Feed, FeedUpdateException
+from nextcloud_news_updater.api.history import RunHistory
+
+
+class TestAnalyze(TestCase):
+    def setUp(self):
+        self.dir = tempfile.TemporaryDirectory()
+        path = os.path.join(self.dir.name, 'history.sqlite')
+        history = RunHistory(path, 'endless')
+        for run in range(3):
+            history.begin_run()
+            for feed_id in range(1, 101):
+                history.record(Feed(feed_id, 'john'), feed_id / 100, None)
+            history.record(Feed(200, 'deb'), 30,
+                           FeedUpdateException('timed out'))
+            history.finish_run(True)
+        history.close()
+        self.connection = sqlite3.connect(path)
+
+    def tearDown(self):
+        self.connection.close()
+        self.dir.cleanup()
+
+    def test_percentiles(self):
+        analyzer = HistoryAnalyzer(self.connection, 20)
+        self.assertEqual({'p50': 0.51, 'p90': 0.91, 'p99': 1.0, 'max': 30},
+                         analyzer.percentiles())
+
+    def test_last_runs(self):
+        analyzer = HistoryAnalyzer(self.connection, 2)
+        self.assertEqual([2, 3], [run[0] for run in analyzer.runs()])
+        self.assertEqual([(200, 'deb', 2, 60.0, 30.0, 30.0)],
+                         analyzer.busiest_feeds(1))
+        self.assertEqual([(200, 'deb', 2, 2, 'FeedUpdateException')],
+                         analyzer.failing_feeds(10))
+        self.assertEqual(['john', 'deb'],
+                         [row[0] for row in analyzer.users(10)])
+
+    def test_report(self):
+        out = io.StringIO()
+        report(HistoryAnalyzer(self.connection, 20), 5, out)
+        output = out.getvalue()
+        self.assertIn('3 runs from ', output)
+        self.assertIn('303 updates of which 3 failed', output)
+        self.assertIn('     3  FeedUpdateException', output)
@@ -39,6 +39,7 @@ class TestConfig(TestCase):
         self.assertEqual(config.apilevel, 'v2')
         self.assertEqual(config.mode, 'singlerun')
         self.assertEqual(config.php, '/usr/local/bin/php7.0')
+        self.assertEqual(config.engine, 'asyncio')
 
     def test_parse_defaults(self):
         config = self.parser.parse_file(find_test_config('empty.ini'))
@@ -52,6 +53,8 @@ class TestConfig(TestCase):
         self.assertEqual(config.password, '')
         self.assertEqual(config.url, None)
         self.assertEqual(config.phpini, None)
+        self.assertEqual(config.engine, 'threads')
+        self.assertEqual(config.metricsaddress, '127.0.0.1')
 
     def test_merge_configs(self):
         config = self.parser.parse_file(find_test_config('full.ini'))
@@ -66,6 +69,34 @@ class TestConfig(TestCase):
         self.assertEqual(config.apilevel, 'v2')
         self.assertEqual(config.mode, 'singlerun')
 
+    def test_merge_configs_zero_retries(self):
+        config = Config()
+        config.retries = 3
+        args = ArgumentParser().parser.parse_args(['--retries', '0'])
+        merge_configs(args, config)
+        self.assertEqual(config.retries, 0)
+
+    def test_merge_configs_shard_index_zero(self):
+        config = Config()
+        config.shardcount = 2
+        config.shardindex = 1
+        args = ArgumentParser().parser.parse_args(['--shard-index', '0'])
+        merge_configs(args, config)
+        self.assertEqual(config.shardcount, 2)
+        self.assertEqual(config.shardindex, 0)
+
+    def test_merge_configs_zero_limits(self):
+        config = Config()
+        config.logmaxlength = 500
+        config.nice = 10
+        config.userlimit = 4
+        args = ArgumentParser().parser.parse_args(
+            ['--logmaxlength', '0', '--nice', '0', '--userlimit', '0'])
+        merge_configs(args, config)
+        self.assertEqual(config.logmaxlength, 0)
+        self.assertEqual(config.nice, 0)
+        self.assertEqual(config.userlimit, 0)
+
     def test_validate_config_empty_url(self):
         config = self.parser.parse_file(find_test_config('empty.ini'))
         validator = ConfigValidator()
@@ -114,6 +145,13 @@ class TestConfig(TestCase):
         result = validator.validate(config)
         self.assertListEqual(['Unknown loglevel: debug'], result)
 
+    def test_validate_invalid_engine(self):
+        config = self.parser.parse_file(find_test_config('full.ini'))
+        config.engine = 'gevent'
+        validator = ConfigValidator()
+        result = validator.validate(config)
+        self.assertListEqual(['Unknown engine: gevent'], result)
+
     def test_validate_invalid_phpini(self):
         config = self.parser.parse_file(find_test_config('full.ini'))
         config.phpini = 'php.ini'
@@ -127,6 +165,21 @@ class TestConfig(TestCase):
         result = validator.validate(config)
         self.assertListEqual([], result)
 
+    def test_parse_instances(self):
+        path = find_test_config('instances.ini')
+        instances = self.parser.parse_instances(path)
+        self.assertEqual(['small', 'large'], list(instances))
+        small, large = instances['small'], instances['large']
+        self.assertEqual('https://small.example.com/nextcloud', small.url)
+        self.assertEqual(1, small.weight)
+        self.assertEqual(60, small.interval)
+        self.assertEqual(3, large.weight)
+        self.assertEqual(300, large.interval)
+        self.assertEqual('singlerun', large.mode)
+        self.assertEqual(20, self.parser.parse_file(path).threads)
+        self.assertEqual({}, self.parser.parse_instances(
+            find_test_config('full.ini')))
+
     @assert_raises(MissingSectionHeaderError)
     def test_load_fails(self):
         self.parser.parse_file(find_test_config('invalid.ini'))
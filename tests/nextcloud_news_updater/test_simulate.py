@@ -0,0 +1,81 @@
+import io
+import os
+import tempfile
+from unittest import TestCase
+
+from nextcloud_news_updater.api.api import Feed
+from nextcloud_news_updater.api.history import RunHistory
+from nextcloud_news_updater.simulate import FeedDurations, generate, \
+    read_history, report, simulate
+
+
+def durations_of(feeds):
+    durations = FeedDurations()
+    for feed_id, (user_id, duration) in enumerate(feeds, 1):
+        durations.add(feed_id, user_id, duration)
+    return durations
+
+
+class TestSimulate(TestCase):
+    def test_makespan_and_utilization(self):
+        durations = durations_of([('john', 1.0)] * 10)
+        result = simulate(durations, durations.replay(), 'fifo', 3)
+        self.assertEqual(4, result.makespan)
+        self.assertAlmostEqual(10 / 12, result.utilization)
+        self.assertAlmostEqual(10 / 3, result.bound)
+        self.assertEqual(3, result.max_wait)
+
+    def test_longest_first(self):
+        durations = durations_of([('john', 1.0)] * 8 + [('john', 8.0)])
+        replay = durations.replay()
+        self.assertEqual(12, simulate(durations, replay, 'fifo',
+                                      2).makespan)
+        self.assertEqual(8, simulate(durations, replay, 'longest',
+                                     2).makespan)
+
+    def test_fair(self):
+        durations = durations_of([('john', 1.0)] * 10 + [('deb', 1.0)] * 2)
+        replay = durations.replay()
+        fifo = simulate(durations, replay, 'fifo', 1)
+        fair = simulate(durations, replay, 'fair', 1)
+        self.assertEqual(10.5, fifo.worst_user_wait)
+        self.assertLess(fair.worst_user_wait, fifo.worst_user_wait)
+        self.assertEqual(fifo.makespan, fair.makespan)
+
+    def test_user_limit(self):
+        durations = durations_of([('john', 1.0)] * 4 + [('deb', 1.0)])
+        result = simulate(durations, durations.replay(), 'fair', 4, 1)
+        self.assertEqual(4, result.makespan)
+
+    def test_generate(self):
+        durations = generate(1000, 10, 'exponential', 2.0, 1.0)
+        self.assertEqual(1000, len(durations.feeds))
+        users = [feed.user_id for feed in durations.feeds]
+        self.assertEqual(10, len(set(users)))
+        self.assertGreater(users.count('user0'), users.count('user9'))
+        self.assertAlmostEqual(2.0, durations.mean_duration(), delta=0.3)
+
+    def test_history(self):
+        with tempfile.TemporaryDirectory() as directory:
+            path = os.path.join(directory, 'history.sqlite')
+            history = RunHistory(path, 'endless')
+            for run in range(3):
+                history.begin_run()
+                for feed_id in range(1, 11):
+                    history.record(Feed(feed_id, 'john'), feed_id + run,
+                                   None)
+                history.finish_run(True)
+            history.close()
+            durations = read_history(path, 2)
+        self.assertEqual(10, len(durations.feeds))
+        self.assertEqual(2.5, durations.predicted_duration(1))
+        self.assertEqual(durations.replay(3), durations.replay(3))
+        self.assertIn(durations.replay()[10], (11, 12))
+
+        out = io.StringIO()
+        results = [simulate(durations, durations.replay(), dispatch, threads)
+                   for dispatch in ('fifo', 'longest') for threads in (1, 5)]
+        report(durations, results, 30, out)
+        self.assertIn('10 feeds of 1 users', out.getvalue())
+        self.assertIn('longest: 5 threads finish a run within 30 seconds',
+                      out.getvalue())